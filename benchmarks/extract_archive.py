@@ -0,0 +1,101 @@
+"""
+Benchmark of the throughput and the peak RSS of the extraction of a lifelog archive, with extractall and a second pass
+over the archive as before and with the single-pass, selective and parallel extract_lifelog_archive as now.
+NOTE: Every extraction runs in its own process so that its peak RSS is its own, and the best of repeat alternated runs
+    is reported as the time is mostly spent writing to disk. The synthetic archive has the images, their thumbnails and
+    other files of a day of a wearable camera, its images do not compress like JPEG files.
+Run from the root of the project: python -m benchmarks.extract_archive [number of dates] [images per date] [KB per image] [repeat]
+"""
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+import zipfile
+from collections import defaultdict
+from itertools import groupby
+from pathlib import Path
+from typing import Dict, List, Tuple, Union
+from internal.transfer.archive import extract_lifelog_archive, is_lifelog_image, DATE_INDEX_IN_NAME
+
+
+def generate_archive(path: Path, dates: int, images: int, image_size: int) -> int:
+    """
+    Write a synthetic lifelog archive and return its number of lifelog images.
+    """
+    block = os.urandom(image_size)
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zip_ref:
+        for day in range(dates):
+            compact_date = f'202001{day + 1:02d}'
+            for i in range(images):
+                name = f'B00000{i:06d}_21I6X0_{compact_date}_{8 + i * 20 // 3600:02d}{i * 20 // 60 % 60:02d}{i * 20 % 60:02d}E.JPG'
+                image = block[i % 256:] + block[:i % 256] # Distinct contents
+                zip_ref.writestr(f'{compact_date}/lifelog/{name}', image)
+                zip_ref.writestr(f'{compact_date}/lifelog/thumbnails/{name}', image[:image_size // 16])
+            zip_ref.writestr(f'{compact_date}/wristband/BVP.csv', '1577836800.0\n64.0\n' + '0.5\n' * 64 * 60 * 60)
+            zip_ref.writestr(f'{compact_date}/notes.txt', 'Not a lifelog image')
+    return dates * images
+
+
+def extract_before(source: Path, destination: Path) -> Dict[str, List[str]]:
+    # handle_upload_file before the change, extractall of every file and then a second pass to find the lifelog images
+    with zipfile.ZipFile(source, 'r') as zip_ref:
+        zip_ref.extractall(destination)
+    file_structure = defaultdict(list)
+    with zipfile.ZipFile(source, 'r') as zip_ref:
+        names = sorted([name for name in zip_ref.namelist() if is_lifelog_image(name)])
+        for k, v in groupby(names, key = lambda name: name.split('/')[DATE_INDEX_IN_NAME]):
+            file_structure[k] += list(v)
+    return file_structure
+
+
+def extract_after(source: Path, destination: Path) -> Dict[str, List[str]]:
+    return extract_lifelog_archive(source, destination).file_structure
+
+
+def get_peak_rss() -> Union[int, None]:
+    # Bytes, None where the resource module is not available (Windows)
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak_rss if sys.platform == 'darwin' else peak_rss * 1024
+
+
+def measure(name: str, source: Path) -> Tuple[float, int, Union[int, None]]:
+    # Runs in a new process, returns the seconds, the extracted images and the peak RSS of the extraction
+    extract = {'before': extract_before, 'after': extract_after}[name]
+    with tempfile.TemporaryDirectory() as destination:
+        start = time.perf_counter()
+        file_structure = extract(source, Path(destination))
+        seconds = time.perf_counter() - start
+    return seconds, sum(len(moment_list) for moment_list in file_structure.values()), get_peak_rss()
+
+
+def main(dates: int = 5, images: int = 2000, image_kb: int = 100, repeat: int = 3) -> None:
+    with tempfile.TemporaryDirectory() as folder:
+        source = Path(folder) / 'lifelog.zip'
+        image_count = generate_archive(source, dates, images, image_kb * 1024)
+        archive_size = source.stat().st_size
+        image_bytes = image_count * image_kb * 1024
+        print(f'{dates} dates of {images} images of {image_kb} KB, archive of {archive_size / 1024 / 1024:.0f} MB')
+
+        context = multiprocessing.get_context('spawn')
+        results = defaultdict(list)
+        for _ in range(repeat):
+            for name in ['before', 'after']:
+                with context.Pool(1) as pool:
+                    seconds, extracted, peak_rss = pool.apply(measure, (name, source))
+                assert extracted == image_count
+                results[name].append((seconds, peak_rss))
+        for name, runs in results.items():
+            seconds = min(seconds for seconds, _ in runs)
+            peak_rss = runs[0][1]
+            peak = f'{max(peak for _, peak in runs) / 1024 / 1024:.0f} MB' if peak_rss is not None else 'n/a'
+            print(f'{name:>7}: {seconds:6.2f} s, {image_bytes / 1024 / 1024 / seconds:6.0f} MB/s of images, '
+                  f'{image_count / seconds:6.0f} images/s, peak RSS {peak}')
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:5]])
@@ -0,0 +1,91 @@
+"""
+Benchmark of the moments inserted per second by insert_data_to_db, with one insert_one per moment as before and with
+batched, unordered bulk upserts of the dates in parallel as now, and of inserting the same archive again.
+NOTE: Writes to the stress_lifelog_benchmark database of the MongoDB server at MONGODB_URL and drops it afterwards.
+Run from the root of the project: python -m benchmarks.insert_moments [number of dates] [moments per date]
+"""
+import asyncio
+import sys
+import time
+from datetime import date, timedelta
+from typing import Dict, List
+import sentry_sdk
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import PyMongoError
+from constants.external_servers import MONGODB_URL
+from schemas.db_schemas import MomentDetailId, MomentMetadata
+from internal.db import moment_annotation_crud, moment_detail_annotation_crud, user_annotation_crud
+from internal.db.moment_annotation_crud import append_moments, create_moments_indexes
+from internal.db.moment_detail_annotation_crud import insert_moment_detail, create_moment_detail_indexes
+from internal.transfer.archive import parse_moment_times
+from internal.transfer.upload import get_default_moment_metadata, insert_data_to_db
+
+
+BENCHMARK_DATABASE = 'stress_lifelog_benchmark'
+USER_ID = 'benchmark'
+
+
+def generate_file_structure(dates: int, moments: int) -> Dict[str, List[str]]:
+    # One image every 20 seconds from 08:00, as a wearable camera takes them
+    file_structure = {}
+    for day in range(dates):
+        _date = (date(2020, 1, 1) + timedelta(days = day)).isoformat()
+        compact_date = _date.replace('-', '')
+        file_structure[_date] = [
+            f'{compact_date}/B00000{i:06d}_21I6X0_{compact_date}_{8 + i * 20 // 3600:02d}{i * 20 // 60 % 60:02d}{i * 20 % 60:02d}E.JPG'
+            for i in range(moments)
+        ]
+    return file_structure
+
+
+async def insert_data_to_db_before(user_id: str, file_structure: Dict[str, List[str]]) -> None:
+    # insert_data_to_db before the change, the dates one after the other and one insert_one per moment
+    for _date, moment_list in file_structure.items():
+        moment_times = parse_moment_times(moment_list)
+        _ = await append_moments({'user_id': user_id, 'moment_date': _date}, moment_times.moments)
+        for _moment, local_time in zip(moment_times.moments, moment_times.local_times):
+            moment_id = MomentDetailId(user_id = user_id, moment_date = _date, local_time = local_time)
+            moment_detail = MomentMetadata(**{**get_default_moment_metadata(), 'utc_time': local_time,
+                                              'image_path': _moment, 'other_image_path': _moment})
+            _ = await insert_moment_detail(moment_id, moment_detail)
+
+
+async def run(dates: int, moments: int) -> None:
+    sentry_sdk.init(dsn = None) # Inserting again before the change fails on every moment, which is not reported to the server project
+    client = AsyncIOMotorClient(MONGODB_URL, serverSelectionTimeoutMS = 2000)
+    try:
+        await client.admin.command('ping')
+    except PyMongoError:
+        print(f'No MongoDB server at {MONGODB_URL}')
+        return
+    database = client[BENCHMARK_DATABASE]
+    moment_annotation_crud.db = moment_detail_annotation_crud.db = user_annotation_crud.db = database
+
+    file_structure = generate_file_structure(dates, moments)
+    count = dates * moments
+    try:
+        for name, insert in [
+            ('before', insert_data_to_db_before),
+            ('after', lambda user_id, file_structure: insert_data_to_db(user_id, file_structure)),
+        ]:
+            await client.drop_database(BENCHMARK_DATABASE)
+            await create_moments_indexes()
+            await create_moment_detail_indexes()
+            for run_name in [name, f'{name}, again']:
+                start = time.perf_counter()
+                await insert(USER_ID, file_structure)
+                seconds = time.perf_counter() - start
+                stored = await database['moment_detail'].count_documents({})
+                print(f'{run_name:>13}: {count / seconds:8.0f} moments/s, {seconds:6.2f} s, {stored} moment details stored')
+    finally:
+        await client.drop_database(BENCHMARK_DATABASE)
+        client.close()
+
+
+def main(dates: int = 10, moments: int = 2000) -> None:
+    print(f'{dates} dates of {moments} moments')
+    asyncio.run(run(dates, moments))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:3]])
@@ -0,0 +1,50 @@
+"""
+Benchmark of the latency of the annotation reads while 50 logins are verified at once, with the password verification
+on the event loop as before and on the hashing pool as now.
+Run from the root of the project: python -m benchmarks.login_storm [number of logins]
+"""
+import asyncio
+import sys
+import time
+from constants.security_settings import PASSWORD_HASH_ALGORITHM
+from internal.security.hash_generator import get_crypt_context
+from internal.security.hashing_pool import hashing_pool
+from benchmarks.loop_latency import measure_read_latency, format_latencies
+
+
+PASSWORD = 'correct horse battery staple'
+
+
+async def login_before(hashed_password: str) -> bool:
+    # Authenticator.authenticate before the change, the CryptContext verification runs on the event loop
+    return get_crypt_context(PASSWORD_HASH_ALGORITHM).verify(PASSWORD, hashed_password)
+
+
+async def login_after(hashed_password: str) -> bool:
+    return await hashing_pool.verify(PASSWORD_HASH_ALGORITHM, PASSWORD, hashed_password)
+
+
+async def run(count: int) -> None:
+    hashed_password = get_crypt_context(PASSWORD_HASH_ALGORITHM).hash(PASSWORD)
+    await login_after(hashed_password) # Start the worker processes of the pool
+
+    async def idle() -> None:
+        await asyncio.sleep(1)
+    print(f'{"idle":>7}: {format_latencies(await measure_read_latency(idle))}')
+
+    for name, login in [('before', login_before), ('after', login_after)]:
+        async def login_storm() -> None:
+            start = time.perf_counter()
+            assert all(await asyncio.gather(*[login(hashed_password) for _ in range(count)]))
+            print(f'{name:>7}: {count} logins in {time.perf_counter() - start:.2f} s')
+        print(f'{name:>7}: {format_latencies(await measure_read_latency(login_storm))}')
+    hashing_pool.shutdown()
+
+
+def main(count: int = 50) -> None:
+    print(f'{count} {PASSWORD_HASH_ALGORITHM} logins in flight, {hashing_pool.max_workers} hashing processes')
+    asyncio.run(run(count))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,38 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, List
+
+
+MONGO_READ_SECONDS = 0.002 # Round trip of an annotation read, e.g. the find_one of a moment detail
+READ_INTERVAL_SECONDS = 0.01
+
+
+async def measure_read_latency(work: Callable[[], Awaitable]) -> List[float]:
+    """
+    Run work() while an annotation read, simulated with a sleep, arrives every READ_INTERVAL_SECONDS.
+    NOTE: Returns the latencies of the reads in seconds, from their arrival. A read takes longer than
+        MONGO_READ_SECONDS only when the event loop is blocked, whether it was blocked before or during the read.
+    """
+    latencies = []
+    done = asyncio.Event()
+
+    async def read_annotations() -> None:
+        while not done.is_set():
+            arrival = time.perf_counter() + READ_INTERVAL_SECONDS
+            await asyncio.sleep(READ_INTERVAL_SECONDS)
+            await asyncio.sleep(MONGO_READ_SECONDS)
+            latencies.append(time.perf_counter() - arrival)
+
+    reader = asyncio.create_task(read_annotations())
+    try:
+        await work()
+    finally:
+        done.set()
+        await reader
+    return latencies
+
+
+def format_latencies(latencies: List[float]) -> str:
+    latencies = sorted(latencies)
+    p50, p95 = latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.95)]
+    return f'p50 {p50 * 1000:7.1f} ms, p95 {p95 * 1000:7.1f} ms, max {latencies[-1] * 1000:7.1f} ms over {len(latencies)} reads'
@@ -0,0 +1,64 @@
+"""
+Benchmark of the per-moment statistics of the E4 signals of a day, with a loop over the moments and with the vectorised
+windows of compute_window_statistics, on a full day of 64 Hz BVP against ~2,000 moments. all signals is the
+PhysiologicalData of every moment from the four signals, as computed at ingestion.
+Run from the root of the project: python -m benchmarks.moment_signal_statistics [number of moments]
+"""
+import sys
+import timeit
+import numpy as np
+from internal.signals.e4 import Signal
+from internal.signals.store import get_local_day_bounds
+from internal.signals.windows import compute_window_statistics, compute_moment_physiological_data, get_moment_timestamps
+from constants.signal_configuration import MOMENT_SIGNAL_WINDOW_BEFORE_SECONDS, MOMENT_SIGNAL_WINDOW_AFTER_SECONDS
+
+
+DATE = '2020-01-01'
+SAMPLING_RATES = {'heart_rate': 1, 'bvp': 64, 'eda': 4, 'temp': 4}
+
+
+def generate_signals() -> dict:
+    # A full day of every signal, a random walk at the sampling rate of the wristband
+    start, end = get_local_day_bounds(DATE)
+    random = np.random.default_rng(0)
+    signals = {}
+    for field, rate in SAMPLING_RATES.items():
+        timestamps = np.arange(start, end, 1 / rate)
+        signals[field] = Signal(timestamps, np.cumsum(random.normal(size = len(timestamps))))
+    return signals
+
+
+def compute_window_statistics_per_moment(signal: Signal, centres: np.ndarray) -> np.ndarray:
+    # One window at a time, the samples of every moment found with a binary search
+    statistics = np.zeros((len(centres), 4))
+    for i, centre in enumerate(centres):
+        start, end = np.searchsorted(signal.timestamps, [centre - MOMENT_SIGNAL_WINDOW_BEFORE_SECONDS,
+                                                         centre + MOMENT_SIGNAL_WINDOW_AFTER_SECONDS], side = 'left')
+        window = signal.values[start:end]
+        if len(window):
+            statistics[i] = window.min(), window.max(), window.mean(), window.std()
+    return statistics
+
+
+def main(moments: int = 2000, repeat: int = 5) -> None:
+    signals = generate_signals()
+    # One moment every 20 seconds from 08:00, as a wearable camera takes them, closer together when they do not fit the day
+    step = min(20, 16 * 60 * 60 // moments)
+    local_times = [f'{8 + i * step // 3600:02d}:{i * step // 60 % 60:02d}:{i * step % 60:02d}' for i in range(moments)]
+    centres = get_moment_timestamps(DATE, local_times)
+    bvp = signals['bvp']
+    print(f'{len(bvp.values)} BVP samples at 64 Hz, {moments} moments')
+
+    assert np.allclose(compute_window_statistics_per_moment(bvp, centres), compute_window_statistics(bvp, centres)[0])
+    assert all(data is not None for data in compute_moment_physiological_data(signals, DATE, local_times))
+    for name, function in [
+        ('per moment', lambda: compute_window_statistics_per_moment(bvp, centres)),
+        ('vectorised', lambda: compute_window_statistics(bvp, centres)),
+        ('all signals', lambda: compute_moment_physiological_data(signals, DATE, local_times)),
+    ]:
+        seconds = min(timeit.repeat(function, number = 1, repeat = repeat))
+        print(f'{name:>12}: {seconds:.3f} s')
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,42 @@
+"""
+Micro-benchmark of the parsing of the moment timestamps of a date.
+Run from the root of the project: python -m benchmarks.parse_moment_times [number of names]
+"""
+import random
+import sys
+import timeit
+from datetime import datetime
+from typing import List
+from internal.transfer.archive import parse_moment_times
+
+
+def get_moment_local_time(moment: str) -> str:
+    # The parser used before parse_moment_times, one split and strptime per name
+    moment_name = '_'.join(moment.split('_')[-2:])
+    date_time = datetime.strptime(moment_name[:15], '%Y%m%d_%H%M%S')
+    return datetime.strftime(date_time, '%H:%M:%S')
+
+
+def parse_moment_times_per_name(moment_list: List[str]) -> List[str]:
+    moments = sorted(moment_list, key = lambda moment: moment.split('_')[-1])
+    return [get_moment_local_time(moment) for moment in moments]
+
+
+def generate_moment_list(count: int) -> List[str]:
+    random.seed(0)
+    return [
+        f'20200101/lifelog/B00000{i:06d}_21I6X0_20200101_{random.randrange(24):02d}{random.randrange(60):02d}{random.randrange(60):02d}E.JPG'
+        for i in range(count)
+    ]
+
+
+def main(count: int = 100000, repeat: int = 5) -> None:
+    moment_list = generate_moment_list(count)
+    assert parse_moment_times(moment_list).local_times == parse_moment_times_per_name(moment_list)
+    for name, function in [('per name', parse_moment_times_per_name), ('batch', parse_moment_times)]:
+        seconds = min(timeit.repeat(lambda: function(moment_list), number = 1, repeat = repeat))
+        print(f'{name:>8}: {seconds:.3f} s for {count} names')
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
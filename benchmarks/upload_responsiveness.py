@@ -0,0 +1,92 @@
+"""
+Benchmark of the latency of the annotation reads while a large lifelog archive is uploaded, with the upload copied to
+disk on the event loop as before and streamed to disk in chunks as now. The upload is received as a multipart request,
+at the speed the server can take it.
+Run from the root of the project: python -m benchmarks.upload_responsiveness [size of the upload in MB]
+"""
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+from starlette.requests import Request
+from internal.transfer.upload import receive_upload_form_file, save_upload_file_tmp
+from benchmarks.loop_latency import measure_read_latency, format_latencies
+
+
+BOUNDARY = 'lifelogbenchmarkboundary'
+RECEIVE_SIZE = 64 * 1024 # Body bytes of a message of the ASGI server
+BLOCK = os.urandom(1024 * 1024)
+
+
+def get_upload_request(size: int) -> Request:
+    """
+    Build the request of a multipart upload of size bytes, whose body is received message by message.
+    """
+    header = (f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="file"; filename="lifelog.zip"\r\n'
+              f'Content-Type: application/zip\r\n\r\n').encode()
+    trailer = f'\r\n--{BOUNDARY}--\r\n'.encode()
+
+    def generate_body():
+        yield header
+        for offset in range(0, size, RECEIVE_SIZE):
+            start = offset % len(BLOCK)
+            yield BLOCK[start:start + min(RECEIVE_SIZE, size - offset)]
+        yield trailer
+
+    body = generate_body()
+    async def receive() -> dict:
+        chunk = next(body, None)
+        return {'type': 'http.request', 'body': chunk or b'', 'more_body': chunk is not None}
+
+    scope = {
+        'type': 'http',
+        'method': 'POST',
+        'path': '/annotation/data/upload',
+        'headers': [
+            (b'content-type', f'multipart/form-data; boundary={BOUNDARY}'.encode()),
+            (b'content-length', str(len(header) + size + len(trailer)).encode()),
+        ],
+    }
+    return Request(scope, receive)
+
+
+async def upload_before(request: Request, directory: str) -> Path:
+    # The upload route before the change, the spooled form file is copied to disk by save_upload_file_tmp on the event loop
+    form = await request.form()
+    upload_file = form['file']
+    with tempfile.NamedTemporaryFile(delete = False, suffix = '.zip', dir = directory) as tmp:
+        shutil.copyfileobj(upload_file.file, tmp)
+    await form.close()
+    return Path(tmp.name)
+
+
+async def upload_after(request: Request, directory: str) -> Path:
+    upload_file = await receive_upload_form_file(request)
+    return (await save_upload_file_tmp(upload_file, directory = directory)).path
+
+
+async def run(size: int) -> None:
+    async def idle() -> None:
+        await asyncio.sleep(1)
+    print(f'{"idle":>7}: {format_latencies(await measure_read_latency(idle))}')
+
+    for name, upload in [('before', upload_before), ('after', upload_after)]:
+        with tempfile.TemporaryDirectory() as directory:
+            async def receive_upload() -> None:
+                start = time.perf_counter()
+                path = await upload(get_upload_request(size), directory)
+                seconds = time.perf_counter() - start
+                assert path.stat().st_size == size
+                print(f'{name:>7}: {size / 1024 / 1024:.0f} MB received in {seconds:.2f} s, {size / 1024 / 1024 / seconds:.0f} MB/s')
+            print(f'{name:>7}: {format_latencies(await measure_read_latency(receive_upload))}')
+
+
+def main(size_mb: int = 5 * 1024) -> None:
+    asyncio.run(run(size_mb * 1024 * 1024))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,109 @@
+"""
+Benchmark of the requests per second of /annotation/moments/get_moment_detail with the token verification before and
+after it was moved off the event loop. A request is its token verification followed by the find_one of the moment
+detail, simulated with a sleep so that only the verification differs.
+Run from the root of the project: python -m benchmarks.verify_token [number of requests] [concurrency]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from typing import Awaitable, Callable, List
+from jose import jwt
+from sqlalchemy import create_engine, event
+from sqlalchemy.pool import QueuePool
+import connectors
+import dependencies
+from constants.external_servers import SQLALCHEMY_POOL_SIZE, SQLALCHEMY_MAX_OVERFLOW
+from constants.security_settings import SECRET_KEY, TOKEN_HASH_ALGORITHM, PASSWORD_HASH_ALGORITHM
+from internal.security.authenticator import Authenticator
+from internal.security.session_cache import SessionCache
+from sql_app.schemas import Base, User, UserInDB, ExpirationTime
+
+
+MONGO_READ_SECONDS = 0.002 # Round trip of the find_one of the moment detail
+USERS = 100
+
+
+def create_database(path: str) -> List[str]:
+    """
+    Bind the SQL sessions of the server to a new database of USERS users and return an access token of each user.
+    """
+    engine = create_engine(
+        f'sqlite:///{path}', connect_args = { 'check_same_thread': False }, poolclass = QueuePool,
+        pool_size = SQLALCHEMY_POOL_SIZE, max_overflow = SQLALCHEMY_MAX_OVERFLOW,
+    )
+    event.listen(engine, 'connect', connectors.set_sqlite_pragmas)
+    Base.metadata.create_all(engine)
+    connectors.sqlalchemy_session.configure(bind = engine)
+    if connectors.async_sqlalchemy_session is not None:
+        from sqlalchemy.ext.asyncio import create_async_engine
+        connectors.async_sqlalchemy_session.configure(bind = create_async_engine(f'sqlite+aiosqlite:///{path}'))
+
+    iat = int(time.time())
+    usernames = [f'user{i}' for i in range(USERS)]
+    with connectors.sqlalchemy_session() as db:
+        for username in usernames:
+            db.add(UserInDB(username = username, hashed_password = ''))
+            db.add(User(username = username, name = username))
+            db.add(ExpirationTime(username = username, iat = iat, exp = iat + 60 * 60))
+        db.commit()
+    return [
+        jwt.encode({"username": username, "iat": iat, "exp": iat + 60 * 60, "token_type": "access"}, SECRET_KEY,
+                   algorithm = TOKEN_HASH_ALGORITHM)
+        for username in usernames
+    ]
+
+
+async def verify_token_before(token: str) -> str:
+    # verify_token before the change, two synchronous queries on the event loop
+    payload = dependencies.token_decoder.decode(token)
+    username = payload["username"]
+    assert dependencies.authenticator.verify_user(username)
+    assert dependencies.authenticator.verify_user_time_info(username, payload["iat"])
+    return username
+
+
+uncached_authenticator = Authenticator(PASSWORD_HASH_ALGORITHM, session_cache = SessionCache(max_size = 0))
+
+
+async def verify_token_uncached(token: str) -> str:
+    # verify_token with every session read from the database, one joined query off the event loop
+    payload = dependencies.token_decoder.decode(token)
+    assert await uncached_authenticator.verify_user_session(payload["username"], payload["iat"])
+    return payload["username"]
+
+
+async def measure(verify: Callable[[str], Awaitable[str]], tokens: List[str], count: int, concurrency: int) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def get_moment_detail(token: str) -> None:
+        async with semaphore:
+            await verify(token)
+            await asyncio.sleep(MONGO_READ_SECONDS)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[get_moment_detail(tokens[i % len(tokens)]) for i in range(count)])
+    return count / (time.perf_counter() - start)
+
+
+async def run(count: int, concurrency: int) -> None:
+    with tempfile.TemporaryDirectory() as folder:
+        tokens = create_database(os.path.join(folder, 'benchmark.sqlite'))
+        for name, verify in [
+            ('before', verify_token_before),
+            ('after, no session cache', verify_token_uncached),
+            ('after', dependencies.verify_token),
+        ]:
+            requests_per_second = await measure(verify, tokens, count, concurrency)
+            print(f'{name:>24}: {requests_per_second:8.0f} requests/s')
+
+
+def main(count: int = 5000, concurrency: int = 100) -> None:
+    print(f'{count} requests, {concurrency} at a time, {MONGO_READ_SECONDS * 1000:.0f} ms per Mongo read')
+    asyncio.run(run(count, concurrency))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:3]])
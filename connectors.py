@@ -1,10 +1,12 @@
+import importlib.util
 import motor.motor_asyncio
 from constants.external_servers import *
 from sentry_sdk.integrations.fastapi import FastApiIntegration
 from sentry_sdk.integrations.starlette import StarletteIntegration
 import sentry_sdk
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy import create_engine
+from sqlalchemy.pool import QueuePool
+from sqlalchemy import create_engine, event
 
 
 
@@ -25,14 +27,54 @@ sentry_sdk.init(
     traces_sample_rate=1.0
 )
 
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for pragma in SQLITE_PRAGMAS:
+        cursor.execute(f'PRAGMA {pragma}')
+    cursor.close()
+
+
 # Configure SQLAlchemy for database access
 sqlalchemy_engine = create_engine(
     SQLALCHEMY_DATABASE_URL, 
-    connect_args = { 'check_same_thread': False }
+    connect_args = { 'check_same_thread': False, 'timeout': SQLITE_BUSY_TIMEOUT_SECONDS },
+    poolclass = QueuePool,
+    pool_size = SQLALCHEMY_POOL_SIZE,
+    max_overflow = SQLALCHEMY_MAX_OVERFLOW,
+    pool_timeout = SQLALCHEMY_POOL_TIMEOUT,
+    pool_pre_ping = True,
 )
+event.listen(sqlalchemy_engine, 'connect', set_sqlite_pragmas)
 
 sqlalchemy_session = sessionmaker(
     autocommit = False,
     autoflush = False,
     bind = sqlalchemy_engine
-)
\ No newline at end of file
+)
+
+
+# Configure the async SQLAlchemy engine for the authentication paths if aiosqlite is available
+if importlib.util.find_spec('aiosqlite') is not None:
+    from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+    from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+    async_sqlalchemy_engine = create_async_engine(
+        SQLALCHEMY_ASYNC_DATABASE_URL,
+        connect_args = { 'timeout': SQLITE_BUSY_TIMEOUT_SECONDS },
+        poolclass = AsyncAdaptedQueuePool,
+        pool_size = SQLALCHEMY_POOL_SIZE,
+        max_overflow = SQLALCHEMY_MAX_OVERFLOW,
+        pool_timeout = SQLALCHEMY_POOL_TIMEOUT,
+    )
+    event.listen(async_sqlalchemy_engine.sync_engine, 'connect', set_sqlite_pragmas)
+
+    async_sqlalchemy_session = sessionmaker(
+        async_sqlalchemy_engine,
+        class_ = AsyncSession,
+        autoflush = False,
+        expire_on_commit = False,
+    )
+else:
+    async_sqlalchemy_engine = None
+    async_sqlalchemy_session = None
@@ -0,0 +1,19 @@
+# Moment detail range queries
+MOMENT_DETAIL_PAGE_SIZE = 500 # Moment details streamed per page when the client does not ask for a number
+MOMENT_DETAIL_MAX_PAGE_SIZE = 5000
+
+# Moment detail multi-get
+MOMENT_DETAIL_MAX_BATCH_IDS = 5000
+
+# Bulk annotation
+ANNOTATION_FIELDS = ['location', 'stress_level', 'activity'] # Fields set in bulk, their values are kept in <field>_list of the annotation data
+
+# Write-behind of the moment detail updates
+MOMENT_DETAIL_WRITE_BEHIND = False # Coalesce the field updates of a moment and write them in batches instead of one by one
+MOMENT_DETAIL_WRITE_BEHIND_WINDOW_SECONDS = 0.05 # Updates wait at most this long before they are written
+MOMENT_DETAIL_WRITE_BEHIND_MAX_SIZE = 1000 # Moments with pending updates before they are written without waiting
+MOMENT_DETAIL_WRITE_BEHIND_LATENCY_SAMPLES = 1000 # Latest flushes whose latency is kept for the stats
+MOMENT_DETAIL_WRITE_BEHIND_RETRY_SECONDS = 0.5 # Wait before retrying a failed flush, doubled on every failure in a row
+MOMENT_DETAIL_WRITE_BEHIND_MAX_RETRY_SECONDS = 30
+MOMENT_DETAIL_WRITE_BEHIND_RETRY_TIMEOUT_SECONDS = 15 * 60 # Failed writes are retried this long, then reported to Sentry with their fields
+MOMENT_DETAIL_WRITE_BEHIND_CLOSE_TIMEOUT_SECONDS = 10 # Longest retry of the failed writes on shutdown
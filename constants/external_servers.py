@@ -1,4 +1,17 @@
 MONGODB_URL = 'mongodb://localhost:27017'
 SENTRY_DSN = 'https://c3eddfc889cf473cb36ed1fd3dc31543@o1375725.ingest.sentry.io/6684407'
 SQLALCHEMY_DATABASE_URL = 'sqlite:///./db.sqlite'
-DATA_STORAGE_URL = 'D:/PhD/ExperimentProtocol2/DATA/DCU_NVT_EXP2'
\ No newline at end of file
+DATA_STORAGE_URL = 'D:/PhD/ExperimentProtocol2/DATA/DCU_NVT_EXP2'
+
+# SQLAlchemy engine configuration
+SQLALCHEMY_ASYNC_DATABASE_URL = 'sqlite+aiosqlite:///./db.sqlite' # Only used if aiosqlite is installed
+SQLALCHEMY_POOL_SIZE = 10
+SQLALCHEMY_MAX_OVERFLOW = 20
+SQLALCHEMY_POOL_TIMEOUT = 30 # Seconds to wait for a free connection
+SQLITE_BUSY_TIMEOUT_SECONDS = 15
+SQLITE_PRAGMAS = [
+    'journal_mode=WAL', # Readers do not block the writer and vice versa
+    'synchronous=NORMAL', # Safe with WAL and avoids an fsync per commit
+    'cache_size=-16000', # 16 MB page cache per connection
+    'temp_store=MEMORY',
+]
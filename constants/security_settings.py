@@ -2,4 +2,10 @@ import os
 
 secret_path = os.path.abspath('secret.txt')
 data = [line.rstrip() for line in open(secret_path).readlines()]
-SECRET_KEY, TOKEN_HASH_ALGORITHM, PASSWORD_HASH_ALGORITHM = data
\ No newline at end of file
+SECRET_KEY, TOKEN_HASH_ALGORITHM, PASSWORD_HASH_ALGORITHM = data
+
+PASSWORD_HASH_POOL_WORKERS = 2 # Number of processes used for hashing and verifying passwords
+PASSWORD_HASH_POOL_MAX_PENDING = 64 # Maximum number of hashing jobs waiting for the pool before rejecting new ones
+PASSWORD_HASH_LIST_MAX_SIZE = 1000 # Maximum number of passwords hashed for one request, e.g. users created in bulk
+USER_CSV_MAX_LINE_BYTES = 512 # Maximum mean size of a row of a CSV file of users, its header included
+PASSWORD_HASH_LIST_CHUNK_SIZE = 4 # Passwords hashed per job of a list, so that a login only waits for one small job
@@ -0,0 +1,32 @@
+# Empatica E4 wristband files found in an uploaded archive -> physiological field of a moment
+E4_SIGNAL_FILES = {
+    'HR.csv': 'heart_rate',
+    'BVP.csv': 'bvp', # Blood Volume Pulse, 64 Hz
+    'EDA.csv': 'eda', # Electrodermal Activity, 4 Hz
+    'TEMP.csv': 'temp', # Skin Temperature, 4 Hz
+}
+E4_IBI_FILE = 'IBI.csv' # Inter-beat intervals, stored as the ibi signal for the features but not summarised on the moments
+E4_IBI_FIELD = 'ibi'
+
+# Window of signal samples summarised for a moment, around the time of the image
+MOMENT_SIGNAL_WINDOW_BEFORE_SECONDS = 30
+MOMENT_SIGNAL_WINDOW_AFTER_SECONDS = 30
+
+# The camera stores local times while the wristband stores UTC timestamps
+LIFELOG_UTC_OFFSET_MINUTES = 0
+
+# Raw signal store, one <signal>.npy of (timestamp, value) rows per user and local date
+SIGNAL_STORAGE_FOLDER = '_signals' # In the folder of the user
+SIGNAL_DEFAULT_POINTS = 1000 # Points returned for a chart window when the client does not ask for a number
+SIGNAL_MAX_POINTS = 10000
+SIGNAL_MAX_WINDOW_SECONDS = 7 * 24 * 60 * 60 # Longest window of a signal which can be requested at once
+SIGNAL_REPLACE_ATTEMPTS = 6 # Tries to replace a stored day while readers have it open, waiting twice as long every time
+SIGNAL_REPLACE_RETRY_SECONDS = 0.05
+
+# Feature extraction over the stored signals
+FEATURE_WORKERS = 2 # Processes computing the features of the user-days
+FEATURE_WINDOW_BEFORE_SECONDS = 150 # Short-term HRV is defined over 5 minutes
+FEATURE_WINDOW_AFTER_SECONDS = 150
+EDA_TONIC_CUTOFF_HZ = 0.05 # The tonic EDA is the signal low-passed below this frequency
+EDA_SCR_MIN_AMPLITUDE = 0.01 # Microsiemens of phasic EDA for a peak to count as a skin conductance response
+SIGNAL_MAX_GAP_SECONDS = 1 # Signals are filtered separately on both sides of a longer gap
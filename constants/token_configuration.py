@@ -1 +1,4 @@
 ACCESS_TOKEN_EXPIRE_MINUTES = 360
+REFRESH_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7
+SESSION_CACHE_MAX_SIZE = 10000
+SESSION_CACHE_TTL_SECONDS = 60
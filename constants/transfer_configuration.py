@@ -0,0 +1,42 @@
+from constants.external_servers import DATA_STORAGE_URL
+
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024 # Bytes read from an upload and written to disk at a time
+UPLOAD_MAX_SIZE = 10 * 1024 * 1024 * 1024 # Uploads larger than this are aborted
+UPLOAD_FORM_OVERHEAD = 64 * 1024 # Bytes of multipart headers and boundaries accepted on top of UPLOAD_MAX_SIZE
+UPLOAD_STAGING_URL = f'{DATA_STORAGE_URL}/_staging' # Uploads wait here for ingestion, must be shared by all worker nodes
+
+# Ingestion job queue
+INGESTION_WORKER_PROCESSES = 1 # Worker processes started with the API, set to 0 to only use standalone workers
+INGESTION_POLL_INTERVAL_SECONDS = 2
+INGESTION_JOB_LEASE_SECONDS = 300 # A running job whose lease is not renewed in time is picked up by another worker
+INGESTION_JOB_MAX_ATTEMPTS = 3
+
+# Moment ingestion
+MOMENT_DETAIL_BATCH_SIZE = 1000 # Moment details sent to MongoDB per bulk_write
+INGESTION_DATE_CONCURRENCY = 4 # Dates of an archive inserted to MongoDB at the same time
+UNPARSEABLE_MOMENTS_REPORTED = 100 # Names of the images without a valid timestamp kept in the progress of a job
+
+# Archive extraction
+ARCHIVE_EXTRACTION_WORKERS = 8 # Threads extracting the members of an archive in parallel
+ARCHIVE_MAX_EXTRACTED_SIZE = 50 * 1024 * 1024 * 1024 # Archives declaring more uncompressed bytes than this are rejected
+ARCHIVE_MAX_COMPRESSION_RATIO = 100 # Members declaring a higher uncompressed/compressed ratio are rejected
+
+# Resumable uploads
+RESUMABLE_UPLOAD_MAX_CHUNK_SIZE = 64 * 1024 * 1024
+RESUMABLE_UPLOAD_SESSION_TTL_SECONDS = 24 * 60 * 60 # Sessions without any chunk for this long are garbage-collected
+RESUMABLE_UPLOAD_GC_INTERVAL_SECONDS = 60 * 60
+
+# Image renditions, generated at ingestion next to the originals as <name>.<rendition>.<extension>
+RENDITION_SIZES = {'thumbnail': (256, 256), 'medium': (1024, 1024)} # Bounding boxes, the aspect ratio is kept
+RENDITION_WEBP = False # Also save a WebP copy of every rendition
+RENDITION_QUALITY = 85
+RENDITION_WORKERS = 4 # Processes generating the renditions of an archive
+DAY_SPRITE_TILE_SIZE = (128, 128) # Every moment of a day is a tile of this size in the sprite sheet of the day
+DAY_SPRITE_COLUMNS = 20
+DAY_SPRITE_NAME = 'sprite.jpg' # Saved in the folder of the date
+
+# Image serving
+IMAGE_CACHE_CONTROL = 'private, max-age=2592000' # Images are revalidated with their ETag after 30 days
+IMAGE_READ_CHUNK_SIZE = 256 * 1024 # Bytes sent at a time when the server does not support zero-copy sends
+IMAGE_X_ACCEL_REDIRECT_PREFIX = None # e.g. '/protected_images', set to let nginx send the files from DATA_STORAGE_URL
@@ -26,11 +26,11 @@ async def verify_token(token: str = Header(...)):
         username = payload.get("username") # Check if the username is in the payload
         if username is None:
             raise credentials_exception
+        if payload.get("token_type") != "access": # Refresh tokens can only be used to get a new pair of tokens
+            raise credentials_exception
     except JWTError:
         raise credentials_exception
-    if not authenticator.verify_user(username): # Check if the user is actually in the database
-        raise credentials_exception
-    if not authenticator.verify_user_time_info(username, payload.get("iat")):
+    if not await authenticator.verify_user_session(username, payload.get("iat")): # Check if the user is in the database and the token is the latest one
         raise credentials_exception
     if not authenticator.verify_expiration_time(payload.get("exp")):
         raise expired_creditentials_exception
@@ -1,6 +1,7 @@
 import connectors
 import sentry_sdk
-from typing import List, Union
+from pymongo import UpdateOne, ReturnDocument
+from typing import Dict, List, Union
 from schemas.annotation_data_schemas import UserAnnotationList
 from schemas.request_schemas import RequestInsertDefaultAnnotationData
 
@@ -8,12 +9,35 @@ from schemas.request_schemas import RequestInsertDefaultAnnotationData
 db = connectors.mongodb_client['stress_lifelog']
 
 
-async def insert_default_annotation_data(user_id: str, request: RequestInsertDefaultAnnotationData):
+async def insert_default_annotation_data(user_id: str, request: RequestInsertDefaultAnnotationData) -> Union[None, UserAnnotationList]:
     """
     Insert default annotation data into the database.
+    NOTE: Returns the annotation data after the write, in the same round trip, or None if the write failed.
     """
     try:
-        _ = await db['annotation_data_list'].update_one({"_id": user_id}, {"$set": request.dict()}, upsert = True)
+        annotation_data = await db['annotation_data_list'].find_one_and_update(
+            {"_id": user_id}, 
+            {"$set": request.dict()}, 
+            upsert = True,
+            return_document = ReturnDocument.AFTER
+        )
+    except Exception as e:
+        sentry_sdk.capture_exception(e)
+        return None
+    return annotation_data
+
+
+async def insert_empty_annotation_data_list(user_ids: List[str]) -> bool:
+    """
+    Insert empty annotation data of many users into the database in one batched write.
+    NOTE: Users which already have annotation data are left untouched.
+    """
+    if not user_ids:
+        return True
+    empty_annotation_data = {"location_list": [], "stress_level_list": [], "activity_list": []}
+    requests = [UpdateOne({"_id": user_id}, {"$setOnInsert": empty_annotation_data}, upsert = True) for user_id in user_ids]
+    try:
+        _ = await db['annotation_data_list'].bulk_write(requests, ordered = False)
     except Exception as e:
         sentry_sdk.capture_exception(e)
         return False
@@ -47,40 +71,67 @@ async def get_annotation_list(user_id: str, list_type: str):
     return annotation_list
 
 
-async def insert_to_location_list(user_id: str, value: str):
+async def insert_to_annotation_list(user_id: str, list_type: str, value: str):
     """
-    Insert a new location into the database.
+    Insert a new value into an annotation list (location, stress_level or activity) of the database.
+    NOTE: Returns the list after the write, in the same round trip, or None if the write failed.
     """
+    list_name = f'{list_type}_list'
     try:
-        _ = await db['annotation_data_list'].update_one({"_id": user_id}, {"$addToSet": {"location_list": value} }, upsert = True)
+        annotation_list = await db['annotation_data_list'].find_one_and_update(
+            {"_id": user_id}, 
+            {"$addToSet": {list_name: value}}, 
+            projection = {'_id': 0, list_name: 1},
+            upsert = True,
+            return_document = ReturnDocument.AFTER
+        )
     except Exception as e:
         sentry_sdk.capture_exception(e)
-        return False
-    return True
+        return None
+    return {
+        "list_type": list_type,
+        "data_list": annotation_list[list_name]
+    }
 
 
-async def insert_to_stress_level_list(user_id: str, value: str):
+async def insert_values_to_annotation_lists(user_id: str, values: Dict[str, str]) -> bool:
     """
-    Insert a new stress level into the database.
+    Insert the values of many annotations (e.g. location -> 'dcu') into their lists with a single update.
+    NOTE: Values already in a list are left untouched.
     """
+    if not values:
+        return True
     try:
-        _ = await db['annotation_data_list'].update_one({"_id": user_id}, {"$addToSet": {"stress_level_list": value} }, upsert = True)
+        _ = await db['annotation_data_list'].update_one(
+            {"_id": user_id}, 
+            {"$addToSet": {f'{list_type}_list': value for list_type, value in values.items()}}, 
+            upsert = True
+        )
     except Exception as e:
         sentry_sdk.capture_exception(e)
         return False
     return True
 
 
+async def insert_to_location_list(user_id: str, value: str):
+    """
+    Insert a new location into the database.
+    """
+    return await insert_to_annotation_list(user_id, 'location', value)
+
+
+async def insert_to_stress_level_list(user_id: str, value: str):
+    """
+    Insert a new stress level into the database.
+    """
+    return await insert_to_annotation_list(user_id, 'stress_level', value)
+
+
 async def insert_to_activity_list(user_id: str, value: str):
     """
     Insert a new activity into the database.
     """
-    try:
-        _ = await db['annotation_data_list'].update_one({"_id": user_id}, {"$addToSet": {"activity_list": value} }, upsert = True)
-    except Exception as e:
-        sentry_sdk.capture_exception(e)
-        return False
-    return True
+    return await insert_to_annotation_list(user_id, 'activity', value)
 
 
 async def get_location_list(user_id: str):
@@ -0,0 +1,46 @@
+from datetime import datetime
+from typing import Dict
+from pymongo import ASCENDING
+import sentry_sdk
+import connectors
+
+
+db = connectors.mongodb_client['stress_lifelog']
+
+
+async def create_feature_run_indexes() -> None:
+    """
+    Create the unique index of the feature runs on the user and the date.
+    """
+    await db['feature_runs'].create_index([("user_id", ASCENDING), ("date", ASCENDING)], unique = True)
+
+
+async def get_feature_fingerprints(user_id: str) -> Dict[str, str]:
+    """
+    Get the date -> fingerprint of the inputs of the last feature computation of every day of a user.
+    """
+    try:
+        runs = await db['feature_runs'].find(
+            {"user_id": user_id}, 
+            {"_id": 0, "date": 1, "fingerprint": 1}
+        ).to_list(length = None)
+    except Exception as e:
+        sentry_sdk.capture_exception(e)
+        return {}
+    return {run['date']: run['fingerprint'] for run in runs}
+
+
+async def set_feature_fingerprint(user_id: str, _date: str, fingerprint: str) -> bool:
+    """
+    Record the fingerprint of the inputs of the features which were just computed for a day of a user.
+    """
+    try:
+        _ = await db['feature_runs'].update_one(
+            {"user_id": user_id, "date": _date},
+            {"$set": {"fingerprint": fingerprint, "computed_at": datetime.utcnow()}},
+            upsert = True
+        )
+    except Exception as e:
+        sentry_sdk.capture_exception(e)
+        return False
+    return True
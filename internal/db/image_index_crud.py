@@ -0,0 +1,59 @@
+from typing import Dict, List, Union
+from pymongo import UpdateOne, ASCENDING
+import sentry_sdk
+import connectors
+
+
+db = connectors.mongodb_client['stress_lifelog']
+
+
+async def create_image_index_indexes() -> None:
+    """
+    Create the unique index of the image index on the user and the path of the image.
+    """
+    await db['image_index'].create_index([("user_id", ASCENDING), ("path", ASCENDING)], unique = True)
+
+
+async def get_image_index(user_id: str) -> Dict[str, dict]:
+    """
+    Get the path -> {crc, size, sha1} index of every image already stored for a user.
+    """
+    try:
+        entries = await db['image_index'].find(
+            {"user_id": user_id}, 
+            {"_id": 0, "path": 1, "crc": 1, "size": 1, "sha1": 1}
+        ).to_list(length = None)
+    except Exception as e:
+        sentry_sdk.capture_exception(e)
+        return {}
+    return {entry['path']: entry for entry in entries}
+
+
+async def get_image_index_entry(user_id: str, path: str) -> Union[dict, None]:
+    """
+    Get the {path, crc, size, sha1} of one image stored for a user.
+    """
+    try:
+        entry = await db['image_index'].find_one({"user_id": user_id, "path": path}, {"_id": 0})
+    except Exception as e:
+        sentry_sdk.capture_exception(e)
+        return None
+    return entry
+
+
+async def upsert_image_index_entries(user_id: str, entries: List[dict]) -> bool:
+    """
+    Insert or update the {path, crc, size, sha1} of the images stored for a user in one batched write.
+    """
+    if not entries:
+        return True
+    requests = [
+        UpdateOne({"user_id": user_id, "path": entry['path']}, {"$set": {**entry, "user_id": user_id}}, upsert = True)
+        for entry in entries
+    ]
+    try:
+        _ = await db['image_index'].bulk_write(requests, ordered = False)
+    except Exception as e:
+        sentry_sdk.capture_exception(e)
+        return False
+    return True
@@ -0,0 +1,29 @@
+import asyncio
+from internal.db.moment_annotation_crud import create_moments_indexes, migrate_moments_keys
+from internal.db.moment_detail_annotation_crud import create_moment_detail_indexes, migrate_moment_detail_keys
+from internal.db.ingestion_job_crud import create_ingestion_job_indexes
+from internal.db.image_index_crud import create_image_index_indexes
+from internal.db.feature_run_crud import create_feature_run_indexes
+
+
+async def ensure_indexes() -> dict:
+    """
+    Migrate the documents written before the flattened keys existed, then create the indexes of every collection.
+    NOTE: Safe to run on every startup, both steps are no-ops once done. The migration runs first so that the
+        unique indexes on the flattened keys never see documents without them. Returns the number of migrated documents.
+    """
+    migrated = {
+        'moments': await migrate_moments_keys(),
+        'moment_detail': await migrate_moment_detail_keys(),
+    }
+    await create_moments_indexes()
+    await create_moment_detail_indexes()
+    await create_ingestion_job_indexes()
+    await create_image_index_indexes()
+    await create_feature_run_indexes()
+    return migrated
+
+
+if __name__ == '__main__':
+    # Run the migration on its own, from the root of the project: python -m internal.db.indexes
+    print(asyncio.run(ensure_indexes()))
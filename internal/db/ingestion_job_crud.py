@@ -0,0 +1,186 @@
+from datetime import datetime, timedelta
+from typing import List, Union
+from uuid import uuid4
+from pymongo import ReturnDocument, ASCENDING
+from schemas.db_schemas import IngestionJob
+from constants.transfer_configuration import INGESTION_JOB_LEASE_SECONDS, INGESTION_JOB_MAX_ATTEMPTS
+import sentry_sdk
+import connectors
+
+
+db = connectors.mongodb_client['stress_lifelog']
+
+
+TERMINAL_JOB_STATUSES = ['completed', 'failed']
+
+
+async def create_ingestion_job_indexes() -> None:
+    """
+    Create the index used by the workers to find the next job to claim.
+    """
+    await db['ingestion_jobs'].create_index([("status", ASCENDING), ("created_at", ASCENDING)])
+
+
+async def insert_ingestion_job(user_id: str, file_path: str, file_name: str, sha256: str, size: int) -> Union[None, dict]:
+    """
+    Queue a new ingestion job of an uploaded file.
+    NOTE: Refer to the IngestionJob in the folder schemas for the required fields.
+    """
+
+    job = IngestionJob(
+        id = uuid4().hex,
+        user_id = user_id,
+        file_path = file_path,
+        file_name = file_name,
+        sha256 = sha256,
+        size = size,
+        created_at = datetime.utcnow(),
+    )
+    job = job.dict(by_alias = True) # Keep dates as BSON dates so that they can be compared in queries
+
+    try:
+        _ = await db['ingestion_jobs'].insert_one(job)
+    except Exception as e:
+        sentry_sdk.capture_exception(e)
+        return None
+    return job
+
+
+async def claim_next_ingestion_job(worker_id: str) -> Union[None, dict]:
+    """
+    Atomically claim the oldest queued job, or a running job whose worker stopped renewing its lease.
+    NOTE: Safe to call from many worker processes and nodes at the same time.
+    """
+
+    now = datetime.utcnow()
+    try:
+        job = await db['ingestion_jobs'].find_one_and_update(
+            {
+                "$or": [
+                    {"status": "queued"},
+                    {"status": "running", "lease_expires_at": {"$lt": now}},
+                ],
+                "attempts": {"$lt": INGESTION_JOB_MAX_ATTEMPTS},
+            },
+            {
+                "$set": {
+                    "status": "running",
+                    "worker_id": worker_id,
+                    "started_at": now,
+                    "lease_expires_at": now + timedelta(seconds = INGESTION_JOB_LEASE_SECONDS),
+                },
+                "$inc": {"attempts": 1},
+            },
+            sort = [("created_at", ASCENDING)],
+            return_document = ReturnDocument.AFTER,
+        )
+    except Exception as e:
+        sentry_sdk.capture_exception(e)
+        return None
+    return job
+
+
+async def fail_exhausted_ingestion_jobs() -> List[str]:
+    """
+    Mark the jobs which were abandoned by a worker too many times as failed.
+    NOTE: Returns the staged files of these jobs, which can not be retried anymore.
+    """
+    query = {"status": "running", "lease_expires_at": {"$lt": datetime.utcnow()}, "attempts": {"$gte": INGESTION_JOB_MAX_ATTEMPTS}}
+    try:
+        jobs = await db['ingestion_jobs'].find(query, {"file_path": 1}).to_list(length = None)
+        if not jobs:
+            return []
+        # Only the jobs which are still abandoned, another worker may have failed them in the meantime
+        query["_id"] = {"$in": [job['_id'] for job in jobs]}
+        _ = await db['ingestion_jobs'].update_many(
+            query,
+            {"$set": {"status": "failed", "error": "Too many attempts", "finished_at": datetime.utcnow()}},
+        )
+    except Exception as e:
+        sentry_sdk.capture_exception(e)
+        return []
+    return [job['file_path'] for job in jobs]
+
+
+async def renew_ingestion_job_lease(job_id: str, worker_id: str) -> bool:
+    """
+    Extend the lease of a running job. Returns False if the job was taken over by another worker.
+    """
+    try:
+        result = await db['ingestion_jobs'].update_one(
+            {"_id": job_id, "worker_id": worker_id, "status": "running"},
+            {"$set": {"lease_expires_at": datetime.utcnow() + timedelta(seconds = INGESTION_JOB_LEASE_SECONDS)}},
+        )
+    except Exception as e:
+        sentry_sdk.capture_exception(e)
+        return False
+    return result.matched_count == 1
+
+
+async def update_ingestion_job_progress(job_id: str, progress: dict) -> bool:
+    """
+    Set the progress counters of a running job, e.g. {"moments_inserted": 120}.
+    """
+    try:
+        _ = await db['ingestion_jobs'].update_one(
+            {"_id": job_id},
+            {"$set": {f"progress.{key}": value for key, value in progress.items()}},
+        )
+    except Exception as e:
+        sentry_sdk.capture_exception(e)
+        return False
+    return True
+
+
+async def finish_ingestion_job(job_id: str, worker_id: str, status: str, error: Union[str, None] = None) -> bool:
+    """
+    Mark a job claimed by the worker as completed or failed.
+    """
+    try:
+        _ = await db['ingestion_jobs'].update_one(
+            {"_id": job_id, "worker_id": worker_id},
+            {"$set": {"status": status, "error": error, "finished_at": datetime.utcnow()}},
+        )
+    except Exception as e:
+        sentry_sdk.capture_exception(e)
+        return False
+    return True
+
+
+async def requeue_ingestion_job(job_id: str, worker_id: str, error: Union[str, None] = None) -> bool:
+    """
+    Put a job claimed by the worker back in the queue after a failed attempt, so that any worker can retry it.
+    """
+    try:
+        result = await db['ingestion_jobs'].update_one(
+            {"_id": job_id, "worker_id": worker_id, "status": "running"},
+            {"$set": {"status": "queued", "error": error, "worker_id": None, "lease_expires_at": None}},
+        )
+    except Exception as e:
+        sentry_sdk.capture_exception(e)
+        return False
+    return result.matched_count == 1
+
+
+async def get_ingestion_job(job_id: str) -> Union[None, dict]:
+    """
+    Get an ingestion job with its progress.
+    """
+    try:
+        job = await db['ingestion_jobs'].find_one({"_id": job_id})
+    except Exception as e:
+        sentry_sdk.capture_exception(e)
+        return None
+    return job
+
+
+async def get_ingestion_job_by_file_path(file_path: str) -> Union[None, dict]:
+    """
+    Get the ingestion job of a staged file, e.g. to know if a finalized upload was queued.
+    """
+    try:
+        job = await db['ingestion_jobs'].find_one({"file_path": file_path})
+    except Exception as e:
+        sentry_sdk.capture_exception(e)
+        return None
+    return job
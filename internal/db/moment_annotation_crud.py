@@ -1,7 +1,9 @@
-from typing import List
+from typing import List, Union
 from datetime import date
+from pymongo import ASCENDING, ReturnDocument
 from fastapi.encoders import jsonable_encoder
 from schemas.db_schemas import (
+    DaySprite,
     MomentListByDate,
     MomentListByDateId
 )
@@ -12,10 +14,37 @@ import connectors
 db = connectors.mongodb_client['stress_lifelog']
 
 
-async def insert_moments(id: MomentListByDateId, moment_list: List[str]) -> bool:
+def get_moments_key(moment_id: dict) -> dict:
+    """
+    Get the flattened key of an encoded MomentListByDateId, which is queried through the (user_id, moment_date) index.
+    """
+    return {"user_id": moment_id['user_id'], "moment_date": moment_id['moment_date']}
+
+
+async def create_moments_indexes() -> None:
+    """
+    Create the unique index of the moments of a date on their flattened key.
+    """
+    await db['moments'].create_index([("user_id", ASCENDING), ("moment_date", ASCENDING)], unique = True)
+
+
+async def migrate_moments_keys() -> int:
+    """
+    Copy the fields of the embedded _id to the flattened key of the moments written before it existed.
+    NOTE: Runs as one server-side pipeline update. Returns the number of migrated documents.
+    """
+    result = await db['moments'].update_many(
+        {"user_id": {"$exists": False}},
+        [{"$set": {"user_id": "$_id.user_id", "moment_date": "$_id.moment_date"}}]
+    )
+    return result.modified_count
+
+
+async def insert_moments(id: MomentListByDateId, moment_list: List[str]) -> Union[None, MomentListByDate]:
     """
     Insert new moments in a date into the database
     NOTE: Refer to the MomentListByDate in the folder schemas for the required fields.
+        Returns the inserted moments, or None if they could not be inserted.
     """
 
     request = {
@@ -25,27 +54,52 @@ async def insert_moments(id: MomentListByDateId, moment_list: List[str]) -> bool
 
     moment_list_by_date = MomentListByDate(**request)
     moment_list_by_date = jsonable_encoder(moment_list_by_date)
+    moment_list_by_date.update(get_moments_key(moment_list_by_date['_id']))
 
     try:
         _ = await db['moments'].insert_one(moment_list_by_date)
     except Exception as e:
         sentry_sdk.capture_exception(e)
-        return False
-    return True
+        return None
+    return moment_list_by_date
 
 
-async def append_moments(id: MomentListByDateId, moment_list: List[str]) -> bool:
+async def append_moments(id: MomentListByDateId, moment_list: List[str]) -> Union[None, MomentListByDate]:
 
     """
     Append new moments into a date of a user into the database
     NOTE: Refer to the MomentListByDate in the folder schemas for the required fields.
+        Returns the moments of the date after the write, in the same round trip, or None if the write failed.
     """
     moment_id = MomentListByDateId(**id)
     moment_id = jsonable_encoder(moment_id)
     _moments = moment_list
 
     try:
-        _ = await db['moments'].update_many({"_id": moment_id}, {"$addToSet": {"moment_list": {"$each": _moments }}}, upsert = True)
+        _moments = await db['moments'].find_one_and_update(
+            get_moments_key(moment_id), 
+            {"$addToSet": {"moment_list": {"$each": _moments }}, "$setOnInsert": {"_id": moment_id}}, 
+            upsert = True,
+            return_document = ReturnDocument.AFTER
+        )
+    except Exception as e:
+        sentry_sdk.capture_exception(e)
+        return None
+    return _moments
+
+
+async def set_moments_sprite(id: MomentListByDateId, sprite: DaySprite) -> bool:
+
+    """
+    Set the sprite sheet of the moments of a date of a user
+    NOTE: Refer to the DaySprite in the folder schemas for the required fields.
+    """
+    moment_id = MomentListByDateId(**id)
+    moment_id = jsonable_encoder(moment_id)
+    sprite = jsonable_encoder(DaySprite(**sprite))
+
+    try:
+        _ = await db['moments'].update_one(get_moments_key(moment_id), {"$set": {"sprite": sprite}})
     except Exception as e:
         sentry_sdk.capture_exception(e)
         return False
@@ -61,7 +115,7 @@ async def get_moments_by_date(user_id: str, moment_date: str) -> MomentListByDat
     moment_id = MomentListByDateId(user_id = user_id, moment_date = moment_date)
     moment_id = jsonable_encoder(moment_id)
     try:
-        _moments = await db['moments'].find_one({"_id": moment_id})
+        _moments = await db['moments'].find_one(get_moments_key(moment_id))
     except Exception as e:
         sentry_sdk.capture_exception(e)
         return None
@@ -1,4 +1,8 @@
+from collections import defaultdict
+from typing import List, Tuple, Union
 from fastapi.encoders import jsonable_encoder
+from pymongo import UpdateOne, ASCENDING, ReturnDocument
+from pymongo.errors import BulkWriteError
 from schemas.db_schemas import (
     MomentDetail,
     MomentDetailId,
@@ -6,18 +10,50 @@ from schemas.db_schemas import (
 )
 import sentry_sdk
 import connectors
+from motor.motor_asyncio import AsyncIOMotorCursor
 from schemas.request_schemas import RequestUpdateMomentDetail
+from internal.db.moment_detail_write_buffer import moment_detail_write_buffer
+from constants.transfer_configuration import MOMENT_DETAIL_BATCH_SIZE
 
 
 db = connectors.mongodb_client['stress_lifelog']
 
 
+def get_moment_detail_key(moment_id: dict) -> dict:
+    """
+    Get the flattened key of an encoded MomentDetailId, which is queried through the (user_id, moment_date, local_time) index.
+    NOTE: The embedded _id is only matched as a whole, in the order of its fields, so it can not serve range queries.
+    """
+    return {"user_id": moment_id['user_id'], "moment_date": moment_id['date'], "local_time": moment_id['local_time']}
+
+
+async def create_moment_detail_indexes() -> None:
+    """
+    Create the unique index of the moment details on their flattened key.
+    """
+    await db['moment_detail'].create_index(
+        [("user_id", ASCENDING), ("moment_date", ASCENDING), ("local_time", ASCENDING)], unique = True
+    )
+
+
+async def migrate_moment_detail_keys() -> int:
+    """
+    Copy the fields of the embedded _id to the flattened key of the moment details written before it existed.
+    NOTE: Runs as one server-side pipeline update. Returns the number of migrated moment details.
+    """
+    result = await db['moment_detail'].update_many(
+        {"user_id": {"$exists": False}},
+        [{"$set": {"user_id": "$_id.user_id", "moment_date": "$_id.date", "local_time": "$_id.local_time"}}]
+    )
+    return result.modified_count
+
 
-async def insert_moment_detail(id: MomentDetailId, moment_detail: MomentMetadata) -> bool:
+async def insert_moment_detail(id: MomentDetailId, moment_detail: MomentMetadata) -> Union[None, MomentDetail]:
 
     """
     Insert new moment detail into the database
     NOTE: Refer to the MomentDetail in the folder schemas for the required fields.
+        Returns the inserted moment detail, or None if it could not be inserted.
     """
     
     request = {
@@ -27,20 +63,100 @@ async def insert_moment_detail(id: MomentDetailId, moment_detail: MomentMetadata
 
     moment_detail = MomentDetail(**request)
     moment_detail = jsonable_encoder(moment_detail)
+    moment_detail.update(get_moment_detail_key(moment_detail['_id']))
 
     try:
         _ = await db['moment_detail'].insert_one(moment_detail)
     except Exception as e:
         sentry_sdk.capture_exception(e)
-        return False
-    return True
+        return None
+    return moment_detail
 
 
-async def update_moment_detail(user_id: str, request: RequestUpdateMomentDetail) -> bool:
+def get_moment_detail_upsert(moment_detail: dict) -> dict:
+    # A moment detail and the fields of its renditions can not be in the same update, so the renditions are only set
+    # on their own, and the moment detail is inserted without them, when there are any
+    renditions = moment_detail.get('renditions')
+    if not renditions:
+        return {"$setOnInsert": moment_detail}
+    return {
+        "$setOnInsert": {key: value for key, value in moment_detail.items() if key != 'renditions'},
+        "$set": {f'renditions.{name}': path for name, path in renditions.items()},
+    }
+
+
+async def upsert_moment_details(moment_details: List[dict], batch_size: int = MOMENT_DETAIL_BATCH_SIZE) -> dict:
+
+    """
+    Insert many already encoded moment details into the database with unordered bulk writes.
+    NOTE: Moment details which already exist are left untouched so that inserting the same moments again is a no-op
+        and never overwrites annotations, except for their renditions which are set one by one, e.g. those of an
+        image which changed. Returns the number of inserted, existing and failed moment details.
+    """
+
+    counters = {'inserted': 0, 'existing': 0, 'errors': 0}
+    for i in range(0, len(moment_details), batch_size):
+        batch = moment_details[i:i + batch_size]
+        requests = [
+            UpdateOne(
+                get_moment_detail_key(moment_detail['_id']), 
+                get_moment_detail_upsert(moment_detail), 
+                upsert = True
+            )
+            for moment_detail in batch
+        ]
+        try:
+            result = await db['moment_detail'].bulk_write(requests, ordered = False)
+            counters['inserted'] += result.upserted_count
+            counters['existing'] += result.matched_count
+        except BulkWriteError as e:
+            sentry_sdk.capture_exception(e)
+            counters['inserted'] += e.details.get('nUpserted', 0)
+            counters['existing'] += e.details.get('nMatched', 0)
+            counters['errors'] += len(e.details.get('writeErrors', []))
+        except Exception as e:
+            sentry_sdk.capture_exception(e)
+            counters['errors'] += len(batch)
+    return counters
+
+
+async def set_moment_details(moment_details: List[dict], batch_size: int = MOMENT_DETAIL_BATCH_SIZE) -> dict:
+
+    """
+    Set the given fields of many existing moment details with unordered bulk writes.
+    NOTE: Every moment detail is a dict with the encoded '_id' and the fields to set. Moment details which do not
+        exist are not created. Returns the number of matched and failed moment details.
+    """
+
+    counters = {'matched': 0, 'errors': 0}
+    for i in range(0, len(moment_details), batch_size):
+        batch = moment_details[i:i + batch_size]
+        requests = [
+            UpdateOne(
+                get_moment_detail_key(moment_detail['_id']), 
+                {"$set": {key: value for key, value in moment_detail.items() if key != '_id'}}
+            )
+            for moment_detail in batch
+        ]
+        try:
+            result = await db['moment_detail'].bulk_write(requests, ordered = False)
+            counters['matched'] += result.matched_count
+        except BulkWriteError as e:
+            sentry_sdk.capture_exception(e)
+            counters['matched'] += e.details.get('nMatched', 0)
+            counters['errors'] += len(e.details.get('writeErrors', []))
+        except Exception as e:
+            sentry_sdk.capture_exception(e)
+            counters['errors'] += len(batch)
+    return counters
+
+
+async def update_moment_detail(user_id: str, request: RequestUpdateMomentDetail) -> Union[None, MomentDetail]:
 
     """
     Update all the fields of a moment detail except the moment id
     NOTE: Refer to the MomentDetail in the folder schemas for the required fields.
+        Returns the moment detail after the update, in the same round trip, or None if it does not exist.
     """
 
     request = jsonable_encoder(request)
@@ -52,12 +168,32 @@ async def update_moment_detail(user_id: str, request: RequestUpdateMomentDetail)
     moment_id = MomentDetailId(**request['id'])
     moment_id = jsonable_encoder(moment_id)
 
+    moment_detail_key = get_moment_detail_key(moment_id)
+
+    async def write(fields: dict):
+        return await db['moment_detail'].find_one_and_update(
+            moment_detail_key, 
+            {"$set": fields}, 
+            return_document = ReturnDocument.AFTER
+        )
+
     try:
-        _ = await db['moment_detail'].update_one({"_id": moment_id}, {"$set": {data_type: value}})
+        if not moment_detail_write_buffer.enabled:
+            return await write({data_type: value})
+        if moment_detail_write_buffer.retrying:
+            # Failed writes are waiting for a retry, write directly so that the update is not acknowledged before it is stored
+            return await moment_detail_write_buffer.write_through(moment_detail_key, {data_type: value}, write)
+        # Read only if the buffer does not know the moment detail yet, so that nothing is buffered for a moment detail
+        # which does not exist or if the read fails. The update is written with the other pending updates
+        _moment_detail = None
+        if moment_detail_write_buffer.get(moment_detail_key) is None:
+            _moment_detail = await db['moment_detail'].find_one(moment_detail_key)
+            if _moment_detail is None:
+                return None
+        return await moment_detail_write_buffer.update(moment_detail_key, {data_type: value}, _moment_detail)
     except Exception as e:
         sentry_sdk.capture_exception(e)
-        return False
-    return True
+        return None
 
 
 async def get_moment_detail(user_id: str, moment_date: str, moment_time: str):
@@ -71,8 +207,117 @@ async def get_moment_detail(user_id: str, moment_date: str, moment_time: str):
     moment_id = jsonable_encoder(moment_id)
 
     try:
-        _moment_detail = await db['moment_detail'].find_one({"_id": moment_id})
+        _moment_detail = await db['moment_detail'].find_one(get_moment_detail_key(moment_id))
+    except Exception as e:
+        sentry_sdk.capture_exception(e)
+        return None
+    return moment_detail_write_buffer.overlay(_moment_detail)
+
+
+def get_moment_detail_range_query(user_id: str, start_date: str, end_date: str, start_time: Union[str, None] = None, 
+                                  end_time: Union[str, None] = None) -> dict:
+    # Moment details of a user between two dates (inclusive), optionally only between two times of the day
+    query = {"user_id": user_id, "moment_date": {"$gte": start_date, "$lte": end_date}}
+    if start_time is not None or end_time is not None:
+        query["local_time"] = {}
+        if start_time is not None:
+            query["local_time"]["$gte"] = start_time
+        if end_time is not None:
+            query["local_time"]["$lte"] = end_time
+    return query
+
+
+def find_moment_details(user_id: str, start_date: str, end_date: str, start_time: Union[str, None] = None, 
+                        end_time: Union[str, None] = None, after: Union[Tuple[str, str], None] = None,
+                        fields: Union[List[str], None] = None, limit: int = 0) -> AsyncIOMotorCursor:
+    """
+    Find the moment details of a user between two dates (inclusive), optionally only between two times of the day,
+    sorted by date and time.
+    NOTE: after is the (moment_date, local_time) of the last moment detail of the previous page. fields limits
+        the returned fields, the flattened key is always returned. Served by the (user_id, moment_date, local_time) index.
+        Pending write-behind updates are not applied, flush moment_detail_write_buffer first.
+    """
+    query = get_moment_detail_range_query(user_id, start_date, end_date, start_time, end_time)
+    if after is not None:
+        after_date, after_time = after
+        query = {"$and": [query, {"$or": [
+            {"moment_date": {"$gt": after_date}},
+            {"moment_date": after_date, "local_time": {"$gt": after_time}},
+        ]}]}
+
+    projection = None
+    if fields is not None:
+        projection = {field: 1 for field in fields}
+        projection.update({"user_id": 1, "moment_date": 1, "local_time": 1})
+    return db['moment_detail'].find(query, projection) \
+        .sort([("user_id", ASCENDING), ("moment_date", ASCENDING), ("local_time", ASCENDING)]) \
+        .limit(limit)
+
+
+
+def get_moment_detail_ids_query(user_id: str, ids: List[Tuple[str, str]]) -> dict:
+    # Moment details of a user from their (moment_date, local_time), one $in of the times of every date,
+    # so that every branch of the $or is served by the (user_id, moment_date, local_time) index
+    local_times = defaultdict(list)
+    for moment_date, local_time in ids:
+        local_times[moment_date].append(local_time)
+    return {"user_id": user_id, "$or": [
+        {"moment_date": moment_date, "local_time": {"$in": times}} for moment_date, times in local_times.items()
+    ]}
+
+
+async def get_moment_details_by_ids(user_id: str, ids: List[Tuple[str, str]]) -> Union[dict, None]:
+
+    """
+    Get many moment details of a user from their (moment_date, local_time) with a single query on the flattened key.
+    NOTE: Returns (moment_date, local_time) -> moment detail for the moment details which exist.
+    """
+
+    if not ids:
+        return {}
+    try:
+        moment_details = await db['moment_detail'].find(get_moment_detail_ids_query(user_id, ids)).to_list(length = None)
+    except Exception as e:
+        sentry_sdk.capture_exception(e)
+        return None
+    return {
+        (moment_detail['moment_date'], moment_detail['local_time']): moment_detail_write_buffer.overlay(moment_detail) 
+        for moment_detail in moment_details
+    }
+
+
+async def update_moment_details_by_range(user_id: str, values: dict, start_date: str, end_date: str, 
+                                         start_time: Union[str, None] = None, end_time: Union[str, None] = None) -> Union[dict, None]:
+
+    """
+    Set the same field values on every moment detail of a user between two dates (inclusive), optionally only between
+    two times of the day, with a single update_many.
+    NOTE: Returns the numbers of matched and modified moment details, or None if the update failed.
+    """
+
+    query = get_moment_detail_range_query(user_id, start_date, end_date, start_time, end_time)
+    return await update_many_moment_details(query, values)
+
+
+async def update_moment_details_by_ids(user_id: str, values: dict, ids: List[Tuple[str, str]]) -> Union[dict, None]:
+
+    """
+    Set the same field values on many moment details of a user from their (moment_date, local_time), with a single
+    update_many on the flattened key.
+    NOTE: Returns the numbers of matched and modified moment details, or None if the update failed.
+    """
+
+    if not ids:
+        return {'matched': 0, 'modified': 0}
+    return await update_many_moment_details(get_moment_detail_ids_query(user_id, ids), values)
+
+
+async def update_many_moment_details(query: dict, values: dict) -> Union[dict, None]:
+    try:
+        await moment_detail_write_buffer.flush() # So that pending updates do not overwrite these values later
+        result = await db['moment_detail'].update_many(query, {"$set": values})
+        moment_detail_write_buffer.discard_documents() # They may be among the updated moment details
     except Exception as e:
         sentry_sdk.capture_exception(e)
         return None
-    return _moment_detail
\ No newline at end of file
+    return {'matched': result.matched_count, 'modified': result.modified_count}
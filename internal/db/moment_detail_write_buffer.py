@@ -0,0 +1,326 @@
+import asyncio
+import copy
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, List, Tuple, TypeVar, Union
+import sentry_sdk
+import connectors
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from constants.annotation_configuration import (
+    MOMENT_DETAIL_WRITE_BEHIND,
+    MOMENT_DETAIL_WRITE_BEHIND_WINDOW_SECONDS,
+    MOMENT_DETAIL_WRITE_BEHIND_MAX_SIZE,
+    MOMENT_DETAIL_WRITE_BEHIND_LATENCY_SAMPLES,
+    MOMENT_DETAIL_WRITE_BEHIND_RETRY_SECONDS,
+    MOMENT_DETAIL_WRITE_BEHIND_MAX_RETRY_SECONDS,
+    MOMENT_DETAIL_WRITE_BEHIND_RETRY_TIMEOUT_SECONDS,
+    MOMENT_DETAIL_WRITE_BEHIND_CLOSE_TIMEOUT_SECONDS,
+)
+
+
+db = connectors.mongodb_client['stress_lifelog']
+
+MomentKey = Tuple[str, str, str] # (user_id, moment_date, local_time)
+T = TypeVar('T')
+
+
+def get_moment_key(moment_detail_key: dict) -> MomentKey:
+    return moment_detail_key['user_id'], moment_detail_key['moment_date'], moment_detail_key['local_time']
+
+
+def apply_fields(document: dict, fields: dict) -> dict:
+    # Apply the fields of a $set to a document, dotted fields set a value of an embedded document
+    for field, value in fields.items():
+        target = document
+        *parents, name = field.split('.')
+        for parent in parents:
+            target = target.setdefault(parent, {})
+        target[name] = value
+    return document
+
+
+def merge_fields(older: dict, newer: dict) -> dict:
+    """
+    Merge two $set of a moment detail into one with the result of applying them in order.
+    NOTE: A field and a field of its embedded document can not be in the same $set, so a newer embedded field
+        is applied to the older value of its parent, and a newer parent replaces the older embedded fields.
+    """
+    merged = dict(older)
+    for field, value in newer.items():
+        for other in [other for other in merged if other == field or other.startswith(f'{field}.')]:
+            del merged[other]
+        parent = next((other for other in merged if field.startswith(f'{other}.')), None)
+        if parent is not None and isinstance(merged[parent], dict):
+            merged[parent] = apply_fields(copy.deepcopy(merged[parent]), {field[len(parent) + 1:]: value})
+            continue
+        if parent is not None:
+            del merged[parent]
+        merged[field] = value
+    return merged
+
+
+class MomentDetailWriteBuffer:
+    """
+    Write-behind buffer of the field updates of the moment details. The $set of a moment are merged while they wait,
+    and every window_seconds the pending moments are written with one bulk_write.
+    NOTE: Reads of this worker see the pending writes through overlay(). The last read of every moment with pending
+        writes is kept, so that a burst of updates of a moment costs one read and one write.
+        Writes are flushed as soon as max_size moments are pending, before the queries which read or write many
+        moment details, and on shutdown. Flushes run one at a time so that a later value of a field is never
+        overwritten by an earlier one.
+        Writes which fail are buffered again, under the updates received since, and retried with exponential backoff.
+        While they wait, new updates are written directly with write_through(). Writes which still fail after
+        retry_timeout_seconds are reported to Sentry with their fields.
+    """
+
+    def __init__(self, enabled: bool = MOMENT_DETAIL_WRITE_BEHIND, window_seconds: float = MOMENT_DETAIL_WRITE_BEHIND_WINDOW_SECONDS,
+                 max_size: int = MOMENT_DETAIL_WRITE_BEHIND_MAX_SIZE, latency_samples: int = MOMENT_DETAIL_WRITE_BEHIND_LATENCY_SAMPLES,
+                 retry_seconds: float = MOMENT_DETAIL_WRITE_BEHIND_RETRY_SECONDS, 
+                 max_retry_seconds: float = MOMENT_DETAIL_WRITE_BEHIND_MAX_RETRY_SECONDS,
+                 retry_timeout_seconds: float = MOMENT_DETAIL_WRITE_BEHIND_RETRY_TIMEOUT_SECONDS):
+        self.enabled = enabled
+        self.window_seconds = window_seconds
+        self.max_size = max_size
+        self.retry_seconds = retry_seconds
+        self.max_retry_seconds = max_retry_seconds
+        self.retry_timeout_seconds = retry_timeout_seconds
+        self.updates = 0
+        self.writes = 0
+        self.flushes = 0
+        self.errors = 0
+        self.retried = 0
+        self.written_through = 0
+        self.dropped = 0
+        self.__latencies = deque(maxlen = latency_samples) # Seconds from the first buffered update of a flush to its write
+        self.__pending: Dict[MomentKey, dict] = {}
+        self.__documents: Dict[MomentKey, dict] = {} # Last known moment detail of the moments with pending writes
+        self.__retry_until: Dict[MomentKey, float] = {} # Moments with failed writes -> when they stop being retried
+        self.__failed_flushes = 0 # Consecutive failed flushes, for the backoff
+        self.__retry_at = 0.0
+        self.__pending_since: Union[float, None] = None
+        self.__in_flight: List[Dict[MomentKey, dict]] = []
+        self.__flush_task: Union[asyncio.Task, None] = None
+        self.__flush_lock: Union[asyncio.Lock, None] = None
+
+
+    @property
+    def retrying(self) -> bool:
+        return bool(self.__retry_until)
+
+
+    async def update(self, moment_detail_key: dict, fields: dict, moment_detail: Union[dict, None] = None) -> Union[dict, None]:
+        """
+        Buffer a $set of the moment detail with the flattened key moment_detail_key. moment_detail is the moment detail
+        read from the database, it is only needed when get() does not return it.
+        NOTE: Returns the moment detail with the update applied, or None if it is not known.
+        """
+        moment_key = get_moment_key(moment_detail_key)
+        if moment_detail is not None:
+            self.__documents.setdefault(moment_key, moment_detail)
+        self.__pending[moment_key] = merge_fields(self.__pending.get(moment_key, {}), fields)
+        self.updates += 1
+        if self.__pending_since is None:
+            self.__pending_since = time.monotonic()
+        updated_moment_detail = self.get(moment_detail_key)
+        if len(self.__pending) >= self.max_size and not self.retrying:
+            await self.flush()
+        elif self.__flush_task is None:
+            self.__flush_task = asyncio.create_task(self.__flush_later())
+        return updated_moment_detail
+
+
+    def get(self, moment_detail_key: dict) -> Union[dict, None]:
+        """
+        Get the last known moment detail of a moment with pending writes, with the writes applied, without reading it.
+        """
+        moment_detail = self.__documents.get(get_moment_key(moment_detail_key))
+        if moment_detail is None:
+            return None
+        return self.overlay(copy.deepcopy(moment_detail))
+
+
+    def overlay(self, moment_detail: Union[dict, None]) -> Union[dict, None]:
+        """
+        Apply the writes of a moment detail which are not in the database yet.
+        """
+        if moment_detail is None or not (self.__pending or self.__in_flight):
+            return moment_detail
+        moment_key = get_moment_key(moment_detail)
+        for writes in self.__in_flight + [self.__pending]:
+            if moment_key in writes:
+                apply_fields(moment_detail, writes[moment_key])
+        return moment_detail
+
+
+    async def write_through(self, moment_detail_key: dict, fields: dict, write: Callable[[dict], Awaitable[T]]) -> T:
+        """
+        Write a $set of a moment detail directly, with write(fields), merged over the pending writes of the moment.
+        NOTE: Used while failed writes wait for a retry, so that updates are not acknowledged before they are written.
+            The pending writes are buffered again if write raises.
+        """
+        async with self.__get_flush_lock(): # So that no earlier write of the moment is in flight
+            moment_key = get_moment_key(moment_detail_key)
+            pending = self.__pending.pop(moment_key, {})
+            retry_until = self.__retry_until.pop(moment_key, None)
+            try:
+                result = await write(merge_fields(pending, fields))
+            except Exception:
+                if pending:
+                    self.__pending[moment_key] = merge_fields(pending, self.__pending.get(moment_key, {}))
+                if retry_until is not None:
+                    self.__retry_until[moment_key] = retry_until
+                raise
+            if moment_key not in self.__pending:
+                self.__documents.pop(moment_key, None)
+            self.written_through += 1
+            return result
+
+
+    async def flush(self) -> None:
+        """
+        Write every pending update with one bulk_write.
+        NOTE: Updates of moment details which do not exist are dropped. Failed writes are reported to Sentry and
+            buffered again, only the failed operations of a BulkWriteError.
+        """
+        async with self.__get_flush_lock():
+            if not self.__pending:
+                return
+            writes, pending_since = self.__pending, self.__pending_since
+            self.__pending, self.__pending_since = {}, None
+            self.__in_flight.append(writes)
+            requests = [
+                UpdateOne({"user_id": user_id, "moment_date": moment_date, "local_time": local_time}, {"$set": fields})
+                for (user_id, moment_date, local_time), fields in writes.items()
+            ]
+            moment_keys = list(writes)
+            failed_keys = moment_keys # Also buffered again if the flush is cancelled while it is written
+            try:
+                _ = await db['moment_detail'].bulk_write(requests, ordered = False)
+                failed_keys = []
+            except BulkWriteError as e:
+                sentry_sdk.capture_exception(e)
+                failed_keys = [moment_keys[error['index']] for error in e.details.get('writeErrors', [])]
+            except Exception as e:
+                sentry_sdk.capture_exception(e)
+            finally:
+                self.__in_flight.remove(writes)
+                self.__written(writes, set(moment_keys) - set(failed_keys))
+                if failed_keys:
+                    self.__requeue({moment_key: writes[moment_key] for moment_key in failed_keys}, pending_since)
+            self.flushes += 1
+            self.writes += len(requests) - len(failed_keys)
+            if failed_keys:
+                self.errors += 1
+            else:
+                self.__failed_flushes = 0
+                self.__latencies.append(time.monotonic() - pending_since)
+
+
+    async def close(self, timeout_seconds: float = MOMENT_DETAIL_WRITE_BEHIND_CLOSE_TIMEOUT_SECONDS) -> None:
+        """
+        Flush the pending writes, retrying the failed ones for at most timeout_seconds.
+        NOTE: The writes which are still pending after it are reported to Sentry with their fields.
+        """
+        if self.__flush_task is not None:
+            self.__flush_task.cancel()
+            self.__flush_task = None
+        deadline = time.monotonic() + timeout_seconds
+        await self.flush()
+        while self.__pending and time.monotonic() < deadline:
+            await asyncio.sleep(min(max(self.__retry_at - time.monotonic(), 0), max(deadline - time.monotonic(), 0)))
+            await self.flush()
+        if self.__flush_task is not None:
+            self.__flush_task.cancel()
+            self.__flush_task = None
+        for moment_key, fields in self.__pending.items():
+            self.__report_dropped(moment_key, fields, 'the server shut down')
+        self.__pending, self.__retry_until, self.__documents = {}, {}, {}
+
+
+    def discard_documents(self) -> None:
+        """
+        Forget the last known moment details, e.g. after a write which did not go through the buffer.
+        """
+        self.__documents = {}
+
+
+    def __get_flush_lock(self) -> asyncio.Lock:
+        if self.__flush_lock is None: # Created lazily so that it belongs to the event loop of the server
+            self.__flush_lock = asyncio.Lock()
+        return self.__flush_lock
+
+
+    def __written(self, writes: Dict[MomentKey, dict], moment_keys: set) -> None:
+        # Keep the known moment details up to date with the written fields while the moment has other pending writes
+        for moment_key in moment_keys:
+            self.__retry_until.pop(moment_key, None)
+            if moment_key in self.__documents:
+                if moment_key in self.__pending or any(moment_key in writes for writes in self.__in_flight):
+                    apply_fields(self.__documents[moment_key], writes[moment_key])
+                else:
+                    del self.__documents[moment_key]
+
+
+    def __requeue(self, writes: Dict[MomentKey, dict], pending_since: float) -> None:
+        # The failed writes are older than the pending ones, so the pending fields win
+        now = time.monotonic()
+        for moment_key, fields in writes.items():
+            retry_until = self.__retry_until.setdefault(moment_key, now + self.retry_timeout_seconds)
+            if now >= retry_until:
+                self.__report_dropped(moment_key, fields, f'{self.retry_timeout_seconds} seconds of retries')
+                del self.__retry_until[moment_key]
+                if moment_key not in self.__pending:
+                    self.__documents.pop(moment_key, None)
+                continue
+            self.__pending[moment_key] = merge_fields(fields, self.__pending.get(moment_key, {}))
+            self.retried += 1
+        self.__failed_flushes += 1
+        self.__retry_at = now + min(self.retry_seconds * 2 ** (self.__failed_flushes - 1), self.max_retry_seconds)
+        if not self.__pending:
+            return
+        self.__pending_since = min(pending_since, self.__pending_since or pending_since)
+        if self.__flush_task is None:
+            self.__flush_task = asyncio.create_task(self.__flush_later())
+
+
+    def __report_dropped(self, moment_key: MomentKey, fields: dict, reason: str) -> None:
+        # The update was acknowledged to the client, so its fields are kept in Sentry to be written again by hand
+        sentry_sdk.capture_message(
+            f'Dropped the buffered update of moment detail {moment_key} after {reason}', level = 'error',
+            extras = {'moment_detail_key': dict(zip(['user_id', 'moment_date', 'local_time'], moment_key)), 'fields': fields}
+        )
+        self.dropped += 1
+
+
+    def stats(self) -> dict:
+        latencies = sorted(self.__latencies)
+        return {
+            "enabled": self.enabled,
+            "window_seconds": self.window_seconds,
+            "max_size": self.max_size,
+            "pending": len(self.__pending),
+            "retrying": len(self.__retry_until), # Moments whose writes failed and wait for a retry
+            "updates": self.updates,
+            "writes": self.writes, # Updates of the same moment in a window are coalesced into one write
+            "flushes": self.flushes,
+            "errors": self.errors, # Flushes with at least one failed write
+            "retried": self.retried,
+            "written_through": self.written_through, # Updates written directly while failed writes were waiting
+            "dropped": self.dropped, # Failed writes given up on, reported to Sentry with their fields
+            "flush_latency_p50": latencies[len(latencies) // 2] if latencies else None,
+            "flush_latency_p95": latencies[int(len(latencies) * 0.95)] if latencies else None,
+            "flush_latency_max": latencies[-1] if latencies else None,
+        }
+
+
+    async def __flush_later(self) -> None:
+        try:
+            await asyncio.sleep(max(self.window_seconds, self.__retry_at - time.monotonic()))
+            self.__flush_task = None
+            await self.flush()
+        except Exception as e:
+            sentry_sdk.capture_exception(e)
+
+
+moment_detail_write_buffer = MomentDetailWriteBuffer()
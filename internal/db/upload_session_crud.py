@@ -0,0 +1,113 @@
+from datetime import datetime
+from typing import List, Union
+from uuid import uuid4
+from pymongo import ReturnDocument
+from schemas.db_schemas import UploadSession
+import sentry_sdk
+import connectors
+
+
+db = connectors.mongodb_client['stress_lifelog']
+
+
+async def insert_upload_session(user_id: str, file_name: str, file_path_template: str, size: int, 
+                                sha256: Union[str, None] = None) -> Union[None, dict]:
+    """
+    Create a new resumable upload session.
+    NOTE: file_path_template is formatted with the session id to get the path of the file receiving the chunks.
+        Refer to the UploadSession in the folder schemas for the required fields.
+    """
+
+    session_id = uuid4().hex
+    now = datetime.utcnow()
+    upload_session = UploadSession(
+        id = session_id,
+        user_id = user_id,
+        file_name = file_name,
+        file_path = file_path_template.format(session_id = session_id),
+        size = size,
+        sha256 = sha256,
+        created_at = now,
+        updated_at = now,
+    )
+    upload_session = upload_session.dict(by_alias = True)
+
+    try:
+        _ = await db['upload_sessions'].insert_one(upload_session)
+    except Exception as e:
+        sentry_sdk.capture_exception(e)
+        return None
+    return upload_session
+
+
+async def insert_received_range(session_id: str, start: int, end: int) -> bool:
+    """
+    Record that the bytes [start, end) of an open upload session were received.
+    NOTE: Ranges are pushed atomically so that chunks can be sent concurrently. They are merged when read.
+    """
+    try:
+        result = await db['upload_sessions'].update_one(
+            {"_id": session_id, "status": "open"},
+            {"$push": {"received": [start, end]}, "$set": {"updated_at": datetime.utcnow()}},
+        )
+    except Exception as e:
+        sentry_sdk.capture_exception(e)
+        return False
+    return result.matched_count == 1
+
+
+async def get_upload_session(session_id: str) -> Union[None, dict]:
+    """
+    Get an upload session.
+    """
+    try:
+        upload_session = await db['upload_sessions'].find_one({"_id": session_id})
+    except Exception as e:
+        sentry_sdk.capture_exception(e)
+        return None
+    return upload_session
+
+
+async def update_upload_session_status(session_id: str, from_status: str, to_status: str, 
+                                      updated_before: Union[datetime, None] = None) -> Union[None, dict]:
+    """
+    Atomically move an upload session from a status to another one, e.g. to finalize it only once.
+    NOTE: Returns None if the session was not in from_status, or was updated since updated_before when it is given.
+    """
+    query = {"_id": session_id, "status": from_status}
+    if updated_before is not None:
+        query["updated_at"] = {"$lt": updated_before}
+    try:
+        upload_session = await db['upload_sessions'].find_one_and_update(
+            query,
+            {"$set": {"status": to_status, "updated_at": datetime.utcnow()}},
+            return_document = ReturnDocument.AFTER,
+        )
+    except Exception as e:
+        sentry_sdk.capture_exception(e)
+        return None
+    return upload_session
+
+
+async def get_abandoned_upload_sessions(updated_before: datetime, status: str = 'open') -> List[dict]:
+    """
+    Get the upload sessions in status (open by default) which were not updated since updated_before.
+    """
+    try:
+        upload_sessions = await db['upload_sessions'].find(
+            {"status": status, "updated_at": {"$lt": updated_before}}, 
+            {"file_path": 1}
+        ).to_list(length = None)
+    except Exception as e:
+        sentry_sdk.capture_exception(e)
+        return []
+    return upload_sessions
+
+
+async def delete_upload_session(session_id: str) -> bool:
+    try:
+        _ = await db['upload_sessions'].delete_one({"_id": session_id})
+    except Exception as e:
+        sentry_sdk.capture_exception(e)
+        return False
+    return True
@@ -1,9 +1,10 @@
-from typing import List
+from typing import List, Union
 from datetime import date
 from fastapi.encoders import jsonable_encoder
 from schemas.db_schemas import (
     UserModel
 )
+from pymongo import UpdateOne, ReturnDocument
 import sentry_sdk
 import connectors
 
@@ -11,11 +12,12 @@ import connectors
 db = connectors.mongodb_client['stress_lifelog']
 
 
-async def insert_user(user_id: str, dates: List[date]) -> bool:
+async def insert_user(user_id: str, dates: List[date]) -> Union[None, UserModel]:
 
     """
     Insert a new user into the database.
     NOTE: Refer to the UserModel in the folder schemas for the required fields.
+        Returns the inserted user, or None if it could not be inserted.
     """
 
     request = {
@@ -29,25 +31,49 @@ async def insert_user(user_id: str, dates: List[date]) -> bool:
     try:
         _ = await db['users'].insert_one(user)
     except Exception as e: 
+        sentry_sdk.capture_exception(e)
+        return None
+    return user
+
+
+async def insert_users(user_ids: List[str]) -> bool:
+
+    """
+    Insert many new users without any date into the database in one batched write.
+    NOTE: Users which already exist are left untouched.
+    """
+
+    if not user_ids:
+        return True
+    requests = [UpdateOne({"_id": user_id}, {"$setOnInsert": {"dates": []}}, upsert = True) for user_id in user_ids]
+    try:
+        _ = await db['users'].bulk_write(requests, ordered = False)
+    except Exception as e:
         sentry_sdk.capture_exception(e)
         return False
     return True
 
 
-async def insert_dates_to_user(user_id: str, dates: List[date]) -> bool:
+async def insert_dates_to_user(user_id: str, dates: List[date]) -> Union[None, UserModel]:
 
     """
     Append a list of dates to the pre-existsing user's list of dates.
     NOTE: Refer to the UserModel in the folder schemas for the required fields.
+        Returns the user after the write, in the same round trip, or None if the write failed.
     """
 
     try:
         # Insert a list of dates to the end of the list of dates for the user
-        _ = await db['users'].update_many({"_id": user_id, }, {"$addToSet": {"dates": {"$each": dates }}}, upsert = True) 
+        user = await db['users'].find_one_and_update(
+            {"_id": user_id}, 
+            {"$addToSet": {"dates": {"$each": dates }}}, 
+            upsert = True,
+            return_document = ReturnDocument.AFTER
+        )
     except Exception as e:
         sentry_sdk.capture_exception(e)
-        return False
-    return True
+        return None
+    return user
 
 
 async def get_dates_from_user(user_id: str) -> UserModel:
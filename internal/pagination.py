@@ -0,0 +1,27 @@
+import base64
+import json
+from typing import Any, List
+
+
+class InvalidCursorError(ValueError):
+    pass
+
+
+def encode_cursor(values: List[Any]) -> str:
+    """
+    Encode the sort key of the last item of a page into an opaque cursor.
+    """
+    return base64.urlsafe_b64encode(json.dumps(values, separators = (',', ':')).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor: str) -> List[Any]:
+    """
+    Decode a cursor created by encode_cursor. Raises InvalidCursorError if it was not.
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except Exception:
+        raise InvalidCursorError(f'Invalid cursor: {cursor}')
+    if not isinstance(values, list):
+        raise InvalidCursorError(f'Invalid cursor: {cursor}')
+    return values
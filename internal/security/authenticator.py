@@ -1,53 +1,83 @@
-from passlib.context import CryptContext
+from fastapi.concurrency import run_in_threadpool
 from schemas.security_schemas import UserInDB
 from sql_app.dependencies import sqlalchemy_session
+from connectors import async_sqlalchemy_session
 from sqlalchemy.orm import Session
+from typing import Union
 from sql_app import crud
+from internal.security.hash_generator import get_crypt_context
+from internal.security.hashing_pool import HashingPool, hashing_pool as default_hashing_pool
+from internal.security.session_cache import SessionCache, session_cache as default_session_cache
 from datetime import datetime
 import sentry_sdk
 
 
 class Authenticator:
 
-    def __init__(self, algorithm: str):
-        self.pwd_context = CryptContext(schemes=[algorithm], deprecated='auto')
+    def __init__(self, algorithm: str, session_cache: SessionCache = default_session_cache, hashing_pool: HashingPool = default_hashing_pool):
+        self.algorithm = algorithm
+        self.pwd_context = get_crypt_context(algorithm)
+        self.session_cache = session_cache
+        self.hashing_pool = hashing_pool
 
 
-    def authenticate(self, username: str, password: str) -> bool:
-        user = self.__get_user(username)
-        if not user or not self.__verify_password(password, user.hashed_password):
+    async def authenticate(self, username: str, password: str) -> bool:
+        """
+        Check the password of the user.
+        NOTE: The user lookup runs in the threadpool and the password verification in the hashing pool,
+            so a login never blocks the event loop. Raises HashingPoolBusyError if the hashing pool is full.
+        """
+        user = await run_in_threadpool(self.__get_user, username)
+        if not user:
             return False
-        return True
+        return await self.hashing_pool.verify(self.algorithm, password, user.hashed_password)
 
 
-    def verify_user(self, username: str, db: Session = sqlalchemy_session()) -> bool:
+    def verify_user(self, username: str, db: Union[Session, None] = None) -> bool:
         """
         Check if the user is actually in the database
         """
+        if db is None:
+            with sqlalchemy_session() as db:
+                return self.verify_user(username, db)
         try:
             user = crud.get_user(db, username=username) 
-            db.close()
         except Exception as e:
             sentry_sdk.capture_exception(e)
-            db.close()
             return False
         return user is not None
 
     
-    def verify_user_time_info(self, username: str, iat: int, db: Session = sqlalchemy_session()) -> bool:
+    def verify_user_time_info(self, username: str, iat: int, db: Union[Session, None] = None) -> bool:
         """
         Check if the issue time of the token is valid
         """
+        if db is None:
+            with sqlalchemy_session() as db:
+                return self.verify_user_time_info(username, iat, db)
         try:
             user = crud.get_user_expiration_time(db, username = username)
-            db.close()
             return user.iat == iat
         except Exception as e:
             sentry_sdk.capture_exception(e)
-            db.close()
             return False
 
 
+    async def verify_user_session(self, username: str, iat: int) -> bool:
+        """
+        Check if the user is in the database and the issue time of the token is valid.
+        NOTE: Both checks are served from the session cache when possible. On a miss they are done with
+            a single query, through the async engine if available or in the threadpool otherwise,
+            to keep the event loop free. A cached entry which rejects the token is treated as a miss,
+            as the token may have been issued by another worker after the entry was cached.
+        """
+        session_info = self.session_cache.get(username)
+        if session_info is not None and self.__is_valid_session(session_info, iat):
+            return True
+        session_info = await self.__load_session_info(username)
+        return session_info is not None and self.__is_valid_session(session_info, iat)
+
+
     def verify_expiration_time(self, exp: int):
         """"
         Check if the expiration time of the token is valid
@@ -55,15 +85,49 @@ class Authenticator:
         return exp > datetime.utcnow().timestamp()
 
 
-    def __get_user(self, username: str, db: Session = sqlalchemy_session()):
+    def __get_user(self, username: str):
+        user = None
+        with sqlalchemy_session() as db: # A session per call as this runs concurrently in the threadpool
+            try:
+                user = crud.get_user_in_db(db, username=username)
+            except Exception as e:
+                sentry_sdk.capture_exception(e)
+        return user
+
+
+    async def __load_session_info(self, username: str):
+        # Query the session of the user and refresh its cache entry
+        cache_version = self.session_cache.version()
         try:
-            user = crud.get_user_in_db(db, username=username)
-            db.close()
+            if async_sqlalchemy_session is not None:
+                session_info = await self.__async_get_user_session_info(username)
+            else:
+                session_info = await run_in_threadpool(self.__get_user_session_info, username)
         except Exception as e:
             sentry_sdk.capture_exception(e)
-            db.close()
-        return user
+            return None
+        self.session_cache.put(username, session_info, cache_version)
+        return session_info
+
+
+    def __is_valid_session(self, session_info, iat: int) -> bool:
+        exists, session_iat, _ = session_info
+        return exists and session_iat == iat
+
+
+    def __get_user_session_info(self, username: str):
+        with sqlalchemy_session() as db:
+            session_info = crud.get_user_session_info(db, username = username)
+        return self.__to_session_cache_entry(session_info)
+
+
+    async def __async_get_user_session_info(self, username: str):
+        async with async_sqlalchemy_session() as db:
+            session_info = await crud.async_get_user_session_info(db, username = username)
+        return self.__to_session_cache_entry(session_info)
 
 
-    def __verify_password(self, plain_password: str, hashed_password: str) -> bool:
-        return self.pwd_context.verify(plain_password, hashed_password)
\ No newline at end of file
+    def __to_session_cache_entry(self, session_info):
+        if session_info is None:
+            return (False, None, None)
+        return (True, session_info.iat, session_info.exp)
\ No newline at end of file
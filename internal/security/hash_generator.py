@@ -1,11 +1,34 @@
+from functools import lru_cache
+from typing import List
 from passlib.context import CryptContext
 
 
+@lru_cache(maxsize = None)
+def get_crypt_context(algorithm: str) -> CryptContext:
+    """
+    Build the CryptContext of an algorithm once per process and reuse it afterwards.
+    """
+    return CryptContext(schemes=[algorithm], deprecated='auto')
+
+
+def hash_string(algorithm: str, string: str) -> str:
+    return get_crypt_context(algorithm).hash(string)
+
+
+def hash_string_list(algorithm: str, strings: List[str]) -> List[str]:
+    pwd_context = get_crypt_context(algorithm)
+    return [pwd_context.hash(string) for string in strings]
+
+
+def verify_string(algorithm: str, string: str, hashed_string: str) -> bool:
+    return get_crypt_context(algorithm).verify(string, hashed_string)
+
+
 class HashGenerator:
 
     def __init__(self, algorithm: str):
-        self.pwd_context = CryptContext(schemes=[algorithm], deprecated='auto')
+        self.pwd_context = get_crypt_context(algorithm)
 
 
     def hash_string(self, string: str) -> str:
-        return self.pwd_context.hash(string)
\ No newline at end of file
+        return self.pwd_context.hash(string)
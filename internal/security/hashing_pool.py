@@ -0,0 +1,83 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Union
+from constants.security_settings import (
+    PASSWORD_HASH_POOL_WORKERS,
+    PASSWORD_HASH_POOL_MAX_PENDING,
+    PASSWORD_HASH_LIST_MAX_SIZE,
+    PASSWORD_HASH_LIST_CHUNK_SIZE,
+)
+from internal.security.hash_generator import hash_string, hash_string_list, verify_string
+
+
+class HashingPoolBusyError(Exception):
+    """
+    Raised when too many hashing jobs are already waiting for the pool.
+    """
+    pass
+
+
+class HashingPool:
+    """
+    Bounded process pool which runs password hashing and verification off the event loop.
+    NOTE: The worker functions build their CryptContext once per worker process.
+        Submissions are rejected with HashingPoolBusyError once max_pending jobs are in flight.
+    """
+
+    def __init__(self, max_workers: int = PASSWORD_HASH_POOL_WORKERS, max_pending: int = PASSWORD_HASH_POOL_MAX_PENDING):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self.__executor: Union[ProcessPoolExecutor, None] = None
+
+
+    async def hash_string(self, algorithm: str, string: str) -> str:
+        return await self.__submit(hash_string, algorithm, string)
+
+
+    async def hash_string_list(self, algorithm: str, strings: List[str]) -> List[str]:
+        """
+        Hash many strings in parallel by splitting them into small jobs, at most one per worker process at a time.
+        NOTE: Every job counts as a pending job, and other hashing jobs (e.g. logins) only wait for the running ones.
+            Raises ValueError for more than PASSWORD_HASH_LIST_MAX_SIZE strings.
+        """
+        if len(strings) > PASSWORD_HASH_LIST_MAX_SIZE:
+            raise ValueError(f'At most {PASSWORD_HASH_LIST_MAX_SIZE} strings can be hashed at once')
+        chunks = [strings[i:i + PASSWORD_HASH_LIST_CHUNK_SIZE] for i in range(0, len(strings), PASSWORD_HASH_LIST_CHUNK_SIZE)]
+        hashed_chunks = []
+        for i in range(0, len(chunks), self.max_workers):
+            hashed_chunks += await asyncio.gather(*[
+                self.__submit(hash_string_list, algorithm, chunk) for chunk in chunks[i:i + self.max_workers]
+            ])
+        return [hashed_string for hashed_chunk in hashed_chunks for hashed_string in hashed_chunk]
+
+
+    async def verify(self, algorithm: str, string: str, hashed_string: str) -> bool:
+        return await self.__submit(verify_string, algorithm, string, hashed_string)
+
+
+    def shutdown(self) -> None:
+        if self.__executor is not None:
+            self.__executor.shutdown(wait = True)
+            self.__executor = None
+
+
+    async def __submit(self, function, *args):
+        if self.pending >= self.max_pending:
+            raise HashingPoolBusyError(f'{self.pending} hashing jobs are already pending')
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.__get_executor(), function, *args)
+        finally:
+            self.pending -= 1
+
+
+    def __get_executor(self) -> ProcessPoolExecutor:
+        # Created lazily so that importing this module does not spawn processes
+        if self.__executor is None:
+            self.__executor = ProcessPoolExecutor(max_workers = self.max_workers)
+        return self.__executor
+
+
+hashing_pool = HashingPool()
@@ -0,0 +1,97 @@
+from typing import Callable, List, Tuple, Union
+from collections import OrderedDict
+from threading import Lock
+from constants.token_configuration import SESSION_CACHE_MAX_SIZE, SESSION_CACHE_TTL_SECONDS
+import time
+import sentry_sdk
+
+
+SessionInfo = Tuple[bool, Union[int, None], Union[int, None]] # (exists, iat, exp)
+
+
+class SessionCache:
+    """
+    Bounded LRU cache with TTL of username -> (exists, iat, exp) for verified sessions.
+    NOTE: Entries are invalidated locally when a new token is issued. Register an invalidation hook
+        (e.g. a Redis/Mongo publisher) to propagate invalidations to the other uvicorn workers,
+        which then call invalidate(username, propagate = False) on their own cache.
+        The TTL bounds how stale an entry can be if an invalidation is missed, and entries which reject
+        a token are checked again against the database before the token is refused.
+    """
+
+    def __init__(self, max_size: int = SESSION_CACHE_MAX_SIZE, ttl_seconds: float = SESSION_CACHE_TTL_SECONDS):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.__entries = OrderedDict()
+        self.__version = 0 # Bumped on every invalidation so that in-flight lookups do not re-insert stale entries
+        self.__lock = Lock()
+        self.__invalidation_hooks: List[Callable[[str], None]] = []
+
+
+    def get(self, username: str) -> Union[SessionInfo, None]:
+        with self.__lock:
+            entry = self.__entries.get(username)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self.__entries[username]
+                self.misses += 1
+                return None
+            self.__entries.move_to_end(username)
+            self.hits += 1
+            return entry[1]
+
+
+    def version(self) -> int:
+        return self.__version
+
+
+    def put(self, username: str, session_info: SessionInfo, version: Union[int, None] = None) -> None:
+        with self.__lock:
+            if version is not None and version != self.__version:
+                return
+            self.__entries[username] = (time.monotonic() + self.ttl_seconds, session_info)
+            self.__entries.move_to_end(username)
+            while len(self.__entries) > self.max_size:
+                self.__entries.popitem(last = False)
+
+
+    def invalidate(self, username: str, propagate: bool = True) -> None:
+        with self.__lock:
+            self.__entries.pop(username, None)
+            self.__version += 1
+        if not propagate:
+            return
+        for hook in self.__invalidation_hooks:
+            try:
+                hook(username)
+            except Exception as e:
+                sentry_sdk.capture_exception(e)
+
+
+    def add_invalidation_hook(self, hook: Callable[[str], None]) -> None:
+        """
+        Register a callable which is called with the username whenever an entry is invalidated locally.
+        """
+        self.__invalidation_hooks.append(hook)
+
+
+    def clear(self) -> None:
+        with self.__lock:
+            self.__entries.clear()
+            self.__version += 1
+
+
+    def stats(self) -> dict:
+        with self.__lock:
+            return {
+                "size": len(self.__entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+session_cache = SessionCache()
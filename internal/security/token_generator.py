@@ -2,16 +2,18 @@ from typing import Union
 from datetime import timedelta, datetime
 from schemas.security_schemas import Token
 from sql_app.dependencies import sqlalchemy_session
-from sqlalchemy.orm import Session
 from sql_app import crud
+from internal.security.session_cache import SessionCache, session_cache as default_session_cache
 from jose import jwt
+import sentry_sdk
 
 
 class TokenGenerator:
 
-    def __init__(self, secret_key: str, algorithm: str):
+    def __init__(self, secret_key: str, algorithm: str, session_cache: SessionCache = default_session_cache):
         self.algorithm = algorithm
         self.secret_key = secret_key
+        self.session_cache = session_cache
 
 
     def __create_token(self, data: dict):
@@ -19,7 +21,8 @@ class TokenGenerator:
         return encoded_jwt
 
 
-    def create_authentication_token(self, data: dict, expires_delta: Union[timedelta, None] = None) -> Token:
+    def create_authentication_token(self, data: dict, expires_delta: Union[timedelta, None] = None, 
+                                    refresh_expires_delta: Union[timedelta, None] = None) -> Token:
         to_encode = data.copy()
         iat = datetime.utcnow()
         if expires_delta:
@@ -33,24 +36,31 @@ class TokenGenerator:
         })
 
         self.__insert_token_payload_to_db(to_encode)
+
+        refresh_to_encode = to_encode.copy()
+        if refresh_expires_delta:
+            refresh_to_encode.update({"exp": int((iat + refresh_expires_delta).timestamp())})
         
         tokens = Token(
             access_token = self.__create_access_token(to_encode),
-            refresh_token = self.__create_refresh_token(to_encode),
+            refresh_token = self.__create_refresh_token(refresh_to_encode),
         )
 
         return tokens
 
     
-    def __insert_token_payload_to_db(self, data: dict, db: Session = sqlalchemy_session()):
+    def __insert_token_payload_to_db(self, data: dict):
+        username = data["username"]
         try:
-            if not crud.get_user_expiration_time(db, data["username"]):
-                crud.create_user_in_expiration_time(db, **data)
-            else:
-                crud.update_user_expiration_time_info(db, **data)
-            db.close()
+            with sqlalchemy_session() as db:
+                crud.upsert_user_expiration_time(db, **data) # A single write whether or not the user already had a token
         except Exception as e:
-            db.close()
+            sentry_sdk.capture_exception(e)
+            self.session_cache.invalidate(username)
+            return
+        # The cached iat of the previous token is no longer valid, the new one can be served right away
+        self.session_cache.invalidate(username)
+        self.session_cache.put(username, (True, data["iat"], data["exp"]), self.session_cache.version())
 
 
     def __create_access_token(self, data: dict):
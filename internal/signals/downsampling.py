@@ -0,0 +1,55 @@
+import numpy as np
+from internal.signals.e4 import Signal
+
+
+DOWNSAMPLING_METHODS = ['minmax', 'lttb']
+
+
+def downsample_minmax(signal: Signal, points: int) -> Signal:
+    """
+    Keep the minimum and the maximum of points // 2 buckets of consecutive samples, in time order.
+    NOTE: Peaks are never lost, which matters for EDA responses and BVP beats.
+    """
+    size = len(signal.values)
+    buckets = max(1, points // 2)
+    if size <= points:
+        return signal
+    bucket_size = -(-size // buckets)
+    # Pad with the last sample so that the samples reshape into full buckets
+    padded = np.pad(signal.values, (0, buckets * bucket_size - size), mode = 'edge').reshape(buckets, bucket_size)
+    offsets = np.arange(buckets) * bucket_size
+    minimums = np.minimum(offsets + padded.argmin(axis = 1), size - 1)
+    maximums = np.minimum(offsets + padded.argmax(axis = 1), size - 1)
+    indices = np.unique(np.concatenate((minimums, maximums)))
+    return Signal(signal.timestamps[indices], signal.values[indices])
+
+
+def downsample_lttb(signal: Signal, points: int) -> Signal:
+    """
+    Largest-Triangle-Three-Buckets: keep the sample of every bucket which forms the largest triangle with the
+    sample kept in the previous bucket and the average of the next bucket.
+    NOTE: Loops over the buckets, every bucket is processed with NumPy.
+    """
+    size = len(signal.values)
+    if size <= points or points < 3:
+        return signal
+    x, y = signal.timestamps, signal.values
+    # The first and the last samples are always kept, the others are split into points - 2 buckets
+    edges = (np.linspace(1, size - 1, points - 1)).astype(np.int64)
+    indices = np.empty(points, dtype = np.int64)
+    indices[0], indices[-1] = 0, size - 1
+    previous = 0
+    for bucket in range(points - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_start, next_end = end, (edges[bucket + 2] if bucket + 2 < len(edges) else size)
+        next_x, next_y = x[next_start:next_end].mean(), y[next_start:next_end].mean()
+        areas = np.abs((x[previous] - next_x) * (y[start:end] - y[previous]) - (x[previous] - x[start:end]) * (next_y - y[previous]))
+        previous = start + int(areas.argmax())
+        indices[bucket + 1] = previous
+    return Signal(x[indices], y[indices])
+
+
+def downsample(signal: Signal, points: int, method: str = 'minmax') -> Signal:
+    if method == 'lttb':
+        return downsample_lttb(signal, points)
+    return downsample_minmax(signal, points)
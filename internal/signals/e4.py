@@ -0,0 +1,68 @@
+import os
+import zipfile
+from pathlib import Path
+from typing import Dict, List, NamedTuple
+import numpy as np
+import pandas as pd
+from constants.signal_configuration import E4_SIGNAL_FILES, E4_IBI_FILE, E4_IBI_FIELD
+from internal.transfer.archive import select_archive_members
+
+
+class Signal(NamedTuple):
+    timestamps: np.ndarray # UTC unix seconds, sorted
+    values: np.ndarray
+
+
+def is_e4_signal_file(name: str) -> bool:
+    return os.path.basename(name) in E4_SIGNAL_FILES or os.path.basename(name) == E4_IBI_FILE
+
+
+def read_e4_signal_file(file) -> Signal:
+    """
+    Read a single-channel E4 CSV: the start time (UTC unix seconds), the sample rate (Hz), then one sample per row.
+    """
+    frame = pd.read_csv(file, header = None, usecols = [0], dtype = np.float64)
+    start, sample_rate = frame.iat[0, 0], frame.iat[1, 0]
+    values = frame.iloc[2:, 0].to_numpy()
+    timestamps = start + np.arange(len(values)) / sample_rate
+    return Signal(timestamps, values)
+
+
+def read_e4_ibi_file(file) -> Signal:
+    """
+    Read the E4 IBI CSV: the start time (UTC unix seconds) and 'IBI', then one (offset in seconds, interval in seconds) per beat.
+    """
+    frame = pd.read_csv(file, header = None, usecols = [0, 1], dtype = {0: np.float64})
+    start = frame.iat[0, 0]
+    beats = frame.iloc[1:].astype(np.float64)
+    return Signal(start + beats[0].to_numpy(), beats[1].to_numpy())
+
+
+def concatenate_signals(signals: List[Signal]) -> Signal:
+    """
+    Join the recordings of the same signal, e.g. one per wristband session, into one signal sorted by time.
+    """
+    timestamps = np.concatenate([signal.timestamps for signal in signals])
+    values = np.concatenate([signal.values for signal in signals])
+    order = np.argsort(timestamps, kind = 'stable')
+    return Signal(timestamps[order], values[order])
+
+
+def load_e4_signals(source: Path) -> Dict[str, Signal]:
+    """
+    Load the E4 signals of an archive without extracting them.
+    NOTE: Returns the physiological field of a moment (heart_rate, bvp, eda, temp) or ibi -> Signal,
+        only for the signals found in the archive.
+    """
+    recordings = {}
+    with zipfile.ZipFile(source, 'r') as zip_ref:
+        for info in select_archive_members(zip_ref, is_e4_signal_file):
+            name = os.path.basename(info.filename)
+            with zip_ref.open(info) as file:
+                if name == E4_IBI_FILE:
+                    field, signal = E4_IBI_FIELD, read_e4_ibi_file(file)
+                else:
+                    field, signal = E4_SIGNAL_FILES[name], read_e4_signal_file(file)
+            if len(signal.values) > 0:
+                recordings.setdefault(field, []).append(signal)
+    return {field: concatenate_signals(signals) for field, signals in recordings.items()}
@@ -0,0 +1,110 @@
+import asyncio
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+from typing import List, Union
+import sentry_sdk
+from fastapi.encoders import jsonable_encoder
+from constants.signal_configuration import FEATURE_WORKERS, SIGNAL_STORAGE_FOLDER
+from schemas.db_schemas import MomentDetailId
+from internal.signals.features import compute_day_features, get_feature_version
+from internal.signals.store import SIGNAL_FIELDS, get_signal_day_path
+from internal.transfer.archive import parse_moment_times
+from internal.db.moment_annotation_crud import get_moments_by_date
+from internal.db.moment_detail_annotation_crud import set_moment_details
+from internal.db.feature_run_crud import get_feature_fingerprints, set_feature_fingerprint
+
+
+def get_signal_store_dates(user_data_path: str) -> List[str]:
+    signal_path = os.path.join(user_data_path, SIGNAL_STORAGE_FOLDER)
+    if not os.path.isdir(signal_path):
+        return []
+    return sorted(os.listdir(signal_path))
+
+
+def get_day_fingerprint(user_data_path: str, _date: str, moment_list: List[str]) -> str:
+    """
+    Fingerprint the inputs of the features of a day: the extractor versions, the moments of the day and the stored
+    signals of the day and of its neighbouring days, which the windows of the first and the last moments reach into.
+    """
+    sha1 = hashlib.sha1(get_feature_version().encode())
+    day = date.fromisoformat(_date)
+    for _day in [day - timedelta(days = 1), day, day + timedelta(days = 1)]:
+        for field in SIGNAL_FIELDS:
+            path = get_signal_day_path(user_data_path, _day.isoformat(), field)
+            if os.path.exists(path):
+                file_stat = os.stat(path)
+                sha1.update(f'{_day}/{field}:{file_stat.st_size}:{file_stat.st_mtime_ns};'.encode())
+    sha1.update('\n'.join(sorted(moment_list)).encode())
+    return sha1.hexdigest()
+
+
+class FeatureEngine:
+    """
+    Compute the features of the moments of the user-days whose signals or moments changed, on a process pool.
+    """
+
+    def __init__(self, max_workers: int = FEATURE_WORKERS):
+        self.max_workers = max_workers
+        self.__executor: Union[ProcessPoolExecutor, None] = None
+
+
+    async def update_features(self, user_id: str, user_data_path: str) -> dict:
+        """
+        Compute the features of every day of the signal store of a user whose fingerprint changed since the last run.
+        NOTE: Returns the number of computed and unchanged days.
+        """
+        counters = {'feature_days_computed': 0, 'feature_days_unchanged': 0}
+        fingerprints = await get_feature_fingerprints(user_id)
+        semaphore = asyncio.Semaphore(self.max_workers)
+
+        async def update_day(_date: str):
+            _moments = await get_moments_by_date(user_id, _date)
+            moment_list = _moments['moment_list'] if _moments else []
+            fingerprint = get_day_fingerprint(user_data_path, _date, moment_list)
+            if not moment_list or fingerprints.get(_date) == fingerprint:
+                counters['feature_days_unchanged'] += 1
+                return
+            local_times = parse_moment_times(moment_list).local_times
+            async with semaphore:
+                try:
+                    features = await self.__submit(compute_day_features, user_data_path, _date, local_times)
+                except Exception as e:
+                    sentry_sdk.capture_exception(e)
+                    return
+
+            moment_id_template = jsonable_encoder(MomentDetailId(user_id = user_id, moment_date = _date, local_time = '00:00:00'))
+            moment_details = []
+            for local_time, moment_features in zip(local_times, features):
+                moment_id = moment_id_template.copy()
+                moment_id['local_time'] = local_time
+                moment_details.append({'_id': moment_id, 'features': moment_features})
+            result = await set_moment_details(moment_details)
+            if result['errors'] == 0: # Otherwise the day is computed again next time
+                _ = await set_feature_fingerprint(user_id, _date, fingerprint)
+            counters['feature_days_computed'] += 1
+
+        await asyncio.gather(*[update_day(_date) for _date in get_signal_store_dates(user_data_path)])
+        return counters
+
+
+    def shutdown(self) -> None:
+        if self.__executor is not None:
+            self.__executor.shutdown(wait = True)
+            self.__executor = None
+
+
+    async def __submit(self, function, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.__get_executor(), function, *args)
+
+
+    def __get_executor(self) -> ProcessPoolExecutor:
+        # Created lazily so that importing this module does not spawn processes
+        if self.__executor is None:
+            self.__executor = ProcessPoolExecutor(max_workers = self.max_workers)
+        return self.__executor
+
+
+feature_engine = FeatureEngine()
@@ -0,0 +1,167 @@
+import math
+from typing import Callable, Dict, List, NamedTuple, Tuple, Union
+import numpy as np
+from scipy.signal import butter, find_peaks, sosfiltfilt
+from constants.signal_configuration import (
+    E4_IBI_FIELD,
+    FEATURE_WINDOW_BEFORE_SECONDS,
+    FEATURE_WINDOW_AFTER_SECONDS,
+    EDA_TONIC_CUTOFF_HZ,
+    EDA_SCR_MIN_AMPLITUDE,
+    SIGNAL_MAX_GAP_SECONDS,
+)
+from internal.signals.e4 import Signal
+from internal.signals.windows import get_window_bounds, get_moment_timestamps
+from internal.signals.store import get_local_day_bounds, load_signal_window
+
+
+class FeatureExtractor(NamedTuple):
+    name: str
+    signal: str # Stored signal the extractor reads, e.g. ibi or eda
+    version: int # Bump it when the extractor changes, so that the features of every day are computed again
+    function: Callable[[Signal, np.ndarray], Dict[str, np.ndarray]] # (signal, moment timestamps) -> feature -> value per moment
+
+
+FEATURE_EXTRACTORS: List[FeatureExtractor] = []
+
+
+def feature_extractor(name: str, signal: str, version: int = 1):
+    """
+    Register a feature extractor. It receives the signal around a user-day and the UTC timestamps of its moments,
+    and returns an array with one value per moment (NaN if unknown) for each of its features.
+    """
+    def register(function):
+        FEATURE_EXTRACTORS.append(FeatureExtractor(name, signal, version, function))
+        return function
+    return register
+
+
+def get_feature_version() -> str:
+    return '|'.join(f'{extractor.name}:{extractor.version}' for extractor in FEATURE_EXTRACTORS)
+
+
+def get_window_sums(values: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    prefix_sums = np.concatenate(([0.0], np.cumsum(values)))
+    return prefix_sums[ends] - prefix_sums[starts]
+
+
+def get_feature_windows(timestamps: np.ndarray, centres: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    return get_window_bounds(timestamps, centres, FEATURE_WINDOW_BEFORE_SECONDS, FEATURE_WINDOW_AFTER_SECONDS)
+
+
+def split_at_gaps(signal: Signal) -> List[slice]:
+    # Slices of the continuous recordings of a signal
+    gaps = np.flatnonzero(np.diff(signal.timestamps) > SIGNAL_MAX_GAP_SECONDS) + 1
+    bounds = np.concatenate(([0], gaps, [len(signal.values)]))
+    return [slice(start, end) for start, end in zip(bounds[:-1], bounds[1:])]
+
+
+@feature_extractor('hrv', E4_IBI_FIELD)
+def extract_hrv_features(signal: Signal, centres: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Mean inter-beat interval, mean heart rate, SDNN and RMSSD (ms) of the beats around every moment.
+    NOTE: The wristband drops the beats it can not detect, so only the differences between consecutive detected beats
+        count for the RMSSD.
+    """
+    ibi = signal.values * 1000
+    starts, ends = get_feature_windows(signal.timestamps, centres)
+    counts = ends - starts
+
+    offset = ibi.mean()
+    centred = ibi - offset
+    sums = get_window_sums(centred, starts, ends)
+    square_sums = get_window_sums(centred * centred, starts, ends)
+
+    # Difference i is between beats i and i + 1, it is valid if beat i + 1 directly follows beat i
+    is_consecutive = np.isclose(np.diff(signal.timestamps), signal.values[1:], atol = 0.05)
+    squared_differences = np.where(is_consecutive, np.diff(ibi) ** 2, 0)
+    difference_starts = np.minimum(starts, len(squared_differences))
+    difference_ends = np.maximum(ends - 1, difference_starts)
+    difference_sums = get_window_sums(squared_differences, difference_starts, difference_ends)
+    difference_counts = get_window_sums(is_consecutive.astype(np.float64), difference_starts, difference_ends)
+
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        means = sums / counts
+        mean_ibi = means + offset
+        sdnn = np.sqrt(np.maximum(square_sums / counts - means * means, 0))
+        rmssd = np.sqrt(difference_sums / difference_counts)
+    sdnn[counts < 2] = np.nan
+    return {
+        'hrv_mean_ibi': mean_ibi,
+        'hrv_mean_hr': 60000 / mean_ibi,
+        'hrv_sdnn': sdnn,
+        'hrv_rmssd': rmssd,
+    }
+
+
+def decompose_eda(signal: Signal) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Split the EDA into its tonic (slow) and phasic (fast) components with a zero-phase low-pass filter.
+    """
+    tonic = np.empty_like(signal.values)
+    for segment in split_at_gaps(signal):
+        values = signal.values[segment]
+        timestamps = signal.timestamps[segment]
+        if len(values) < 16: # Too short to filter
+            tonic[segment] = values.mean()
+            continue
+        sample_rate = 1 / np.median(np.diff(timestamps))
+        sos = butter(2, EDA_TONIC_CUTOFF_HZ, output = 'sos', fs = sample_rate)
+        tonic[segment] = sosfiltfilt(sos, values)
+    return tonic, signal.values - tonic
+
+
+def find_scr_peaks(signal: Signal, phasic: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # Timestamps and amplitudes of the skin conductance responses
+    timestamps, amplitudes = [], []
+    for segment in split_at_gaps(signal):
+        peaks, properties = find_peaks(phasic[segment], prominence = EDA_SCR_MIN_AMPLITUDE)
+        timestamps.append(signal.timestamps[segment][peaks])
+        amplitudes.append(properties['prominences'])
+    return np.concatenate(timestamps), np.concatenate(amplitudes)
+
+
+@feature_extractor('eda', 'eda')
+def extract_eda_features(signal: Signal, centres: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Mean tonic and phasic EDA, number and mean amplitude of the skin conductance responses around every moment.
+    """
+    tonic, phasic = decompose_eda(signal)
+    starts, ends = get_feature_windows(signal.timestamps, centres)
+    counts = ends - starts
+
+    peak_timestamps, peak_amplitudes = find_scr_peaks(signal, phasic)
+    peak_starts, peak_ends = get_feature_windows(peak_timestamps, centres)
+    scr_counts = (peak_ends - peak_starts).astype(np.float64)
+
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        tonic_means = get_window_sums(tonic, starts, ends) / counts
+        phasic_means = get_window_sums(phasic, starts, ends) / counts
+        scr_amplitudes = get_window_sums(peak_amplitudes, peak_starts, peak_ends) / scr_counts
+    scr_counts[counts == 0] = np.nan
+    return {
+        'eda_tonic_mean': tonic_means,
+        'eda_phasic_mean': phasic_means,
+        'eda_scr_count': scr_counts,
+        'eda_scr_mean_amplitude': scr_amplitudes,
+    }
+
+
+def compute_day_features(user_data_path: str, _date: str, local_times: List[str]) -> List[Dict[str, Union[float, None]]]:
+    """
+    Run every feature extractor over the stored signals of a user-day. Runs in a worker process.
+    NOTE: Returns the feature map of every moment, None for the features which can not be computed.
+    """
+    centres = get_moment_timestamps(_date, local_times)
+    features = [{} for _ in local_times]
+    start, end = get_local_day_bounds(_date)
+    for extractor in FEATURE_EXTRACTORS:
+        # The windows of the first and the last moments reach into the neighbouring days
+        signal = load_signal_window(user_data_path, extractor.signal,
+                                    start - FEATURE_WINDOW_BEFORE_SECONDS, end + FEATURE_WINDOW_AFTER_SECONDS)
+        if len(signal.values) == 0:
+            continue
+        for name, values in extractor.function(signal, centres).items():
+            for moment_features, value in zip(features, values.tolist()):
+                moment_features[name] = None if math.isnan(value) else value
+    return features
@@ -0,0 +1,110 @@
+import os
+import time
+from typing import Dict, List, Tuple
+import numpy as np
+from constants.signal_configuration import (
+    E4_SIGNAL_FILES,
+    E4_IBI_FIELD,
+    SIGNAL_STORAGE_FOLDER,
+    LIFELOG_UTC_OFFSET_MINUTES,
+    SIGNAL_REPLACE_ATTEMPTS,
+    SIGNAL_REPLACE_RETRY_SECONDS,
+)
+from internal.signals.e4 import Signal, concatenate_signals
+from internal.signals.windows import get_signal_dates
+
+
+SIGNAL_FIELDS = list(E4_SIGNAL_FILES.values()) + [E4_IBI_FIELD]
+
+
+def get_signal_day_path(user_data_path: str, _date: str, field: str) -> str:
+    return os.path.join(user_data_path, SIGNAL_STORAGE_FOLDER, _date, f'{field}.npy')
+
+
+def get_local_day_bounds(_date: str, utc_offset_minutes: int = LIFELOG_UTC_OFFSET_MINUTES) -> Tuple[float, float]:
+    # UTC unix seconds [start, end) of a local date
+    start = np.datetime64(_date, 's').astype(np.int64) - utc_offset_minutes * 60
+    return float(start), float(start + 24 * 60 * 60)
+
+
+def load_signal_day(user_data_path: str, _date: str, field: str, mmap: bool = True) -> Signal:
+    """
+    Load the stored signal of a date, memory-mapped so that only the pages which are read are loaded.
+    NOTE: A memory-mapped file can not be replaced on Windows, so the signals which are written back are loaded with mmap=False.
+    """
+    path = get_signal_day_path(user_data_path, _date, field)
+    if not os.path.exists(path):
+        return Signal(np.empty(0), np.empty(0))
+    rows = np.load(path, mmap_mode = 'r' if mmap else None)
+    return Signal(rows[:, 0], rows[:, 1])
+
+
+def replace_signal_file(tmp_path: str, path: str) -> None:
+    # On Windows the replace fails while a reader has the file memory-mapped, readers only hold it for one request
+    for attempt in range(SIGNAL_REPLACE_ATTEMPTS):
+        try:
+            os.replace(tmp_path, path)
+            return
+        except PermissionError:
+            if attempt == SIGNAL_REPLACE_ATTEMPTS - 1:
+                os.remove(tmp_path)
+                raise
+            time.sleep(SIGNAL_REPLACE_RETRY_SECONDS * 2 ** attempt)
+
+
+def save_signal_day(user_data_path: str, _date: str, field: str, signal: Signal) -> None:
+    """
+    Merge the samples of a date into its stored signal. Samples at an already stored timestamp replace it.
+    """
+    stored = load_signal_day(user_data_path, _date, field, mmap = False)
+    merged = concatenate_signals([stored, signal])
+    # Keep the last sample of every timestamp, i.e. the new one
+    is_last = np.append(merged.timestamps[1:] != merged.timestamps[:-1], True)
+    rows = np.column_stack((merged.timestamps[is_last], merged.values[is_last]))
+
+    path = get_signal_day_path(user_data_path, _date, field)
+    os.makedirs(os.path.dirname(path), exist_ok = True)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as file:
+        np.save(file, rows)
+    replace_signal_file(tmp_path, path) # Readers never see a partially written file
+
+
+def save_signals(user_data_path: str, signals: Dict[str, Signal]) -> List[str]:
+    """
+    Split the signals by local date and merge them into the signal store of the user. Returns the updated dates.
+    """
+    dates = get_signal_dates(signals)
+    for _date in dates:
+        start, end = get_local_day_bounds(_date)
+        for field, signal in signals.items():
+            first, last = np.searchsorted(signal.timestamps, [start, end], side = 'left')
+            if last > first:
+                save_signal_day(user_data_path, _date, field, Signal(signal.timestamps[first:last], signal.values[first:last]))
+    return dates
+
+
+def get_signal_window_slices(user_data_path: str, field: str, start: float, end: float) -> List[Signal]:
+    """
+    Get the samples of a signal in [start, end), in UTC unix seconds, as one memory-mapped slice per stored day.
+    NOTE: The slices are views of the stored files, nothing is copied until they are read.
+    """
+    local_bounds = np.array([start, end]) + LIFELOG_UTC_OFFSET_MINUTES * 60
+    first_date, last_date = local_bounds.astype('datetime64[s]').astype('datetime64[D]')
+    slices = []
+    for _date in np.arange(first_date, last_date + 1):
+        signal = load_signal_day(user_data_path, str(_date), field)
+        first, last = np.searchsorted(signal.timestamps, [start, end], side = 'left')
+        if last > first:
+            slices.append(Signal(signal.timestamps[first:last], signal.values[first:last]))
+    return slices
+
+
+def load_signal_window(user_data_path: str, field: str, start: float, end: float) -> Signal:
+    """
+    Load the samples of a signal in [start, end), in UTC unix seconds, from the stored days.
+    """
+    slices = get_signal_window_slices(user_data_path, field, start, end)
+    if not slices:
+        return Signal(np.empty(0), np.empty(0))
+    return Signal(np.concatenate([part.timestamps for part in slices]), np.concatenate([part.values for part in slices]))
@@ -0,0 +1,97 @@
+from typing import Dict, List, Tuple, Union
+import numpy as np
+from constants.signal_configuration import (
+    E4_SIGNAL_FILES,
+    MOMENT_SIGNAL_WINDOW_BEFORE_SECONDS,
+    MOMENT_SIGNAL_WINDOW_AFTER_SECONDS,
+    LIFELOG_UTC_OFFSET_MINUTES,
+)
+from internal.signals.e4 import Signal
+
+
+def get_window_bounds(timestamps: np.ndarray, centres: np.ndarray, before: float, after: float) -> Tuple[np.ndarray, np.ndarray]:
+    # Sample indices [start, end) of the window around every centre, found with one binary search per bound
+    starts = np.searchsorted(timestamps, centres - before, side = 'left')
+    ends = np.searchsorted(timestamps, centres + after, side = 'left')
+    return starts, ends
+
+
+def compute_window_statistics(signal: Signal, centres: np.ndarray, 
+                              before: float = MOMENT_SIGNAL_WINDOW_BEFORE_SECONDS, 
+                              after: float = MOMENT_SIGNAL_WINDOW_AFTER_SECONDS) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Compute the min, max, mean and std of the samples of a signal in the window around every centre, without a loop over the windows.
+    NOTE: Returns an array of shape (len(centres), 4) and a mask of the windows which contain samples.
+        The statistics of empty windows are 0.
+    """
+    statistics = np.zeros((len(centres), 4))
+    has_samples = np.zeros(len(centres), dtype = bool)
+    if len(signal.values) == 0 or len(centres) == 0:
+        return statistics, has_samples
+
+    starts, ends = get_window_bounds(signal.timestamps, centres, before, after)
+    has_samples = ends > starts
+    if not has_samples.any():
+        return statistics, has_samples
+    starts, ends = starts[has_samples], ends[has_samples]
+    counts = ends - starts
+    # Only the samples covered by a window are summed, e.g. the hours of the day with images
+    first = starts.min()
+    values = signal.values[first:ends.max()]
+    starts, ends = starts - first, ends - first
+
+    # Window sums from prefix sums of the centred values, so that the variance keeps its precision
+    offset = values.mean()
+    centred = values - offset
+    prefix_sums = np.concatenate(([0.0], np.cumsum(centred)))
+    prefix_square_sums = np.concatenate(([0.0], np.cumsum(centred * centred)))
+    means = (prefix_sums[ends] - prefix_sums[starts]) / counts
+    variances = (prefix_square_sums[ends] - prefix_square_sums[starts]) / counts - means * means
+
+    # reduceat over the interleaved bounds: even results are the windows, odd results are the gaps between them
+    bounds = np.column_stack((starts, ends)).ravel()
+    padded_values = np.append(values, values[-1]) # A window may end after the last sample
+    minimums = np.minimum.reduceat(padded_values, bounds)[::2]
+    maximums = np.maximum.reduceat(padded_values, bounds)[::2]
+
+    statistics[has_samples] = np.column_stack((minimums, maximums, means + offset, np.sqrt(np.maximum(variances, 0))))
+    return statistics, has_samples
+
+
+def get_moment_timestamps(_date: str, local_times: List[str], utc_offset_minutes: int = LIFELOG_UTC_OFFSET_MINUTES) -> np.ndarray:
+    # UTC unix seconds of the local times of a date
+    local_datetimes = np.array([f'{_date}T{local_time}' for local_time in local_times], dtype = 'datetime64[s]')
+    return local_datetimes.astype(np.int64).astype(np.float64) - utc_offset_minutes * 60
+
+
+def get_signal_dates(signals: Dict[str, Signal], utc_offset_minutes: int = LIFELOG_UTC_OFFSET_MINUTES) -> List[str]:
+    """
+    Get the local dates covered by any of the signals.
+    """
+    first = min(signal.timestamps[0] for signal in signals.values()) + utc_offset_minutes * 60
+    last = max(signal.timestamps[-1] for signal in signals.values()) + utc_offset_minutes * 60
+    first_date, last_date = np.array([first, last]).astype('datetime64[s]').astype('datetime64[D]')
+    return [str(_date) for _date in np.arange(first_date, last_date + 1)]
+
+
+def compute_moment_physiological_data(signals: Dict[str, Signal], _date: str, local_times: List[str]) -> List[Union[Dict[str, dict], None]]:
+    """
+    Compute the PhysiologicalData of every signal for the moments of a date.
+    NOTE: Returns one dict of field -> PhysiologicalData per moment, or None for the moments without any sample.
+    """
+    centres = get_moment_timestamps(_date, local_times)
+    moment_data = [{} for _ in local_times]
+    has_any_samples = np.zeros(len(local_times), dtype = bool)
+    for field, signal in signals.items():
+        if field not in E4_SIGNAL_FILES.values(): # e.g. the inter-beat intervals
+            continue
+        statistics, has_samples = compute_window_statistics(signal, centres)
+        has_any_samples |= has_samples
+        for data, (min_value, max_value, mean_value, std_value) in zip(moment_data, statistics.tolist()):
+            data[field] = {
+                'min_value': min_value,
+                'max_value': max_value,
+                'mean_value': mean_value,
+                'std_value': std_value,
+            }
+    return [data if has_samples else None for data, has_samples in zip(moment_data, has_any_samples.tolist())]
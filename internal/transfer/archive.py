@@ -0,0 +1,197 @@
+import hashlib
+import os
+import re
+from datetime import datetime
+import zipfile
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Tuple, Union
+import numpy as np
+from constants.transfer_configuration import (
+    ARCHIVE_EXTRACTION_WORKERS,
+    ARCHIVE_MAX_EXTRACTED_SIZE,
+    ARCHIVE_MAX_COMPRESSION_RATIO,
+)
+
+
+IMAGE_EXTENSION = ['.jpg', '.jpeg', '.png']
+DATE_INDEX_IN_NAME = 0
+MOMENT_TIME_PATTERN = re.compile(r'^(?:(?:.*_)?(\d{8})_(\d{6})[^_\n]*|.*)$', re.MULTILINE | re.ASCII) # Matches every line, \d only matches 0-9
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+class ArchiveExtraction(NamedTuple):
+    file_structure: Dict[str, List[str]] # Names of the new and changed images grouped by date
+    images_new: int
+    images_changed: int
+    images_skipped: int
+    index_entries: List[dict] # {path, crc, size, sha1} of the new and changed images
+
+
+class UnsafeArchiveError(Exception):
+    """
+    Raised when an archive contains a member which would be written outside of the destination,
+    or declares sizes which look like a zip bomb.
+    """
+    pass
+
+
+def is_lifelog_image(name: str) -> bool:
+    # Filter only the images from lifelog folder
+    return 'lifelog' in name and \
+        'thumb' not in name and \
+        os.path.splitext(name)[-1].lower() in IMAGE_EXTENSION
+
+
+class MomentTimes(NamedTuple):
+    moments: List[str] # Sorted by time
+    local_times: List[str] # HH:MM:SS of every moment
+    seconds: np.ndarray # Seconds since midnight of every moment
+    unparseable: List[str] # Names without a valid <YYYYmmdd>_<HHMMSS> timestamp
+
+
+def parse_moment_times(moment_list: List[str]) -> MomentTimes:
+    """
+    Parse the local times of the moments of a date in one batch and sort the moments by time.
+    NOTE: The name of a lifelog image ends with _<YYYYmmdd>_<HHMMSS>... Names which do not are returned as
+        unparseable instead of raising. The names are matched with one regex pass over all of them,
+        and the times are decoded and checked as arrays.
+    """
+    unparseable = [moment for moment in moment_list if '\n' in moment] # Would break the one-name-per-line matching
+    names = [moment for moment in moment_list if '\n' not in moment]
+    matches = MOMENT_TIME_PATTERN.findall('\n'.join(names)) if names else []
+
+    # HHMMSS digits of every name, 99 for the names which do not match
+    clock_digits = ''.join(clock or '999999' for _, clock in matches).encode('ascii')
+    digits = (np.frombuffer(clock_digits, dtype = np.uint8) - ord('0')).reshape(-1, 6).astype(np.int32)
+    clock = digits[:, 0::2] * 10 + digits[:, 1::2]
+
+    # Every distinct date is checked once
+    valid_dates = set()
+    for date_string in {date_string for date_string, _ in matches if date_string}:
+        try:
+            _ = datetime.strptime(date_string, '%Y%m%d')
+            valid_dates.add(date_string)
+        except ValueError:
+            pass
+    has_valid_date = np.array([date_string in valid_dates for date_string, _ in matches], dtype = bool)
+    is_valid = has_valid_date & (clock[:, 0] < 24) & (clock[:, 1] < 60) & (clock[:, 2] < 60)
+
+    valid_indices = np.flatnonzero(is_valid)
+    seconds = clock[valid_indices] @ np.array([3600, 60, 1], dtype = np.int32)
+    order = valid_indices[np.argsort(seconds, kind = 'stable')]
+    moments = [names[i] for i in order.tolist()]
+    # HH:MM:SS written from the digits as fixed-width bytes
+    local_time_bytes = np.full((len(order), 8), ord(':'), dtype = np.uint8)
+    local_time_bytes[:, [0, 1, 3, 4, 6, 7]] = digits[order] + ord('0')
+    local_times = local_time_bytes.view('S8').ravel().astype('U8').tolist()
+    unparseable.extend(names[i] for i in np.flatnonzero(~is_valid).tolist())
+    return MomentTimes(moments, local_times, np.sort(seconds, kind = 'stable'), unparseable)
+
+
+def get_member_destination(destination: Path, name: str) -> Path:
+    """
+    Get the path where a member is extracted, refusing absolute paths and paths escaping the destination.
+    """
+    parts = name.replace('\\', '/').split('/')
+    if name.startswith(('/', '\\')) or '..' in parts or ':' in parts[0]:
+        raise UnsafeArchiveError(f'Unsafe path in archive: {name}')
+    member_destination = destination.joinpath(*[part for part in parts if part not in ('', '.')])
+    if os.path.commonpath([os.path.abspath(destination), os.path.abspath(member_destination)]) != os.path.abspath(destination):
+        raise UnsafeArchiveError(f'Unsafe path in archive: {name}')
+    return member_destination
+
+
+def select_archive_members(zip_ref: zipfile.ZipFile, is_member: Callable[[str], bool]) -> List[zipfile.ZipInfo]:
+    """
+    Select the files of an archive whose name matches is_member in a single pass over the central directory.
+    NOTE: The declared sizes are checked before anything is extracted. Raises UnsafeArchiveError.
+    """
+    members = []
+    total_size = 0
+    for info in zip_ref.infolist():
+        if info.is_dir() or not is_member(info.filename):
+            continue
+        if info.compress_size > 0 and info.file_size / info.compress_size > ARCHIVE_MAX_COMPRESSION_RATIO:
+            raise UnsafeArchiveError(f'Suspicious compression ratio for {info.filename}')
+        total_size += info.file_size
+        if total_size > ARCHIVE_MAX_EXTRACTED_SIZE:
+            raise UnsafeArchiveError(f'Archive declares more than {ARCHIVE_MAX_EXTRACTED_SIZE} bytes to extract')
+        members.append(info)
+    return members
+
+
+def select_lifelog_members(zip_ref: zipfile.ZipFile) -> Tuple[List[zipfile.ZipInfo], Dict[str, List[str]]]:
+    """
+    Select the lifelog images of an archive and group their names by date.
+    """
+    members = select_archive_members(zip_ref, is_lifelog_image)
+    file_structure = defaultdict(list)
+    for info in members:
+        file_structure[info.filename.split('/')[DATE_INDEX_IN_NAME]].append(info.filename)
+    for moment_list in file_structure.values():
+        moment_list.sort()
+    return members, file_structure
+
+
+def is_unchanged_image(info: zipfile.ZipInfo, known_image: Union[dict, None]) -> bool:
+    # The CRC and the size come from the central directory, so unchanged images are detected without reading them
+    return known_image is not None and known_image['crc'] == info.CRC and known_image['size'] == info.file_size
+
+
+def extract_members(zip_ref: zipfile.ZipFile, destination: Path, members: List[zipfile.ZipInfo], 
+                    max_workers: int = ARCHIVE_EXTRACTION_WORKERS) -> List[str]:
+    """
+    Extract the given members of an archive in parallel. Returns the SHA-1 of every member, in order.
+    NOTE: The threads share the handle of the archive, which only serialises the reads of the compressed bytes,
+        so that its central directory is loaded once. Decompression, hashing and writing run in parallel.
+    """
+    targets = [(info, get_member_destination(destination, info.filename)) for info in members] # Check every path first
+    for directory in {target.parent for _, target in targets}:
+        os.makedirs(directory, exist_ok = True)
+
+    def extract_member(info: zipfile.ZipInfo, target: Path) -> str:
+        sha1 = hashlib.sha1()
+        # The reader stops at the declared size and checks the CRC, so the declared sizes can be trusted
+        with zip_ref.open(info) as member_file, open(target, 'wb') as target_file:
+            for block in iter(lambda: member_file.read(COPY_BUFFER_SIZE), b''):
+                target_file.write(block)
+                sha1.update(block)
+        return sha1.hexdigest()
+
+    with ThreadPoolExecutor(max_workers = max_workers) as executor:
+        return list(executor.map(lambda target: extract_member(*target), targets))
+
+
+def extract_lifelog_archive(source: Path, destination: Path, known_images: Union[Dict[str, dict], None] = None,
+                            max_workers: int = ARCHIVE_EXTRACTION_WORKERS) -> ArchiveExtraction:
+    """
+    Extract only the lifelog images of an archive into destination, skipping the ones which are already stored.
+    NOTE: known_images is the path -> {crc, size} index of the images already stored for the user.
+        An image whose CRC and size did not change is neither written to disk nor returned for the database.
+    """
+    known_images = known_images or {}
+    with zipfile.ZipFile(source, 'r') as zip_ref:
+        members, file_structure = select_lifelog_members(zip_ref)
+        new_members = [info for info in members if info.filename not in known_images]
+        changed_members = [info for info in members 
+                           if info.filename in known_images and not is_unchanged_image(info, known_images[info.filename])]
+        members_to_extract = new_members + changed_members
+        sha1_list = extract_members(zip_ref, destination, members_to_extract, max_workers)
+
+    if len(members_to_extract) < len(members): # Leave the unchanged images out of the date -> images structure
+        extracted_names = {info.filename for info in members_to_extract}
+        file_structure = {_date: [name for name in moment_list if name in extracted_names] for _date, moment_list in file_structure.items()}
+        file_structure = {_date: moment_list for _date, moment_list in file_structure.items() if moment_list}
+    index_entries = [
+        {'path': info.filename, 'crc': info.CRC, 'size': info.file_size, 'sha1': sha1}
+        for info, sha1 in zip(members_to_extract, sha1_list)
+    ]
+    return ArchiveExtraction(
+        file_structure = dict(file_structure),
+        images_new = len(new_members),
+        images_changed = len(changed_members),
+        images_skipped = len(members) - len(members_to_extract),
+        index_entries = index_entries,
+    )
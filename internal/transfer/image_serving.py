@@ -0,0 +1,163 @@
+import mimetypes
+import os
+import re
+from typing import Tuple, Union
+from urllib.parse import quote
+import anyio
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+from constants.transfer_configuration import (
+    IMAGE_CACHE_CONTROL,
+    IMAGE_READ_CHUNK_SIZE,
+    IMAGE_X_ACCEL_REDIRECT_PREFIX,
+)
+
+
+RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class UnsatisfiableRangeError(Exception):
+    pass
+
+
+def get_user_file_path(storage_path: str, user_id: str, relative_path: str) -> Union[str, None]:
+    """
+    Resolve a path stored in the database to a file of the user, or None if it escapes the folder of the user.
+    """
+    user_path = os.path.abspath(os.path.join(storage_path, user_id))
+    file_path = os.path.abspath(os.path.join(user_path, relative_path))
+    if os.path.commonpath([user_path, file_path]) != user_path:
+        return None
+    return file_path
+
+
+def get_strong_etag(file_stat: os.stat_result, sha1: Union[str, None] = None) -> str:
+    # The content hash when it is known, otherwise the size and modification time of a file which is never edited in place
+    if sha1 is not None:
+        return f'"{sha1}"'
+    return f'"{file_stat.st_size:x}-{file_stat.st_mtime_ns:x}"'
+
+
+def is_etag_matching(header: Union[str, None], etag: str) -> bool:
+    if header is None:
+        return False
+    tags = [tag.strip() for tag in header.split(',')]
+    return '*' in tags or etag in tags or f'W/{etag}' in tags
+
+
+def parse_range_header(header: str, size: int) -> Union[Tuple[int, int], None]:
+    """
+    Parse a single byte range into inclusive (start, end) offsets.
+    NOTE: Returns None for ranges which are ignored (malformed or multiple ranges), so that the whole file is sent.
+        Raises UnsatisfiableRangeError if the range is outside of the file.
+    """
+    match = RANGE_PATTERN.match(header.strip())
+    if match is None:
+        return None
+    start, end = match.groups()
+    if start == '' and end == '':
+        return None
+    if start == '': # Suffix range, the last bytes of the file
+        length = int(end)
+        if length == 0:
+            raise UnsatisfiableRangeError(header)
+        return max(0, size - length), size - 1
+    start = int(start)
+    end = size - 1 if end == '' else min(int(end), size - 1)
+    if start >= size or start > end:
+        raise UnsatisfiableRangeError(header)
+    return start, end
+
+
+class FileRangeResponse(Response):
+    """
+    Send a byte range of a file, with os.sendfile through the zero-copy send extension when the server supports it.
+    """
+
+    def __init__(self, path: str, start: int, end: int, status_code: int = 200, headers: Union[dict, None] = None,
+                 media_type: Union[str, None] = None):
+        self.path = path
+        self.start = start
+        self.end = end
+        self.status_code = status_code
+        self.media_type = media_type
+        self.background = None
+        self.init_headers(headers)
+        self.headers.setdefault('content-length', str(end - start + 1))
+
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({
+            'type': 'http.response.start',
+            'status': self.status_code,
+            'headers': self.raw_headers,
+        })
+        count = self.end - self.start + 1
+        if 'http.response.zerocopysend' in scope.get('extensions', {}):
+            # Opened and closed in a thread like the fallback, so that a slow disk never blocks the event loop
+            file = await anyio.to_thread.run_sync(open, self.path, 'rb')
+            try:
+                await send({
+                    'type': 'http.response.zerocopysend',
+                    'file': file,
+                    'offset': self.start,
+                    'count': count,
+                    'more_body': False,
+                })
+            finally:
+                await anyio.to_thread.run_sync(file.close)
+            return
+
+        async with await anyio.open_file(self.path, mode = 'rb') as file:
+            await file.seek(self.start)
+            remaining = count
+            while remaining > 0:
+                chunk = await file.read(min(IMAGE_READ_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': remaining > 0})
+        if remaining > 0: # The file was truncated while it was sent
+            await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+
+
+def build_image_response(path: str, relative_path: str, request_headers, sha1: Union[str, None] = None) -> Response:
+    """
+    Build the response of an image: 304 if the ETag matches, 206 for a byte range, 200 with the whole file otherwise.
+    NOTE: If IMAGE_X_ACCEL_REDIRECT_PREFIX is set, only the headers are returned and nginx sends the bytes.
+        Runs blocking stat calls, call it from a thread.
+    """
+    file_stat = os.stat(path)
+    etag = get_strong_etag(file_stat, sha1)
+    headers = {
+        'etag': etag,
+        'cache-control': IMAGE_CACHE_CONTROL,
+        'accept-ranges': 'bytes',
+    }
+    if is_etag_matching(request_headers.get('if-none-match'), etag):
+        return Response(status_code = 304, headers = headers)
+
+    media_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    if IMAGE_X_ACCEL_REDIRECT_PREFIX is not None:
+        # URL-encoded, nginx decodes the internal redirect as a URI
+        headers['x-accel-redirect'] = f'{IMAGE_X_ACCEL_REDIRECT_PREFIX}/{quote(relative_path)}'
+        return Response(headers = headers, media_type = media_type)
+
+    size = file_stat.st_size
+    byte_range = None
+    range_header = request_headers.get('range')
+    if_range = request_headers.get('if-range')
+    if range_header is not None and size > 0 and (if_range is None or if_range.strip() == etag):
+        try:
+            byte_range = parse_range_header(range_header, size)
+        except UnsatisfiableRangeError:
+            headers['content-range'] = f'bytes */{size}'
+            return Response(status_code = 416, headers = headers)
+    if byte_range is None:
+        if size == 0:
+            return Response(headers = headers, media_type = media_type)
+        return FileRangeResponse(path, 0, size - 1, headers = headers, media_type = media_type)
+
+    start, end = byte_range
+    headers['content-range'] = f'bytes {start}-{end}/{size}'
+    return FileRangeResponse(path, start, end, status_code = 206, headers = headers, media_type = media_type)
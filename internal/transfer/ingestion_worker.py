@@ -0,0 +1,125 @@
+import asyncio
+import multiprocessing
+import os
+import signal
+import socket
+from pathlib import Path
+from typing import List, Union
+import sentry_sdk
+from constants.transfer_configuration import (
+    INGESTION_POLL_INTERVAL_SECONDS,
+    INGESTION_JOB_LEASE_SECONDS,
+    INGESTION_JOB_MAX_ATTEMPTS,
+)
+from internal.db.ingestion_job_crud import (
+    claim_next_ingestion_job,
+    fail_exhausted_ingestion_jobs,
+    renew_ingestion_job_lease,
+    update_ingestion_job_progress,
+    finish_ingestion_job,
+    requeue_ingestion_job,
+)
+from internal.db.indexes import ensure_indexes
+from internal.transfer.upload import ingest_file
+from internal.transfer.renditions import rendition_pool
+from internal.signals.feature_engine import feature_engine
+
+
+async def keep_lease(job_id: str, worker_id: str) -> None:
+    # Returns once the lease could not be renewed, the job may then be claimed by another worker
+    while True:
+        await asyncio.sleep(INGESTION_JOB_LEASE_SECONDS / 3)
+        if not await renew_ingestion_job_lease(job_id, worker_id):
+            return
+
+
+def remove_staged_file(file_path: Union[str, Path]) -> None:
+    try:
+        Path(file_path).unlink()
+    except FileNotFoundError:
+        pass
+
+
+async def process_ingestion_job(job: dict, worker_id: str) -> None:
+    """
+    Ingest the file of a claimed job while renewing its lease and reporting its progress.
+    NOTE: The ingestion is cancelled if the lease is lost, so that the file is never ingested by two workers at once.
+        A failed attempt is queued again until INGESTION_JOB_MAX_ATTEMPTS, the staged file is deleted once the job
+        is completed or failed.
+    """
+    job_id = job['_id']
+
+    async def on_progress(progress: dict):
+        await update_ingestion_job_progress(job_id, progress)
+
+    source = Path(job['file_path'])
+    ingestion_task = asyncio.create_task(ingest_file(source, job['user_id'], on_progress))
+    lease_task = asyncio.create_task(keep_lease(job_id, worker_id))
+    _ = await asyncio.wait([ingestion_task, lease_task], return_when = asyncio.FIRST_COMPLETED)
+    if not ingestion_task.done():
+        ingestion_task.cancel()
+        _ = await asyncio.gather(ingestion_task, return_exceptions = True)
+        sentry_sdk.capture_message(f'Lost the lease of ingestion job {job_id}, the ingestion was cancelled')
+        return
+    lease_task.cancel()
+
+    error = ingestion_task.exception()
+    if error is not None:
+        sentry_sdk.capture_exception(error)
+        if job['attempts'] < INGESTION_JOB_MAX_ATTEMPTS:
+            await requeue_ingestion_job(job_id, worker_id, str(error))
+            return
+        await finish_ingestion_job(job_id, worker_id, 'failed', str(error))
+    else:
+        await finish_ingestion_job(job_id, worker_id, 'completed')
+    remove_staged_file(source)
+
+
+async def run_worker(worker_id: Union[str, None] = None) -> None:
+    """
+    Pull ingestion jobs from the queue forever.
+    NOTE: Any number of workers, on any number of nodes, can pull from the same queue.
+    """
+    worker_id = worker_id or f'{socket.gethostname()}-{os.getpid()}'
+    _ = await ensure_indexes()
+    while True:
+        for file_path in await fail_exhausted_ingestion_jobs():
+            remove_staged_file(file_path)
+        job = await claim_next_ingestion_job(worker_id)
+        if job is None:
+            await asyncio.sleep(INGESTION_POLL_INTERVAL_SECONDS)
+            continue
+        await process_ingestion_job(job, worker_id)
+
+
+def stop_worker_process(signum, frame) -> None:
+    raise SystemExit(0)
+
+
+def run_worker_process() -> None:
+    # Exit cleanly on terminate so that the process pools of the worker are shut down as well
+    signal.signal(signal.SIGTERM, stop_worker_process)
+    try:
+        asyncio.run(run_worker())
+    finally:
+        rendition_pool.shutdown()
+        feature_engine.shutdown()
+
+
+def start_worker_processes(count: int) -> List[multiprocessing.Process]:
+    """
+    Start ingestion workers in separate processes so that ingestion never competes with the API for the event loop.
+    """
+    context = multiprocessing.get_context('spawn') # Do not inherit the Mongo client of the API process
+    processes = []
+    for _ in range(count):
+        # Not a daemon, as daemon processes can not start the rendition and feature process pools
+        process = context.Process(target = run_worker_process)
+        process.start()
+        processes.append(process)
+    return processes
+
+
+if __name__ == '__main__':
+    # Standalone worker, run from the root of the project: python -m internal.transfer.ingestion_worker
+    run_worker_process()
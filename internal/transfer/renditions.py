@@ -0,0 +1,159 @@
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Union
+import sentry_sdk
+from constants.transfer_configuration import (
+    RENDITION_SIZES,
+    RENDITION_WEBP,
+    RENDITION_QUALITY,
+    RENDITION_WORKERS,
+    DAY_SPRITE_TILE_SIZE,
+    DAY_SPRITE_COLUMNS,
+    DAY_SPRITE_NAME,
+)
+
+# Renditions are only generated if Pillow is available
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+    ImageOps = None
+
+
+def is_rendition_supported() -> bool:
+    return Image is not None
+
+
+def get_rendition_path(image_path: str, rendition: str, extension: Union[str, None] = None) -> str:
+    """
+    Get the path of a rendition of an image, next to the original: <name>.<rendition>.<extension>
+    """
+    name, original_extension = os.path.splitext(image_path)
+    return f'{name}.{rendition}{extension or original_extension}'
+
+
+def get_day_sprite_path(_date: str) -> str:
+    return f'{_date}/{DAY_SPRITE_NAME}'
+
+
+def generate_image_renditions(user_data_path: str, image_path: str) -> Dict[str, str]:
+    """
+    Generate the renditions of an image. Runs in a worker process.
+    NOTE: The original is decoded once and every rendition is downscaled from it. Returns rendition -> path,
+        WebP copies are recorded as <rendition>_webp.
+    """
+    renditions = {}
+    with Image.open(os.path.join(user_data_path, image_path)) as image:
+        image = ImageOps.exif_transpose(image).convert('RGB')
+        # Downscale from the largest rendition to the smallest, so each resize starts from the closest size
+        for rendition, size in sorted(RENDITION_SIZES.items(), key = lambda item: item[1], reverse = True):
+            image.thumbnail(size, Image.LANCZOS)
+            rendition_path = get_rendition_path(image_path, rendition, '.jpg')
+            image.save(os.path.join(user_data_path, rendition_path), 'JPEG', quality = RENDITION_QUALITY, optimize = True)
+            renditions[rendition] = rendition_path
+            if RENDITION_WEBP:
+                webp_path = get_rendition_path(image_path, rendition, '.webp')
+                image.save(os.path.join(user_data_path, webp_path), 'WEBP', quality = RENDITION_QUALITY)
+                renditions[f'{rendition}_webp'] = webp_path
+    return renditions
+
+
+def generate_image_renditions_list(user_data_path: str, image_paths: List[str]) -> Dict[str, Dict[str, str]]:
+    """
+    Generate the renditions of many images. Images which can not be decoded are left out.
+    """
+    renditions = {}
+    for image_path in image_paths:
+        try:
+            renditions[image_path] = generate_image_renditions(user_data_path, image_path)
+        except Exception as e:
+            sentry_sdk.capture_exception(e)
+    return renditions
+
+
+def generate_day_sprite(user_data_path: str, _date: str, image_paths: List[str]) -> dict:
+    """
+    Paste the moments of a day into one sprite sheet. Runs in a worker process.
+    NOTE: Tiles are read from the smallest rendition when it exists. Returns the DaySprite of the day,
+        whose offsets give the position of every moment in the sheet, in the order of image_paths.
+    """
+    tile_width, tile_height = DAY_SPRITE_TILE_SIZE
+    columns = max(1, min(DAY_SPRITE_COLUMNS, len(image_paths)))
+    rows = -(-len(image_paths) // columns)
+    smallest_rendition = min(RENDITION_SIZES.items(), key = lambda item: item[1])[0]
+
+    sprite = Image.new('RGB', (columns * tile_width, rows * tile_height))
+    offsets = []
+    for index, image_path in enumerate(image_paths):
+        x, y = (index % columns) * tile_width, (index // columns) * tile_height
+        tile_path = os.path.join(user_data_path, get_rendition_path(image_path, smallest_rendition, '.jpg'))
+        if not os.path.exists(tile_path):
+            tile_path = os.path.join(user_data_path, image_path)
+        try:
+            with Image.open(tile_path) as tile:
+                tile = ImageOps.fit(ImageOps.exif_transpose(tile).convert('RGB'), DAY_SPRITE_TILE_SIZE, Image.LANCZOS)
+                sprite.paste(tile, (x, y))
+        except Exception as e:
+            sentry_sdk.capture_exception(e) # Keep an empty tile so that the offsets of the other moments do not move
+        offsets.append({'image_path': image_path, 'x': x, 'y': y})
+
+    sprite_path = get_day_sprite_path(_date)
+    sprite.save(os.path.join(user_data_path, sprite_path), 'JPEG', quality = RENDITION_QUALITY, optimize = True)
+    return {
+        'path': sprite_path,
+        'tile_width': tile_width,
+        'tile_height': tile_height,
+        'columns': columns,
+        'offsets': offsets,
+    }
+
+
+class RenditionPool:
+    """
+    Process pool which generates image renditions and day sprites off the event loop.
+    """
+
+    def __init__(self, max_workers: int = RENDITION_WORKERS):
+        self.max_workers = max_workers
+        self.__executor: Union[ProcessPoolExecutor, None] = None
+
+
+    async def generate_renditions(self, user_data_path: str, image_paths: List[str]) -> Dict[str, Dict[str, str]]:
+        """
+        Generate the renditions of many images, split into one job per worker process.
+        NOTE: Returns image_path -> rendition -> path.
+        """
+        if not image_paths:
+            return {}
+        chunk_size = -(-len(image_paths) // self.max_workers)
+        chunks = [image_paths[i:i + chunk_size] for i in range(0, len(image_paths), chunk_size)]
+        rendition_chunks = await asyncio.gather(*[
+            self.__submit(generate_image_renditions_list, user_data_path, chunk) for chunk in chunks
+        ])
+        return {image_path: renditions for rendition_chunk in rendition_chunks for image_path, renditions in rendition_chunk.items()}
+
+
+    async def generate_day_sprite(self, user_data_path: str, _date: str, image_paths: List[str]) -> dict:
+        return await self.__submit(generate_day_sprite, user_data_path, _date, image_paths)
+
+
+    def shutdown(self) -> None:
+        if self.__executor is not None:
+            self.__executor.shutdown(wait = True)
+            self.__executor = None
+
+
+    async def __submit(self, function, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.__get_executor(), function, *args)
+
+
+    def __get_executor(self) -> ProcessPoolExecutor:
+        # Created lazily so that importing this module does not spawn processes
+        if self.__executor is None:
+            self.__executor = ProcessPoolExecutor(max_workers = self.max_workers)
+        return self.__executor
+
+
+rendition_pool = RenditionPool()
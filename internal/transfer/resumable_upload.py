@@ -0,0 +1,177 @@
+import asyncio
+import hashlib
+import os
+import shutil
+from datetime import datetime, timedelta
+from pathlib import Path
+from tempfile import TemporaryFile
+from typing import AsyncIterator, List, Union
+from fastapi.concurrency import run_in_threadpool
+import sentry_sdk
+from constants.transfer_configuration import (
+    UPLOAD_CHUNK_SIZE,
+    UPLOAD_MAX_SIZE,
+    UPLOAD_STAGING_URL,
+    RESUMABLE_UPLOAD_MAX_CHUNK_SIZE,
+    RESUMABLE_UPLOAD_SESSION_TTL_SECONDS,
+    RESUMABLE_UPLOAD_GC_INTERVAL_SECONDS,
+)
+from internal.db.upload_session_crud import (
+    insert_upload_session,
+    insert_received_range,
+    get_abandoned_upload_sessions,
+    update_upload_session_status,
+    delete_upload_session,
+)
+from internal.db.ingestion_job_crud import insert_ingestion_job, get_ingestion_job_by_file_path
+
+
+class InvalidChunkError(Exception):
+    pass
+
+
+class IncompleteUploadError(Exception):
+    pass
+
+
+def merge_ranges(ranges: List[List[int]]) -> List[List[int]]:
+    """
+    Merge overlapping and adjacent [start, end) ranges.
+    """
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def preallocate_file(path: str, size: int) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok = True)
+    with open(path, 'wb') as file:
+        file.truncate(size)
+
+
+def write_at(file, offset: int, data: bytes, sha256) -> None:
+    file.seek(offset)
+    file.write(data)
+    sha256.update(data)
+
+
+def copy_chunk(chunk_file, path: str, offset: int) -> None:
+    chunk_file.seek(0)
+    with open(path, 'r+b') as file:
+        file.seek(offset)
+        shutil.copyfileobj(chunk_file, file, UPLOAD_CHUNK_SIZE)
+
+
+def compute_file_sha256(path: str) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(UPLOAD_CHUNK_SIZE), b''):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+async def create_upload_session(user_id: str, file_name: str, size: int, sha256: Union[str, None] = None) -> Union[None, dict]:
+    """
+    Create a resumable upload session and preallocate the file receiving its chunks.
+    """
+    if size > UPLOAD_MAX_SIZE:
+        raise InvalidChunkError(f'Upload is larger than {UPLOAD_MAX_SIZE} bytes')
+    file_path_template = os.path.join(UPLOAD_STAGING_URL, '{session_id}.part')
+    upload_session = await insert_upload_session(user_id, file_name, file_path_template, size, sha256)
+    if upload_session is not None:
+        await run_in_threadpool(preallocate_file, upload_session['file_path'], size)
+    return upload_session
+
+
+async def write_upload_chunk(upload_session: dict, offset: int, stream: AsyncIterator[bytes], chunk_sha256: str) -> List[List[int]]:
+    """
+    Receive a chunk as a stream into a temporary file and copy it at offset into the preallocated file.
+    NOTE: The chunk is only copied, and its range recorded as received, if the SHA-256 of the chunk matches chunk_sha256,
+        otherwise InvalidChunkError is raised and the client has to send the chunk again. A corrupt resend of a range
+        which was already received therefore never overwrites its bytes. Returns the merged received ranges.
+    """
+    if offset < 0 or offset >= upload_session['size']:
+        raise InvalidChunkError('Offset is outside of the file')
+    max_end = min(upload_session['size'], offset + RESUMABLE_UPLOAD_MAX_CHUNK_SIZE)
+    sha256 = hashlib.sha256()
+    end = offset
+    with TemporaryFile(dir = os.path.dirname(upload_session['file_path'])) as chunk_file:
+        async for data in stream:
+            if not data:
+                continue
+            if end + len(data) > max_end:
+                raise InvalidChunkError('Chunk is larger than allowed or goes past the end of the file')
+            await run_in_threadpool(write_at, chunk_file, end - offset, data, sha256)
+            end += len(data)
+        if end == offset:
+            raise InvalidChunkError('Empty chunk')
+        if sha256.hexdigest() != chunk_sha256.lower():
+            raise InvalidChunkError('Chunk checksum does not match')
+        await run_in_threadpool(copy_chunk, chunk_file, upload_session['file_path'], offset)
+    if not await insert_received_range(upload_session['_id'], offset, end):
+        raise InvalidChunkError('Upload session is not open')
+    return merge_ranges(upload_session['received'] + [[offset, end]])
+
+
+async def finalize_upload_session(upload_session: dict) -> Union[None, dict]:
+    """
+    Check that every byte of an upload session was received and hand the file over to the ingestion queue.
+    NOTE: Returns the queued IngestionJob. Raises IncompleteUploadError if bytes are missing or the checksum does not match.
+    """
+    if merge_ranges(upload_session['received']) != [[0, upload_session['size']]]:
+        raise IncompleteUploadError('Some chunks have not been received yet')
+    upload_session = await update_upload_session_status(upload_session['_id'], 'open', 'finalizing')
+    if upload_session is None:
+        raise IncompleteUploadError('Upload session is not open')
+
+    sha256 = await run_in_threadpool(compute_file_sha256, upload_session['file_path'])
+    if upload_session['sha256'] is not None and upload_session['sha256'].lower() != sha256:
+        _ = await update_upload_session_status(upload_session['_id'], 'finalizing', 'open')
+        raise IncompleteUploadError('File checksum does not match')
+
+    job = await insert_ingestion_job(upload_session['user_id'], upload_session['file_path'], 
+                                     upload_session['file_name'], sha256, upload_session['size'])
+    if job is None:
+        _ = await update_upload_session_status(upload_session['_id'], 'finalizing', 'open')
+        return None
+    _ = await update_upload_session_status(upload_session['_id'], 'finalizing', 'finalized')
+    return job
+
+
+async def purge_abandoned_upload_sessions() -> int:
+    """
+    Delete the open upload sessions, and their files, which did not receive any chunk for too long.
+    NOTE: Sessions left in finalizing by a crash are marked finalized if their ingestion job was queued,
+        otherwise they are opened again so that they can be finalized again, or purged once abandoned.
+        Returns the number of purged sessions.
+    """
+    updated_before = datetime.utcnow() - timedelta(seconds = RESUMABLE_UPLOAD_SESSION_TTL_SECONDS)
+    for upload_session in await get_abandoned_upload_sessions(updated_before, 'finalizing'):
+        job = await get_ingestion_job_by_file_path(upload_session['file_path'])
+        _ = await update_upload_session_status(upload_session['_id'], 'finalizing', 'open' if job is None else 'finalized', 
+                                               updated_before)
+
+    purged = 0
+    for upload_session in await get_abandoned_upload_sessions(updated_before):
+        if await update_upload_session_status(upload_session['_id'], 'open', 'abandoned', updated_before) is None:
+            continue # Received a chunk in the meantime
+        try:
+            await run_in_threadpool(Path(upload_session['file_path']).unlink)
+        except FileNotFoundError:
+            pass
+        _ = await delete_upload_session(upload_session['_id'])
+        purged += 1
+    return purged
+
+
+async def run_upload_session_gc() -> None:
+    while True:
+        try:
+            _ = await purge_abandoned_upload_sessions()
+        except Exception as e:
+            sentry_sdk.capture_exception(e)
+        await asyncio.sleep(RESUMABLE_UPLOAD_GC_INTERVAL_SECONDS)
@@ -1,124 +1,215 @@
-from datetime import datetime
-from fastapi import UploadFile
+import asyncio
+from fastapi import UploadFile, Request
+from starlette.datastructures import UploadFile as StarletteUploadFile
+from starlette.formparsers import MultiPartParser
+from fastapi.encoders import jsonable_encoder
+from fastapi.concurrency import run_in_threadpool
 import sentry_sdk
 import shutil
-from typing import Dict, List
+import hashlib
+from typing import AsyncGenerator, Awaitable, Callable, Dict, List, NamedTuple, Set, Tuple, Union
 import os
 from tempfile import NamedTemporaryFile
 from pathlib import Path
-import zipfile
-from collections import defaultdict
-from itertools import groupby
 from constants.external_servers import DATA_STORAGE_URL
+from constants.transfer_configuration import (
+    UPLOAD_CHUNK_SIZE, 
+    UPLOAD_MAX_SIZE, 
+    UPLOAD_FORM_OVERHEAD,
+    UPLOAD_STAGING_URL,
+    INGESTION_DATE_CONCURRENCY,
+    UNPARSEABLE_MOMENTS_REPORTED,
+)
 from schemas.db_schemas import MomentDetailId, MomentMetadata
 from internal.db.user_annotation_crud import (
     insert_dates_to_user
 )
 from internal.db.moment_annotation_crud import (
     append_moments,
+    get_moments_by_date,
+    set_moments_sprite,
 )
 from internal.db.moment_detail_annotation_crud import (
-    insert_moment_detail
+    upsert_moment_details,
+    set_moment_details,
+)
+from internal.transfer.archive import extract_lifelog_archive, parse_moment_times
+from internal.transfer.renditions import is_rendition_supported, rendition_pool
+from internal.signals.e4 import Signal, load_e4_signals
+from internal.signals.windows import compute_moment_physiological_data, get_signal_dates
+from internal.signals.store import save_signals
+from internal.signals.feature_engine import feature_engine
+from internal.db.image_index_crud import (
+    get_image_index as _get_image_index,
+    upsert_image_index_entries as _upsert_image_index_entries,
+)
+from internal.db.ingestion_job_crud import (
+    insert_ingestion_job
 )
 
 
+class UploadTooLargeError(Exception):
+    pass
 
-def unzip_file(source: Path, destination: Path) -> None:
-    with zipfile.ZipFile(source, 'r') as zip_ref:
-        zip_ref.extractall(destination)
 
+class SavedUploadFile(NamedTuple):
+    path: Path
+    sha256: str
+    size: int
 
 
-def get_file_structure_from_zipfile(source: Path) -> list:
-    try:
-        file_structure = defaultdict(list)
-        with zipfile.ZipFile(source, 'r') as zip_ref:
-            IMAGE_EXTENSION = ['.jpg', '.jpeg', '.png']
-            names = zip_ref.namelist()
-
-            # Filter only the images from lifelog folder
-            names = sorted([name for name in zip_ref.namelist() 
-                    if 'lifelog' in name and 
-                        'thumb' not in name and
-                        os.path.splitext(name)[-1].lower() in IMAGE_EXTENSION])
-            
-            # Group by date
-            DATE_INDEX_IN_NAME = 0
-            for k, v in groupby(names, key=lambda name: name.split('/')[DATE_INDEX_IN_NAME]):
-                file_structure[k] += list(v)
-    except Exception as e:
-        sentry_sdk.capture_exception(e)
-    return file_structure
-
-
-
-async def insert_data_to_db(user_id: str, file_structure: Dict[str, List[str]]) -> None:
+
+def get_default_moment_metadata() -> dict:
+    """
+    Get the encoded moment metadata of a moment which has not been annotated yet.
+    """
+    empty_physiological_data = {
+        'min_value': 0,
+        'max_value': 0,
+        'mean_value': 0,
+        'std_value': 0
+    }
+    moment_detail = {
+        'utc_time': '00:00:00',
+        'image_path': '',
+        'other_image_path': '',
+        'location': '',
+        'stress_level': '',
+        'activity': '',
+        'heart_rate': empty_physiological_data,
+        'bvp': empty_physiological_data, 
+        'eda': empty_physiological_data,
+        'temp': empty_physiological_data,
+    }
+    return jsonable_encoder(MomentMetadata(**moment_detail))
+
+
+async def insert_date_to_db(user_id: str, _date: str, moment_list: List[str], 
+                            renditions: Union[Dict[str, Dict[str, str]], None] = None) -> dict:
+    """
+    Insert the moments and the moment details of a date to the database.
+    NOTE: The moment details are encoded once per date and then only the fields which change are filled in,
+        instead of building and encoding the pydantic models of every moment. The timestamps of all the moments
+        are parsed in one batch, moments without a valid timestamp are left out and returned as unparseable.
+        renditions maps the image path of a moment to its rendition paths.
+    """
+    renditions = renditions or {}
+    moment_times = parse_moment_times(moment_list)
+    if moment_times.unparseable:
+        sentry_sdk.capture_message(f'{len(moment_times.unparseable)} moments of {user_id} on {_date} have no valid timestamp')
+    _id = {
+        'user_id': user_id,
+        'moment_date': _date
+    }
+    # Insert moments list by date to db
+    _ = await append_moments(_id, moment_times.moments)
+
+    moment_id_template = jsonable_encoder(MomentDetailId(user_id = user_id, moment_date = _date, local_time = '00:00:00'))
+    moment_metadata_template = get_default_moment_metadata()
+    moment_details = []
+    for _moment, local_time in zip(moment_times.moments, moment_times.local_times):
+        utc_time = local_time # Dummy value for UTC time --> Work on it later
+
+        moment_id = moment_id_template.copy()
+        moment_id['local_time'] = local_time
+        moment_detail = moment_metadata_template.copy()
+        moment_detail.update({
+            '_id': moment_id,
+            'utc_time': utc_time,
+            'image_path': _moment,
+            'other_image_path': _moment, # Dummy value for other image path --> Work on it later
+            'renditions': renditions.get(_moment, {}),
+        })
+        moment_details.append(moment_detail)
+
+    # Insert moment details to db
+    counters = await upsert_moment_details(moment_details)
+    counters['unparseable'] = moment_times.unparseable
+    return counters
+
+
+async def insert_data_to_db(user_id: str, file_structure: Dict[str, List[str]], 
+                            on_progress: Union[Callable[[dict], Awaitable], None] = None,
+                            renditions: Union[Dict[str, Dict[str, str]], None] = None) -> Tuple[dict, Set[str]]:
+        """
+        Insert the dates, moments and moment details of the images to the database.
+        NOTE: Dates are inserted concurrently, at most INGESTION_DATE_CONCURRENCY at a time. Moments which are
+            already in the database are skipped, so inserting the same archive again is a no-op.
+            on_progress is awaited with the counters after each date. Returns the final counters and the images
+            which may not be stored: the unparseable ones and every image of the dates with errors.
+        """
+        progress = {'moments_inserted': 0, 'moments_skipped': 0, 'moments_unparseable': 0, 'unparseable_moments': [], 'errors': 0}
+        unstored_images = set()
+
         # Insert dates to db
         dates = sorted(file_structure.keys())
         _ = await insert_dates_to_user(user_id, dates) # Append dates to user's list of dates -> Can't be False
 
-        TIME_INDEX_IN_NAME = -1
-        DATE_TIME_INDEX_IN_NAME = -2
-        for _date, moment_list in file_structure.items():
-            sorted_moment_list = sorted(moment_list, key=lambda m: m.split('_')[TIME_INDEX_IN_NAME])
-            _id = {
-                'user_id': user_id,
-                'moment_date': _date
-            }
-            # Insert moments list by date to db
-            _ = await append_moments(_id, sorted_moment_list)
-
-            for _moment in sorted_moment_list:
-                moment_name = '_'.join(_moment.split('_')[DATE_TIME_INDEX_IN_NAME:])
-                date_time = moment_name[:15] # Dummt handling of date time
-
-                date_time = datetime.strptime(date_time, '%Y%m%d_%H%M%S')
-                local_time = datetime.strftime(date_time, '%H:%M:%S')
-                utc_time = local_time # Dummy value for UTC time --> Work on it later
-                _id = {
-                    'user_id': user_id,
-                    'moment_date': _date,
-                    'local_time': local_time
-                }
-
-                moment_detail = {
-                    'utc_time': utc_time,
-                    'image_path': _moment,
-                    'other_image_path': _moment, # Dummy value for other image path --> Work on it later
-                    'location': '',
-                    'stress_level': '',
-                    'activity': '',
-                    'heart_rate': {
-                        'min_value': 0,
-                        'max_value': 0,
-                        'mean_value': 0,
-                        'std_value': 0
-                    },
-                    'bvp': {
-                        'min_value': 0,
-                        'max_value': 0,
-                        'mean_value': 0,
-                        'std_value': 0
-                    },
-                    'eda': {
-                        'min_value': 0,
-                        'max_value': 0,
-                        'mean_value': 0,
-                        'std_value': 0
-                    },
-                    'temp': {
-                        'min_value': 0,
-                        'max_value': 0,
-                        'mean_value': 0,
-                        'std_value': 0
-                    },
-                }                
-
-                # Insert moment details to db 
-                moment_id = MomentDetailId(**_id)
-                moment_detail = MomentMetadata(**moment_detail)
-
-                _ = await insert_moment_detail(moment_id, moment_detail)
+        semaphore = asyncio.Semaphore(INGESTION_DATE_CONCURRENCY)
+
+        async def insert_date(_date: str, moment_list: List[str]):
+            async with semaphore:
+                try:
+                    counters = await insert_date_to_db(user_id, _date, moment_list, renditions)
+                except Exception as e:
+                    sentry_sdk.capture_exception(e)
+                    counters = {'inserted': 0, 'existing': 0, 'errors': len(moment_list), 'unparseable': []}
+            progress['moments_inserted'] += counters['inserted']
+            progress['moments_skipped'] += counters['existing']
+            progress['moments_unparseable'] += len(counters['unparseable'])
+            # Only the first names are kept, enough to find out what is wrong with an archive
+            progress['unparseable_moments'].extend(counters['unparseable'][:UNPARSEABLE_MOMENTS_REPORTED - len(progress['unparseable_moments'])])
+            progress['errors'] += counters['errors']
+            unstored_images.update(moment_list if counters['errors'] else counters['unparseable'])
+            if on_progress is not None:
+                await on_progress(progress.copy())
+
+        await asyncio.gather(*[insert_date(_date, moment_list) for _date, moment_list in file_structure.items()])
+        return progress, unstored_images
+
+
+
+async def insert_signals_to_db(user_id: str, signals: Dict[str, Signal]) -> dict:
+    """
+    Set the physiological data of the stored moments of every date covered by the signals.
+    NOTE: The statistics of all the moments of a date are computed at once, see compute_moment_physiological_data.
+        Moments without any sample in their window are left untouched. Returns the number of updated moments.
+    """
+    counters = {'moments_with_signals': 0}
+    for _date in get_signal_dates(signals):
+        _moments = await get_moments_by_date(user_id, _date)
+        if not _moments or not _moments['moment_list']:
+            continue
+        local_times = parse_moment_times(_moments['moment_list']).local_times
+        physiological_data = await run_in_threadpool(compute_moment_physiological_data, signals, _date, local_times)
+
+        moment_id_template = jsonable_encoder(MomentDetailId(user_id = user_id, moment_date = _date, local_time = '00:00:00'))
+        moment_details = []
+        for local_time, data in zip(local_times, physiological_data):
+            if data is None:
+                continue
+            moment_id = moment_id_template.copy()
+            moment_id['local_time'] = local_time
+            moment_details.append({'_id': moment_id, **data})
+        result = await set_moment_details(moment_details)
+        counters['moments_with_signals'] += result['matched']
+    return counters
+
+
+async def update_day_sprites(user_id: str, user_data_path: str, dates: List[str]) -> None:
+    """
+    Rebuild the sprite sheets of the given dates from every moment stored for the date.
+    """
+    for _date in dates:
+        _moments = await get_moments_by_date(user_id, _date)
+        if not _moments or not _moments['moment_list']:
+            continue
+        try:
+            sprite = await rendition_pool.generate_day_sprite(user_data_path, _date, sorted(_moments['moment_list']))
+        except Exception as e:
+            sentry_sdk.capture_exception(e)
+            continue
+        _ = await set_moments_sprite({'user_id': user_id, 'moment_date': _date}, sprite)
 
 
 
@@ -126,21 +217,85 @@ def save_file_internally(source: Path, destination: Path) -> None:
     shutil.copyfile(source, destination)
 
 
-def save_upload_file_tmp(upload_file: UploadFile) -> Path:
+def write_chunk(file, sha256, chunk: bytes) -> None:
+    file.write(chunk)
+    sha256.update(chunk)
+
+
+async def limit_stream(stream: AsyncGenerator[bytes, None], max_size: int, overhead: int = 0) -> AsyncGenerator[bytes, None]:
+    # Stop the stream once more than max_size bytes, plus overhead bytes which are not part of the upload, are received
+    size = 0
+    async for chunk in stream:
+        size += len(chunk)
+        if size > max_size + overhead:
+            raise UploadTooLargeError(f'Upload is larger than {max_size} bytes')
+        yield chunk
+
+
+async def receive_upload_form_file(request: Request, field: str = 'file', 
+                                   max_size: Union[int, None] = UPLOAD_MAX_SIZE) -> Union[UploadFile, None]:
+    """
+    Parse the multipart form of an upload and return its file, or None if the form has no file in field.
+    NOTE: Raises UploadTooLargeError from the Content-Length before the body is read, or while the body is received
+        as soon as it is larger than max_size plus the multipart envelope, so that an oversized upload is never
+        fully spooled to disk.
+    """
+    if not request.headers.get('content-type', '').startswith('multipart/form-data'):
+        return None
+    stream = request.stream()
+    if max_size is not None:
+        content_length = request.headers.get('content-length', '')
+        if content_length.isdigit() and int(content_length) > max_size + UPLOAD_FORM_OVERHEAD:
+            raise UploadTooLargeError(f'Upload is larger than {max_size} bytes')
+        stream = limit_stream(stream, max_size, UPLOAD_FORM_OVERHEAD)
+    form = await MultiPartParser(request.headers, stream).parse()
+    upload_file = form.get(field)
+    if not isinstance(upload_file, StarletteUploadFile):
+        await form.close()
+        return None
+    return upload_file
+
+
+async def save_upload_file_tmp(upload_file: UploadFile, chunk_size: int = UPLOAD_CHUNK_SIZE, 
+                               max_size: Union[int, None] = UPLOAD_MAX_SIZE, directory: Union[str, None] = None) -> SavedUploadFile:
+    """
+    Stream an upload to a temporary file (in directory if given) chunk by chunk without blocking the event loop.
+    NOTE: The SHA-256 and the size are computed during the copy. Raises UploadTooLargeError
+        as soon as more than max_size bytes have been received and removes the partial file.
+    """
+    suffix = Path(upload_file.filename).suffix
+    if directory is not None:
+        os.makedirs(directory, exist_ok = True)
+    tmp = NamedTemporaryFile(delete=False, suffix=suffix, dir=directory)
+    tmp_path = Path(tmp.name)
+    sha256 = hashlib.sha256()
+    size = 0
     try:
-        suffix = Path(upload_file.filename).suffix
-        with NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-            shutil.copyfileobj(upload_file.file, tmp)
-            tmp_path = Path(tmp.name)
-    except Exception as e:
-        sentry_sdk.capture_exception(e)
+        while True:
+            chunk = await upload_file.read(chunk_size)
+            if not chunk:
+                break
+            size += len(chunk)
+            if max_size is not None and size > max_size:
+                raise UploadTooLargeError(f'Upload is larger than {max_size} bytes')
+            await run_in_threadpool(write_chunk, tmp, sha256, chunk)
+        tmp.close()
+    except Exception:
+        tmp.close()
+        tmp_path.unlink()
+        raise
     finally:
-        upload_file.file.close()
-    return tmp_path
+        await upload_file.close()
+    return SavedUploadFile(path = tmp_path, sha256 = sha256.hexdigest(), size = size)
 
 
-async def handle_upload_file(upload_file: UploadFile, user_id: str) -> None:
-    tmp_path = save_upload_file_tmp(upload_file)
+async def ingest_file(source: Path, user_id: str, on_progress: Union[Callable[[dict], Awaitable], None] = None) -> dict:
+    """
+    Extract the lifelog images of an archive into the storage of the user and insert its moments to the database.
+    NOTE: on_progress is awaited with the progress counters (files_extracted, images_new, images_changed, images_skipped, 
+        images_rendered, moments_inserted, moments_with_signals, feature_days_computed, errors). Images which are already stored unchanged are skipped.
+        The renditions of the new and changed images and the sprites of their dates are generated if Pillow is available.
+    """
 
     # Create folder for user if it does not exist
     user_data_path = os.path.join(DATA_STORAGE_URL, user_id)
@@ -148,11 +303,54 @@ async def handle_upload_file(upload_file: UploadFile, user_id: str) -> None:
         os.makedirs(user_data_path)
 
     destination = Path(f'{user_data_path}')
-    try:
-        unzip_file(tmp_path, destination)  # Do something with the saved temp file
-        file_structure = get_file_structure_from_zipfile(tmp_path)
-        await insert_data_to_db(user_id, file_structure)
-    except Exception as e:
-        sentry_sdk.capture_exception(e) 
-    finally:
-        tmp_path.unlink()  # Delete the temp file
\ No newline at end of file
+    known_images = await _get_image_index(user_id)
+    extraction = await run_in_threadpool(extract_lifelog_archive, source, destination, known_images)
+
+    report = {
+        'files_extracted': extraction.images_new + extraction.images_changed,
+        'images_new': extraction.images_new,
+        'images_changed': extraction.images_changed,
+        'images_skipped': extraction.images_skipped,
+    }
+    if on_progress is not None:
+        await on_progress(report.copy())
+
+    renditions = {}
+    if is_rendition_supported():
+        image_paths = [image_path for moment_list in extraction.file_structure.values() for image_path in moment_list]
+        renditions = await rendition_pool.generate_renditions(user_data_path, image_paths)
+        report['images_rendered'] = len(renditions)
+        if on_progress is not None:
+            await on_progress(report.copy())
+
+    progress, unstored_images = await insert_data_to_db(user_id, extraction.file_structure, on_progress, renditions)
+    report.update(progress)
+    if is_rendition_supported():
+        await update_day_sprites(user_id, user_data_path, sorted(extraction.file_structure.keys()))
+
+    # The wristband signals are stored raw and summarised for every stored moment they cover, including the skipped ones
+    signals = await run_in_threadpool(load_e4_signals, source)
+    if signals:
+        _ = await run_in_threadpool(save_signals, user_data_path, signals)
+        report.update(await insert_signals_to_db(user_id, signals))
+        if on_progress is not None:
+            await on_progress(report.copy())
+    # Only the days whose signals or moments changed are computed again
+    report.update(await feature_engine.update_features(user_id, user_data_path))
+    # Index the images only once their moments are stored, so an interrupted or failed ingestion does not skip them next time
+    index_entries = [entry for entry in extraction.index_entries if entry['path'] not in unstored_images]
+    _ = await _upsert_image_index_entries(user_id, index_entries)
+    return report
+
+
+async def handle_upload_file(upload_file: UploadFile, user_id: str) -> Union[None, dict]:
+    """
+    Save an upload to the staging folder and queue it for ingestion by the ingestion workers.
+    NOTE: Returns the queued IngestionJob, or None if it could not be queued.
+    """
+    file_name = upload_file.filename
+    saved_file = await save_upload_file_tmp(upload_file, directory = UPLOAD_STAGING_URL)
+    job = await insert_ingestion_job(user_id, str(saved_file.path), file_name, saved_file.sha256, saved_file.size)
+    if job is None:
+        saved_file.path.unlink()
+    return job
@@ -0,0 +1,85 @@
+import csv
+import io
+from typing import List, Tuple
+from pydantic import ValidationError
+from sqlalchemy.orm import Session
+from fastapi.concurrency import run_in_threadpool
+import sentry_sdk
+from sql_app import crud
+from schemas.request_schemas import RequestUserCreate
+from schemas.response_schemas import ResponseBulkUserCreate, ResponseUserConflict
+from constants.security_settings import PASSWORD_HASH_ALGORITHM
+from internal.security.hashing_pool import hashing_pool
+from internal.db.user_annotation_crud import insert_users
+from internal.db.annotation_list_crud import insert_empty_annotation_data_list
+
+
+def parse_user_csv(content: bytes) -> Tuple[List[Tuple[int, RequestUserCreate]], List[ResponseUserConflict]]:
+    """
+    Parse a CSV file with the columns username, name and password into users.
+    NOTE: Rows which are not valid are reported as conflicts with their 0-based row number.
+    """
+    users, conflicts = [], []
+    reader = csv.DictReader(io.StringIO(content.decode('utf-8-sig')))
+    for row_index, row in enumerate(reader):
+        try:
+            # Only the known columns, extra values of a row are stored under the key None by the reader
+            users.append((row_index, RequestUserCreate(username = row.get('username'), name = row.get('name'), 
+                                                       password = row.get('password'))))
+        except ValidationError:
+            conflicts.append(ResponseUserConflict(row = row_index, username = row.get('username') or '', detail = 'Invalid row'))
+    return users, conflicts
+
+
+async def create_users(db: Session, users: List[Tuple[int, RequestUserCreate]], 
+                       conflicts: List[ResponseUserConflict] = None) -> ResponseBulkUserCreate:
+    """
+    Create many users at once and report the rows which could not be created.
+    NOTE: Passwords are hashed in parallel on the hashing pool, both user tables are filled in a single transaction
+        and the matching users/annotation_data_list documents are created in batched writes. Users whose documents
+        could not be created are also reported in incomplete.
+    """
+    conflicts = list(conflicts or [])
+
+    # Drop the usernames which are repeated in the request
+    unique_users, seen_usernames = [], set()
+    for row_index, user in users:
+        if user.username in seen_usernames:
+            conflicts.append(ResponseUserConflict(row = row_index, username = user.username, detail = 'Duplicate username in request'))
+            continue
+        seen_usernames.add(user.username)
+        unique_users.append((row_index, user))
+
+    # Drop the usernames which are already registered
+    existing_usernames = set(await run_in_threadpool(crud.get_existing_usernames, db, [user.username for _, user in unique_users]))
+    new_users = []
+    for row_index, user in unique_users:
+        if user.username in existing_usernames:
+            conflicts.append(ResponseUserConflict(row = row_index, username = user.username, detail = 'User already registered'))
+        else:
+            new_users.append((row_index, user))
+
+    hashed_passwords = await hashing_pool.hash_string_list(PASSWORD_HASH_ALGORITHM, [user.password for _, user in new_users])
+    rows = [
+        { 'username': user.username, 'name': user.name, 'hashed_password': hashed_password }
+        for (_, user), hashed_password in zip(new_users, hashed_passwords)
+    ]
+    try:
+        await run_in_threadpool(crud.create_users_bulk, db, rows)
+    except Exception as e:
+        # Most likely a concurrent registration of one of the usernames, the whole transaction is rolled back
+        sentry_sdk.capture_exception(e)
+        conflicts += [
+            ResponseUserConflict(row = row_index, username = user.username, detail = 'User could not be registered')
+            for row_index, user in new_users
+        ]
+        new_users = []
+
+    created_usernames = [user.username for _, user in new_users]
+    # Both writes are idempotent, the users are registered even if their documents could not be created
+    incomplete_usernames = []
+    if not await insert_users(created_usernames) or not await insert_empty_annotation_data_list(created_usernames):
+        incomplete_usernames = created_usernames
+
+    conflicts.sort(key = lambda conflict: conflict.row)
+    return ResponseBulkUserCreate(created = created_usernames, conflicts = conflicts, incomplete = incomplete_usernames)
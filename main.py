@@ -3,7 +3,8 @@ from fastapi.middleware.cors import CORSMiddleware
 from routers.annotation import (
     users as annotation_users,
     moments as annotation_moments,
-    data as annotation_data
+    data as annotation_data,
+    signals as annotation_signals,
 )
 from routers.authentication import (
     auth as authentication_auth,
@@ -11,6 +12,13 @@ from routers.authentication import (
 from routers.users import users
 from dependencies import *
 from connectors import sqlalchemy_engine
+from internal.security.hashing_pool import hashing_pool
+from internal.transfer.ingestion_worker import start_worker_processes
+from internal.transfer.resumable_upload import run_upload_session_gc
+from internal.db.indexes import ensure_indexes
+from internal.db.moment_detail_write_buffer import moment_detail_write_buffer
+import asyncio
+from constants.transfer_configuration import INGESTION_WORKER_PROCESSES
 import sql_app.schemas
 
 
@@ -36,9 +44,49 @@ routers = [
     annotation_users.router,
     annotation_moments.router,
     annotation_data.router,
+    annotation_signals.router,
     authentication_auth.router,
     users.router,
 ]
 for router in routers:
     app.include_router(router)
 
+
+ingestion_worker_processes = []
+
+
+@app.on_event("startup")
+async def create_indexes():
+    _ = await ensure_indexes()
+
+
+@app.on_event("startup")
+def start_ingestion_workers():
+    ingestion_worker_processes.extend(start_worker_processes(INGESTION_WORKER_PROCESSES))
+
+
+@app.on_event("startup")
+async def start_upload_session_gc():
+    app.state.upload_session_gc = asyncio.create_task(run_upload_session_gc())
+
+
+@app.on_event("shutdown")
+async def stop_upload_session_gc():
+    app.state.upload_session_gc.cancel()
+
+
+@app.on_event("shutdown")
+async def flush_moment_detail_write_buffer():
+    await moment_detail_write_buffer.close()
+
+
+@app.on_event("shutdown")
+def shutdown_hashing_pool():
+    hashing_pool.shutdown()
+
+
+@app.on_event("shutdown")
+def stop_ingestion_workers():
+    # Jobs which were running are picked up again once their lease expires
+    for process in ingestion_worker_processes:
+        process.terminate()
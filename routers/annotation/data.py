@@ -32,11 +32,10 @@ async def insert_default_annotation_data(request : RequestInsertDefaultAnnotatio
     NOTE: Refer to the UserAnnotationList in the folder schemas for the required fields.
     """
 
-    result = await insert_default_annotation_data_to_db(user_id, request)
-    if result == False:
+    default_annotation_data = await insert_default_annotation_data_to_db(user_id, request)
+    if default_annotation_data is None:
         raise HTTPException(status_code = status.HTTP_409_CONFLICT, 
             detail = "Duplicate dates!!!")
-    default_annotation_data = await get_all_annotation_data(user_id)
     return default_annotation_data
 
 
@@ -61,21 +60,18 @@ async def get_all_annotation_list(user_id: str = Depends(verify_token)):
 async def insert_to_annotation_list(request: RequestInsertAnnotationValue, user_id: str = Depends(verify_token)):
     list_type = request.list_type
     value = request.value
-    result = True
     if list_type == 'location':
-        result = await insert_to_location_list(user_id, value)
+        annotation_list = await insert_to_location_list(user_id, value)
     elif list_type == 'stress_level':
-        result = await insert_to_stress_level_list(user_id, value)
+        annotation_list = await insert_to_stress_level_list(user_id, value)
     elif list_type == 'activity':
-        result = await insert_to_activity_list(user_id, value)
+        annotation_list = await insert_to_activity_list(user_id, value)
     else:
         raise HTTPException(status_code = status.HTTP_400_BAD_REQUEST, 
             detail = "Invalid list type")
-    if result == False:
+    if annotation_list is None:
         raise HTTPException(status_code = status.HTTP_409_CONFLICT, 
             detail = "Duplicate value!!!")
-    
-    annotation_list = await _get_annotation_list(user_id, list_type)
     return annotation_list
 
 
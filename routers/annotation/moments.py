@@ -1,5 +1,10 @@
-from fastapi import APIRouter, status, HTTPException, Depends
+from fastapi import APIRouter, status, HTTPException, Depends, Request
 from fastapi.encoders import jsonable_encoder
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from datetime import date, datetime, time
+from typing import Union
+import json
 from schemas.db_schemas import (
     MomentListByDate, 
     MomentDetail,
@@ -10,9 +15,13 @@ from schemas.request_schemas import (
     RequestUpdateMomentDetail,
     RequestInsertMomentListByDate,
     RequestInsertMomentDetail,
+    RequestMomentDetailBatch,
+    RequestBulkUpdateMomentDetail,
 )
 import connectors
-from schemas.response_schemas import ResponseListMoments
+from constants.external_servers import DATA_STORAGE_URL
+from constants.annotation_configuration import MOMENT_DETAIL_PAGE_SIZE, MOMENT_DETAIL_MAX_PAGE_SIZE, ANNOTATION_FIELDS
+from schemas.response_schemas import ResponseListMoments, ResponseMomentDetailBatch, ResponseBulkUpdate
 from dependencies import verify_token
 from internal.db.moment_annotation_crud import (
     insert_moments as insert_new_moments,
@@ -23,11 +32,22 @@ from internal.db.moment_detail_annotation_crud import (
     insert_moment_detail as insert_new_moment_detail,
     update_moment_detail as update_new_moment_detail,
     get_moment_detail as _get_moment_detail,
+    find_moment_details,
+    get_moment_details_by_ids,
+    update_moment_details_by_ids,
+    update_moment_details_by_range,
 )
+from internal.db.annotation_list_crud import insert_values_to_annotation_lists
+from internal.db.moment_detail_write_buffer import moment_detail_write_buffer
+from internal.db.image_index_crud import get_image_index_entry
+from internal.transfer.image_serving import build_image_response, get_user_file_path
+from internal.pagination import encode_cursor, decode_cursor, InvalidCursorError
 
 
 db = connectors.mongodb_client['stress_lifelog']
 
+MOMENT_DETAIL_FIELDS = {field.alias for field in MomentDetail.__fields__.values()}
+
 
 router = APIRouter(
     prefix="/annotation/moments",
@@ -45,10 +65,9 @@ async def insert_moments(request: RequestInsertMomentListByDate, user_id: str =
     request = jsonable_encoder(request)
     request['id']['user_id'] = user_id
 
-    result = await insert_new_moments(**request) 
-    if result == False:
+    new_moment = await insert_new_moments(**request) 
+    if new_moment is None:
         raise HTTPException(status_code = status.HTTP_409_CONFLICT, detail = "Moments already exists")
-    new_moment = await get_moments(**request['id'])
     return new_moment
 
 
@@ -64,11 +83,9 @@ async def append_moments(request: RequestInsertMomentListByDate, user_id: str =
     request['id']['user_id'] = user_id
 
 
-    result = await append_new_moments(**request)
-    if result == False:
+    new_moment = await append_new_moments(**request)
+    if new_moment is None:
         raise HTTPException(status_code = status.HTTP_409_CONFLICT, detail = "Duplicate moments!!!")
-
-    new_moment = await get_moments(**request['id'])
     return new_moment
 
 
@@ -104,13 +121,9 @@ async def insert_moment_detail(request: RequestInsertMomentDetail, user_id : str
     del request['id']
     moment_detail = MomentMetadata(**request)
 
-    result = await insert_new_moment_detail(moment_id, moment_detail)
-    if result == False:
+    new_moment_detail = await insert_new_moment_detail(moment_id, moment_detail)
+    if new_moment_detail is None:
         raise HTTPException(status_code = status.HTTP_409_CONFLICT, detail = "Duplicate moments!!!")
-
-    id['moment_time'] = id['local_time']
-    del id['local_time']
-    new_moment_detail = await _get_moment_detail(**id)
     return new_moment_detail
 
 
@@ -122,19 +135,47 @@ async def update_moment_detail(request: RequestUpdateMomentDetail, user_id : str
     NOTE: Refer to the MomentDetail in the folder schemas for the required fields.
     """
 
-    result = await update_new_moment_detail(user_id, request)
-    if result == False:
+    moment_detail = await update_new_moment_detail(user_id, request)
+    if moment_detail is None:
         raise HTTPException(status_code = status.HTTP_409_CONFLICT, detail = "Update moment details failed!!!")
-
-    id = jsonable_encoder(request.id)
-    id['user_id'] = user_id
-    id['moment_time'] = id['local_time']
-    del id['local_time']
-    
-    moment_detail = await _get_moment_detail(**id)
     return moment_detail
 
 
+@router.post("/update_moment_details", status_code = status.HTTP_200_OK, response_model = ResponseBulkUpdate)
+async def update_moment_details(request: RequestBulkUpdateMomentDetail, user_id : str = Depends(verify_token)):
+
+    """
+    Set the same annotations on many moment details in one request, e.g. every moment between 08:10 and 08:55.
+    NOTE: The moment details are given either by ids or by start_date and end_date, with optional start_time and end_time.
+        New values are also added to the annotation lists of the user.
+    """
+
+    if not request.values:
+        raise HTTPException(status_code = status.HTTP_400_BAD_REQUEST, detail = "No values to update")
+    unknown_fields = set(request.values) - set(ANNOTATION_FIELDS)
+    if unknown_fields:
+        raise HTTPException(status_code = status.HTTP_400_BAD_REQUEST, 
+            detail = f"Unknown fields: {', '.join(sorted(unknown_fields))}")
+    has_range = request.start_date is not None and request.end_date is not None
+    if (request.ids is None) == (not has_range):
+        raise HTTPException(status_code = status.HTTP_400_BAD_REQUEST, 
+            detail = "Either ids or start_date and end_date must be given")
+
+    if request.ids is not None:
+        ids = [(_id.moment_date.isoformat(), _id.moment_time.isoformat()) for _id in request.ids]
+        result = await update_moment_details_by_ids(user_id, request.values, ids)
+    else:
+        result = await update_moment_details_by_range(
+            user_id, request.values, request.start_date.isoformat(), request.end_date.isoformat(), 
+            request.start_time.isoformat() if request.start_time is not None else None, 
+            request.end_time.isoformat() if request.end_time is not None else None
+        )
+    if result is None:
+        raise HTTPException(status_code = status.HTTP_409_CONFLICT, detail = "Update moment details failed!!!")
+    _ = await insert_values_to_annotation_lists(user_id, request.values)
+    return result
+
+
 @router.get("/get_moment_detail", status_code = status.HTTP_200_OK, response_model = MomentDetail)
 async def get_moment_detail(moment_date: str, moment_time: str, user_id: str = Depends(verify_token)):
 
@@ -147,3 +188,121 @@ async def get_moment_detail(moment_date: str, moment_time: str, user_id: str = D
     if moment_detail is None:
         raise HTTPException(status_code = status.HTTP_404_NOT_FOUND, detail = "No moment detail found")
     return moment_detail
+
+
+
+@router.post("/get_moment_details", status_code = status.HTTP_200_OK, response_model = ResponseMomentDetailBatch)
+async def get_moment_details(request: RequestMomentDetailBatch, user_id: str = Depends(verify_token)):
+
+    """
+    Get many moment details in one request, e.g. every moment of the timeline of a day.
+    NOTE: The moment details are returned in the order of the ids, null for the ids which do not exist.
+    """
+
+    ids = [(_id.moment_date.isoformat(), _id.moment_time.isoformat()) for _id in request.ids]
+    moment_details = await get_moment_details_by_ids(user_id, ids)
+    if moment_details is None:
+        raise HTTPException(status_code = status.HTTP_500_INTERNAL_SERVER_ERROR, detail = "Get moment details failed!!!")
+    results = [moment_details.get(_id) for _id in ids]
+    return {"moment_details": results, "missing": sum(result is None for result in results)}
+
+
+@router.get("/get_moment_details_by_range", status_code = status.HTTP_200_OK)
+async def get_moment_details_by_range(start_date: date, end_date: date, start_time: Union[time, None] = None, 
+                                      end_time: Union[time, None] = None, fields: Union[str, None] = None, 
+                                      cursor: Union[str, None] = None, limit: int = MOMENT_DETAIL_PAGE_SIZE, 
+                                      user_id: str = Depends(verify_token)):
+
+    """
+    Stream a page of the moment details of a user between two dates, optionally only between two times of the day,
+    as newline-delimited JSON sorted by date and time.
+    NOTE: fields is a comma-separated list of the fields to return, e.g. stress_level,image_path.
+        The last line is {"next_cursor": ...}, pass it as cursor to get the next page. It is null on the last page.
+    """
+
+    if limit < 1 or limit > MOMENT_DETAIL_MAX_PAGE_SIZE:
+        raise HTTPException(status_code = status.HTTP_400_BAD_REQUEST, 
+            detail = f"limit must be between 1 and {MOMENT_DETAIL_MAX_PAGE_SIZE}")
+    field_list = None
+    if fields is not None:
+        field_list = [field.strip() for field in fields.split(',') if field.strip()]
+        unknown_fields = set(field_list) - MOMENT_DETAIL_FIELDS
+        if unknown_fields:
+            raise HTTPException(status_code = status.HTTP_400_BAD_REQUEST, 
+                detail = f"Unknown fields: {', '.join(sorted(unknown_fields))}")
+    after = None
+    if cursor is not None:
+        try:
+            after_date, after_time = decode_cursor(cursor)
+            # Fed to the query as is, so anything else than the date and the time of a moment detail is refused
+            if not isinstance(after_date, str) or not isinstance(after_time, str) \
+                    or datetime.strptime(after_date, '%Y-%m-%d').strftime('%Y-%m-%d') != after_date \
+                    or datetime.strptime(after_time, '%H:%M:%S').strftime('%H:%M:%S') != after_time:
+                raise InvalidCursorError(f'Invalid cursor: {cursor}')
+        except (InvalidCursorError, ValueError):
+            raise HTTPException(status_code = status.HTTP_400_BAD_REQUEST, detail = "Invalid cursor")
+        after = (after_date, after_time)
+
+    await moment_detail_write_buffer.flush()
+    moment_details = find_moment_details(
+        user_id, start_date.isoformat(), end_date.isoformat(), 
+        start_time.isoformat() if start_time is not None else None, 
+        end_time.isoformat() if end_time is not None else None, 
+        after, field_list, limit + 1 # One more to know if there is a next page
+    )
+
+    async def generate_moment_details():
+        count = 0
+        last_key = None
+        async for moment_detail in moment_details:
+            if count == limit:
+                yield json.dumps({"next_cursor": encode_cursor(last_key)}) + '\n'
+                return
+            last_key = [moment_detail['moment_date'], moment_detail['local_time']]
+            count += 1
+            yield json.dumps(moment_detail, default = str) + '\n'
+        yield json.dumps({"next_cursor": None}) + '\n'
+
+    return StreamingResponse(generate_moment_details(), media_type = "application/x-ndjson")
+
+
+@router.get("/write_buffer_stats", status_code = status.HTTP_200_OK)
+async def get_write_buffer_stats(user_id: str = Depends(verify_token)):
+    """
+    Get the pending updates, the coalescing counters and the flush latencies (seconds) of the write-behind buffer
+    of the moment details of this worker.
+    """
+    return moment_detail_write_buffer.stats()
+
+
+@router.get("/get_moment_image", status_code = status.HTTP_200_OK)
+async def get_moment_image(moment_date: str, moment_time: str, request: Request, rendition: Union[str, None] = None, 
+                           user_id: str = Depends(verify_token)):
+
+    """
+    Get the image of a moment, or one of its renditions (e.g. thumbnail, medium).
+    NOTE: Supports single byte ranges, If-None-Match with a strong ETag and If-Range.
+    """
+
+    moment_detail = await _get_moment_detail(user_id, moment_date, moment_time)
+    if moment_detail is None:
+        raise HTTPException(status_code = status.HTTP_404_NOT_FOUND, detail = "No moment detail found")
+    if rendition is None:
+        image_path = moment_detail['image_path']
+    else:
+        image_path = moment_detail.get('renditions', {}).get(rendition)
+        if image_path is None:
+            raise HTTPException(status_code = status.HTTP_404_NOT_FOUND, detail = "No rendition found")
+
+    file_path = get_user_file_path(DATA_STORAGE_URL, user_id, image_path)
+    if file_path is None:
+        raise HTTPException(status_code = status.HTTP_404_NOT_FOUND, detail = "No image found")
+
+    sha1 = None
+    if rendition is None: # Only the originals are in the image index
+        index_entry = await get_image_index_entry(user_id, image_path)
+        sha1 = index_entry['sha1'] if index_entry is not None else None
+    try:
+        return await run_in_threadpool(build_image_response, file_path, f'{user_id}/{image_path}', request.headers, sha1)
+    except FileNotFoundError:
+        raise HTTPException(status_code = status.HTTP_404_NOT_FOUND, detail = "No image found")
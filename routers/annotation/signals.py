@@ -0,0 +1,73 @@
+from fastapi import APIRouter, status, HTTPException, Depends, Query
+from fastapi.concurrency import run_in_threadpool
+from datetime import datetime
+import os
+from constants.external_servers import DATA_STORAGE_URL
+from constants.signal_configuration import (
+    SIGNAL_DEFAULT_POINTS,
+    SIGNAL_MAX_POINTS,
+    SIGNAL_MAX_WINDOW_SECONDS,
+    LIFELOG_UTC_OFFSET_MINUTES,
+)
+from dependencies import verify_token
+from schemas.response_schemas import ResponseSignal
+import numpy as np
+from internal.signals.e4 import Signal
+from internal.signals.store import SIGNAL_FIELDS, get_signal_window_slices
+from internal.signals.downsampling import DOWNSAMPLING_METHODS, downsample
+
+
+router = APIRouter(
+    prefix="/annotation/signals",
+    tags=["/annotation/signals"],
+    responses = { 404: {"description": "Not Found"}},
+)
+
+
+def get_downsampled_signal(user_id: str, signal: str, start: float, end: float, points: int, method: str) -> dict:
+    user_data_path = os.path.join(DATA_STORAGE_URL, user_id)
+    # Every day is downsampled straight from its memory-mapped file, to its share of the points,
+    # so that a window of many days is never copied as a whole
+    slices = get_signal_window_slices(user_data_path, signal, start, end)
+    size = sum(len(part.values) for part in slices)
+    parts = []
+    for part in slices:
+        part_points = max(2, points * len(part.values) // size)
+        parts.append(downsample(part, part_points, method if part_points >= 3 else 'minmax'))
+    window = Signal(
+        np.concatenate([part.timestamps for part in parts]) if parts else np.empty(0),
+        np.concatenate([part.values for part in parts]) if parts else np.empty(0),
+    )
+    return {
+        'signal': signal,
+        'method': method,
+        'timestamps': window.timestamps.tolist(),
+        'values': window.values.tolist(),
+    }
+
+
+@router.get("/get_signal", status_code = status.HTTP_200_OK, response_model = ResponseSignal)
+async def get_signal(signal: str, start_time: datetime, end_time: datetime, 
+                     points: int = Query(default = SIGNAL_DEFAULT_POINTS, ge = 3, le = SIGNAL_MAX_POINTS),
+                     method: str = 'minmax', user_id: str = Depends(verify_token)):
+
+    """
+    Get a window of a raw signal (heart_rate, bvp, eda, temp or ibi) downsampled to about points samples.
+    NOTE: start_time and end_time are local times, as the moments. method is minmax (keeps the peaks) or lttb.
+    """
+
+    if signal not in SIGNAL_FIELDS:
+        raise HTTPException(status_code = status.HTTP_400_BAD_REQUEST, detail = "Invalid signal")
+    if method not in DOWNSAMPLING_METHODS:
+        raise HTTPException(status_code = status.HTTP_400_BAD_REQUEST, detail = "Invalid downsampling method")
+    if end_time <= start_time:
+        raise HTTPException(status_code = status.HTTP_400_BAD_REQUEST, detail = "end_time must be after start_time")
+    if (end_time - start_time).total_seconds() > SIGNAL_MAX_WINDOW_SECONDS:
+        raise HTTPException(status_code = status.HTTP_400_BAD_REQUEST, 
+            detail = f"The window can not be longer than {SIGNAL_MAX_WINDOW_SECONDS} seconds")
+
+    # Local times to UTC unix seconds, the same way as the moments
+    utc_offset_seconds = LIFELOG_UTC_OFFSET_MINUTES * 60
+    start = (start_time.replace(tzinfo = None) - datetime(1970, 1, 1)).total_seconds() - utc_offset_seconds
+    end = (end_time.replace(tzinfo = None) - datetime(1970, 1, 1)).total_seconds() - utc_offset_seconds
+    return await run_in_threadpool(get_downsampled_signal, user_id, signal, start, end, points, method)
@@ -34,11 +34,10 @@ async def insert_user(request: RequestModifyListDates, user_id: str = Depends(ve
     request = jsonable_encoder(request)
     request['user_id'] = user_id
 
-    result = await insert_user_with_dates(**request)
-    if result == False:
+    created_user = await insert_user_with_dates(**request)
+    if created_user is None:
         raise HTTPException(status_code = status.HTTP_409_CONFLICT, 
             detail = "User already exists")
-    created_user = await get_dates(user_id)
     return created_user
 
 
@@ -54,11 +53,10 @@ async def insert_dates_to_user(request : RequestModifyListDates, user_id: str =
     request['user_id'] = user_id
     
     
-    result = await insert_dates(**request)
-    if result == False:
+    user = await insert_dates(**request)
+    if user is None:
         raise HTTPException(status_code = status.HTTP_409_CONFLICT, 
             detail = "Duplicate dates!!!")
-    user = await get_dates(user_id)
     return user
 
 
@@ -1,11 +1,17 @@
 from constants.security_settings import SECRET_KEY, TOKEN_HASH_ALGORITHM, PASSWORD_HASH_ALGORITHM
 from fastapi import APIRouter, Depends, status, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from schemas.security_schemas import Token
 from internal.security.authenticator import Authenticator
 from internal.security.token_generator import TokenGenerator
+from internal.security.hashing_pool import HashingPoolBusyError
+from internal.security.session_cache import session_cache
+from dependencies import verify_token, token_decoder, credentials_exception, expired_creditentials_exception
+from schemas.request_schemas import RequestRefreshToken
 from datetime import timedelta
 from fastapi.security import OAuth2PasswordRequestForm
-from constants.token_configuration import ACCESS_TOKEN_EXPIRE_MINUTES
+from constants.token_configuration import ACCESS_TOKEN_EXPIRE_MINUTES, REFRESH_TOKEN_EXPIRE_MINUTES
+from jose import JWTError
 
 
 router = APIRouter(
@@ -25,7 +31,14 @@ token_generator = TokenGenerator(SECRET_KEY, TOKEN_HASH_ALGORITHM)
 
 @router.post('', response_model = Token)
 async def authenticate_user_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
-    user = authenticator.authenticate(form_data.username, form_data.password)
+    try:
+        user = await authenticator.authenticate(form_data.username, form_data.password)
+    except HashingPoolBusyError:
+        raise HTTPException(
+            status_code = status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail = "Too many login requests, please try again later",
+            headers = {"Retry-After": "1"},
+        )
     if not user:
         raise HTTPException(
             status_code = status.HTTP_401_UNAUTHORIZED,
@@ -33,10 +46,47 @@ async def authenticate_user_for_access_token(form_data: OAuth2PasswordRequestFor
             headers = {"WWW-Authenticate": "Bearer"},
         )
     access_token_expires = timedelta(minutes = ACCESS_TOKEN_EXPIRE_MINUTES)
-    tokens = token_generator.create_authentication_token(
+    refresh_token_expires = timedelta(minutes = REFRESH_TOKEN_EXPIRE_MINUTES)
+    tokens = await run_in_threadpool(
+        token_generator.create_authentication_token,
         data={"username": form_data.username}, 
-        expires_delta=access_token_expires
+        expires_delta=access_token_expires,
+        refresh_expires_delta=refresh_token_expires
+    )
+    return tokens
+
+
+@router.post('/refresh', response_model = Token)
+async def refresh_access_token(request: RequestRefreshToken):
+    """
+    Issue a new pair of tokens from a valid refresh token without checking the password again.
+    NOTE: The refresh token must belong to the latest pair issued to the user, so it can only be used once.
+    """
+    try:
+        payload = token_decoder.decode(request.refresh_token)
+        username = payload.get("username")
+        if username is None or payload.get("token_type") != "refresh":
+            raise credentials_exception
+    except JWTError:
+        raise credentials_exception
+    if not await authenticator.verify_user_session(username, payload.get("iat")):
+        raise credentials_exception
+    if not authenticator.verify_expiration_time(payload.get("exp")):
+        raise expired_creditentials_exception
+    access_token_expires = timedelta(minutes = ACCESS_TOKEN_EXPIRE_MINUTES)
+    refresh_token_expires = timedelta(minutes = REFRESH_TOKEN_EXPIRE_MINUTES)
+    tokens = await run_in_threadpool(
+        token_generator.create_authentication_token,
+        data={"username": username}, 
+        expires_delta=access_token_expires,
+        refresh_expires_delta=refresh_token_expires
     )
     return tokens
 
 
+@router.get('/session_cache_stats')
+async def get_session_cache_stats(username: str = Depends(verify_token)):
+    """
+    Get the size and the hit/miss counters of the verified-session cache of this worker.
+    """
+    return session_cache.stats()
@@ -1,16 +1,37 @@
 from shutil import ExecError
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile
-from sql_app.dependencies import get_sqldb_session
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, Request, Header
+from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from sql_app.dependencies import get_sqldb_session, sqlalchemy_session
 from sqlalchemy.orm import Session
 from sql_app.schemas import *
 from sql_app import crud
 from schemas.security_schemas import (
     User as UserSchema,
 )
-from typing import List
-from schemas.request_schemas import RequestUserCreate
+from typing import List, Union
+from fastapi.encoders import jsonable_encoder
+import asyncio
+import json
+from schemas.request_schemas import RequestUserCreate, RequestBulkUserCreate, RequestCreateUploadSession
+from schemas.response_schemas import ResponseBulkUserCreate, ResponseUserPage
+from schemas.db_schemas import IngestionJob, UploadSession
 from dependencies import verify_token
-from internal.transfer.upload import handle_upload_file
+from internal.transfer.upload import handle_upload_file, receive_upload_form_file, UploadTooLargeError
+from internal.security.hashing_pool import hashing_pool, HashingPoolBusyError
+from internal.users.bulk_provisioning import create_users, parse_user_csv
+from internal.db.ingestion_job_crud import get_ingestion_job, TERMINAL_JOB_STATUSES
+from internal.db.upload_session_crud import get_upload_session as _get_upload_session
+from internal.transfer.resumable_upload import (
+    create_upload_session as _create_upload_session,
+    write_upload_chunk,
+    finalize_upload_session as _finalize_upload_session,
+    merge_ranges,
+    InvalidChunkError,
+    IncompleteUploadError,
+)
+from internal.pagination import encode_cursor, decode_cursor, InvalidCursorError
+from constants.security_settings import PASSWORD_HASH_ALGORITHM, PASSWORD_HASH_LIST_MAX_SIZE, USER_CSV_MAX_LINE_BYTES
 
 
 router = APIRouter(
@@ -20,11 +41,57 @@ router = APIRouter(
 
 
 @router.post("/create_user", response_model = UserSchema)
-def create_user(user: RequestUserCreate, db: Session = Depends(get_sqldb_session)):
-    db_user = crud.get_user(db, username = user.username)
+async def create_user(user: RequestUserCreate, db: Session = Depends(get_sqldb_session)):
+    db_user = await run_in_threadpool(crud.get_user, db, username = user.username)
     if db_user:
         raise HTTPException(status_code = status.HTTP_400_BAD_REQUEST, detail="User already registered")
-    return crud.create_user(db=db, user=user)
+    try:
+        hashed_password = await hashing_pool.hash_string(PASSWORD_HASH_ALGORITHM, user.password)
+    except HashingPoolBusyError:
+        raise HTTPException(status_code = status.HTTP_503_SERVICE_UNAVAILABLE, detail="Server is busy, please try again later")
+    return await run_in_threadpool(crud.create_user, db = db, user = user, hashed_password = hashed_password)
+
+
+@router.post("/create_user_list", response_model = ResponseBulkUserCreate)
+async def create_user_list(request: RequestBulkUserCreate, db: Session = Depends(get_sqldb_session)):
+    """
+    Create many users at once, e.g. to enrol a cohort of participants.
+    NOTE: Rows which could not be created are reported in conflicts with their index in the request.
+    """
+    if len(request.users) > PASSWORD_HASH_LIST_MAX_SIZE:
+        raise HTTPException(status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, 
+            detail=f"At most {PASSWORD_HASH_LIST_MAX_SIZE} users can be created at once")
+    try:
+        return await create_users(db, list(enumerate(request.users)))
+    except HashingPoolBusyError:
+        raise HTTPException(status_code = status.HTTP_503_SERVICE_UNAVAILABLE, detail="Server is busy, please try again later")
+
+
+@router.post("/create_user_list_from_csv", response_model = ResponseBulkUserCreate)
+async def create_user_list_from_csv(file: UploadFile, db: Session = Depends(get_sqldb_session)):
+    """
+    Create many users at once from a CSV file with the header username,name,password.
+    NOTE: Rows which could not be created are reported in conflicts with their 0-based row number.
+        Files larger than the header and PASSWORD_HASH_LIST_MAX_SIZE rows of USER_CSV_MAX_LINE_BYTES are not read.
+    """
+    max_size = (PASSWORD_HASH_LIST_MAX_SIZE + 1) * USER_CSV_MAX_LINE_BYTES
+    try:
+        content = await file.read(max_size + 1)
+        if len(content) > max_size:
+            raise HTTPException(status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, 
+                detail=f"The file can not be larger than {max_size} bytes")
+        users, conflicts = parse_user_csv(content)
+    except UnicodeDecodeError:
+        raise HTTPException(status_code = status.HTTP_400_BAD_REQUEST, detail="The file is not a UTF-8 CSV file")
+    finally:
+        await file.close()
+    if len(users) + len(conflicts) > PASSWORD_HASH_LIST_MAX_SIZE:
+        raise HTTPException(status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, 
+            detail=f"At most {PASSWORD_HASH_LIST_MAX_SIZE} users can be created at once")
+    try:
+        return await create_users(db, users, conflicts)
+    except HashingPoolBusyError:
+        raise HTTPException(status_code = status.HTTP_503_SERVICE_UNAVAILABLE, detail="Server is busy, please try again later")
 
 
 @router.get("/get_user/{username}", response_model = UserSchema)
@@ -35,16 +102,167 @@ def get_user(username: str, db: Session = Depends(get_sqldb_session)):
     return db_user
 
 
-@router.get("/get_user_list", response_model= List[UserSchema])
-def read_users(skip: int = 0, limit: int = 100, db: Session = Depends(get_sqldb_session)):
-    users = crud.get_users(db, skip=skip, limit=limit)
-    return users
+@router.get("/get_user_list", response_model = ResponseUserPage)
+def read_users(cursor: Union[str, None] = None, prefix: Union[str, None] = None, limit: int = 100, db: Session = Depends(get_sqldb_session)):
+    """
+    Get a page of users sorted by username, optionally only those whose username starts with prefix.
+    NOTE: Pass the next_cursor of a page as cursor to get the next one. next_cursor is null on the last page.
+    """
+    if limit < 1 or limit > 1000:
+        raise HTTPException(status_code = status.HTTP_400_BAD_REQUEST, detail="limit must be between 1 and 1000")
+    after_username = None
+    if cursor is not None:
+        try:
+            after_username, = decode_cursor(cursor)
+            if not isinstance(after_username, str):
+                raise InvalidCursorError(f'Invalid cursor: {cursor}')
+        except (InvalidCursorError, ValueError):
+            raise HTTPException(status_code = status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    users = crud.get_users_page(db, limit = limit, after_username = after_username, prefix = prefix)
+    next_cursor = None
+    if len(users) > limit:
+        users = users[:limit]
+        next_cursor = encode_cursor([users[-1].username])
+    return { "users": users, "next_cursor": next_cursor }
+
+
+@router.get("/stream_user_list")
+def stream_users(prefix: Union[str, None] = None):
+    """
+    Stream every user sorted by username as newline-delimited JSON without buffering the whole list.
+    """
+    def generate_users():
+        with sqlalchemy_session() as db:
+            for user in crud.iterate_users(db, prefix = prefix):
+                yield json.dumps(UserSchema.from_orm(user).dict()) + '\n'
+
+    return StreamingResponse(generate_users(), media_type = "application/x-ndjson")
 
 
 @router.post("/upload_file", status_code = status.HTTP_202_ACCEPTED)
-async def upload_file(file: UploadFile, user_id: str = Depends(verify_token)):
+async def upload_file(request: Request, user_id: str = Depends(verify_token)):
+    """
+    Upload a lifelog archive, as the field file of a multipart form, and queue it for ingestion.
+    NOTE: Use the returned job_id with get_upload_status or stream_upload_status to follow the ingestion.
+        The form is parsed here rather than by FastAPI so that an oversized upload is rejected before it is received.
+    """
     try:
-        await handle_upload_file(file, user_id)
+        file = await receive_upload_form_file(request)
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+    if file is None:
+        raise HTTPException(status_code = status.HTTP_400_BAD_REQUEST, detail="No file was uploaded")
+    try:
+        job = await handle_upload_file(file, user_id)
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code = status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Upload error ---!!!!")
-    return {"message": "File uploaded successfully"}
\ No newline at end of file
+    if job is None:
+        raise HTTPException(status_code = status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Upload could not be queued")
+    return {"message": "File uploaded successfully", "job_id": job['_id']}
+
+
+async def get_own_ingestion_job(job_id: str, user_id: str):
+    job = await get_ingestion_job(job_id)
+    if job is None or job['user_id'] != user_id:
+        raise HTTPException(status_code = status.HTTP_404_NOT_FOUND, detail="Upload job not found")
+    return job
+
+
+@router.get("/get_upload_status", response_model = IngestionJob, response_model_exclude = {"file_path", "worker_id"})
+async def get_upload_status(job_id: str, user_id: str = Depends(verify_token)):
+    """
+    Get the status and the progress (files extracted, moments inserted, errors) of an upload.
+    """
+    return await get_own_ingestion_job(job_id, user_id)
+
+
+@router.get("/stream_upload_status")
+async def stream_upload_status(job_id: str, request: Request, user_id: str = Depends(verify_token)):
+    """
+    Stream the status and the progress of an upload as server-sent events until the ingestion ends.
+    """
+    job = await get_own_ingestion_job(job_id, user_id)
+
+    async def generate_events(job):
+        last_event = None
+        while True:
+            event = jsonable_encoder(IngestionJob(**job), exclude = {"file_path", "worker_id"})
+            if event != last_event:
+                yield f'data: {json.dumps(event)}\n\n'
+                last_event = event
+            if job['status'] in TERMINAL_JOB_STATUSES or await request.is_disconnected():
+                return
+            await asyncio.sleep(1)
+            job = await get_ingestion_job(job_id) or job
+
+    return StreamingResponse(generate_events(job), media_type = "text/event-stream")
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# RESUMABLE UPLOADS
+# ----------------------------------------------------------------------------------------------------------------------
+async def get_own_upload_session(session_id: str, user_id: str):
+    upload_session = await _get_upload_session(session_id)
+    if upload_session is None or upload_session['user_id'] != user_id:
+        raise HTTPException(status_code = status.HTTP_404_NOT_FOUND, detail="Upload session not found")
+    upload_session['received'] = merge_ranges(upload_session['received'])
+    return upload_session
+
+
+@router.post("/create_upload_session", status_code = status.HTTP_201_CREATED, response_model = UploadSession, response_model_exclude = {"file_path"})
+async def create_upload_session(request: RequestCreateUploadSession, user_id: str = Depends(verify_token)):
+    """
+    Start a resumable upload of a lifelog archive of the given size.
+    NOTE: Send the chunks with upload_chunk, check the received ranges with get_upload_session
+        and call finalize_upload_session once every byte has been received.
+    """
+    try:
+        upload_session = await _create_upload_session(user_id, request.file_name, request.size, request.sha256)
+    except InvalidChunkError as e:
+        raise HTTPException(status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+    if upload_session is None:
+        raise HTTPException(status_code = status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Upload session could not be created")
+    return upload_session
+
+
+@router.put("/upload_chunk", response_model = UploadSession, response_model_exclude = {"file_path"})
+async def upload_chunk(session_id: str, offset: int, request: Request, chunk_sha256: str = Header(...), user_id: str = Depends(verify_token)):
+    """
+    Write the raw body of the request at offset in the file of an upload session.
+    NOTE: The chunk-sha256 header must contain the SHA-256 of the body, the chunk is rejected otherwise.
+    """
+    upload_session = await get_own_upload_session(session_id, user_id)
+    if upload_session['status'] != 'open':
+        raise HTTPException(status_code = status.HTTP_409_CONFLICT, detail="Upload session is not open")
+    try:
+        upload_session['received'] = await write_upload_chunk(upload_session, offset, request.stream(), chunk_sha256)
+    except InvalidChunkError as e:
+        raise HTTPException(status_code = status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return upload_session
+
+
+@router.get("/get_upload_session", response_model = UploadSession, response_model_exclude = {"file_path"})
+async def get_upload_session(session_id: str, user_id: str = Depends(verify_token)):
+    """
+    Get an upload session with the byte ranges received so far.
+    """
+    return await get_own_upload_session(session_id, user_id)
+
+
+@router.post("/finalize_upload_session", status_code = status.HTTP_202_ACCEPTED)
+async def finalize_upload_session(session_id: str, user_id: str = Depends(verify_token)):
+    """
+    Queue a completely received upload for ingestion.
+    NOTE: Use the returned job_id with get_upload_status or stream_upload_status to follow the ingestion.
+    """
+    upload_session = await get_own_upload_session(session_id, user_id)
+    try:
+        job = await _finalize_upload_session(upload_session)
+    except IncompleteUploadError as e:
+        raise HTTPException(status_code = status.HTTP_409_CONFLICT, detail=str(e))
+    if job is None:
+        raise HTTPException(status_code = status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Upload could not be queued")
+    return {"message": "File uploaded successfully", "job_id": job['_id']}
+
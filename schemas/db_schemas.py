@@ -1,9 +1,8 @@
 # MONGODB SCHEMAS DEFINITION
-from msilib import schema
 from bson import ObjectId
 from pydantic import BaseModel, Field
-from typing import List
-from datetime import date, time
+from typing import Dict, List, Union
+from datetime import date, time, datetime
 
 
 class PyObjectId(ObjectId):
@@ -63,6 +62,24 @@ class MomentListByDateId(BaseModel):
         }
 
 
+class SpriteOffset(BaseModel):
+    image_path: str = Field(...)
+    x: int = Field(...)
+    y: int = Field(...)
+
+
+class DaySprite(BaseModel):
+    """
+    The sprite sheet of the moments of a day, with the offset of every moment in the sheet
+    """
+
+    path: str = Field(...)
+    tile_width: int = Field(...)
+    tile_height: int = Field(...)
+    columns: int = Field(...)
+    offsets: List[SpriteOffset] = Field(default_factory = list)
+
+
 class MomentListByDate(BaseModel):
     """
     The schema definition for the Moment List By Date Model of the system
@@ -70,6 +87,7 @@ class MomentListByDate(BaseModel):
 
     id: MomentListByDateId = Field(alias = '_id')
     moment_list: List[str] = Field(...)
+    sprite: Union[DaySprite, None] = Field(default = None)
 
     class Config:
         allow_population_by_field_name = True
@@ -82,7 +100,17 @@ class MomentListByDate(BaseModel):
                 "moment_list": [
                     "image1",
                     "image2"
-                ]
+                ],
+                "sprite": {
+                    "path": "2020-01-01/sprite.jpg",
+                    "tile_width": 128,
+                    "tile_height": 128,
+                    "columns": 20,
+                    "offsets": [
+                        {"image_path": "image1", "x": 0, "y": 0},
+                        {"image_path": "image2", "x": 128, "y": 0}
+                    ]
+                }
             }
         }
 
@@ -182,6 +210,8 @@ class MomentDetail(MomentMetadata):
 
     # Metadata Information
     id: MomentDetailId = Field(alias = '_id')
+    renditions: Dict[str, str] = Field(default_factory = dict) # Rendition name -> path, e.g. thumbnail, medium, thumbnail_webp
+    features: Dict[str, Union[float, None]] = Field(default_factory = dict) # Derived features, e.g. hrv_rmssd, eda_scr_count
 
     class Config:
         allow_population_by_field_name = True
@@ -192,6 +222,16 @@ class MomentDetail(MomentMetadata):
                     "moment_date": "2020-01-01",
                     "local_time": "10:52:30"
                 },
+                "renditions": {
+                    "thumbnail": "image1.thumbnail.jpg",
+                    "medium": "image1.medium.jpg"
+                },
+                "features": {
+                    "hrv_rmssd": 42.5,
+                    "hrv_sdnn": 51.2,
+                    "eda_tonic_mean": 0.68,
+                    "eda_scr_count": 3
+                },
                 "utc_time": "00:00:00",
                 "image_path": "image1.jpg",
                 "other_image_path": "image2.jpg",
@@ -226,3 +266,108 @@ class MomentDetail(MomentMetadata):
         }
 
 
+class IngestionProgress(BaseModel):
+    files_extracted: int = Field(default = 0)
+    images_new: int = Field(default = 0)
+    images_changed: int = Field(default = 0)
+    images_skipped: int = Field(default = 0) # Already stored unchanged, neither extracted nor inserted
+    images_rendered: int = Field(default = 0)
+    moments_inserted: int = Field(default = 0)
+    moments_skipped: int = Field(default = 0) # Already in the database, e.g. when an archive is uploaded again
+    moments_unparseable: int = Field(default = 0) # Images without a valid timestamp in their name, not inserted
+    unparseable_moments: List[str] = Field(default_factory = list) # The first of them
+    moments_with_signals: int = Field(default = 0) # Moments whose physiological data was computed from the wristband signals
+    feature_days_computed: int = Field(default = 0)
+    feature_days_unchanged: int = Field(default = 0) # Days whose signals and moments did not change since their features were computed
+    errors: int = Field(default = 0)
+
+
+class IngestionJob(BaseModel):
+    """
+    The schema definition for an ingestion job of an uploaded file
+    """
+
+    id: str = Field(alias = '_id')
+    user_id: str = Field(...)
+    file_path: str = Field(...)
+    file_name: str = Field(...)
+    sha256: str = Field(...)
+    size: int = Field(...)
+    status: str = Field(default = 'queued') # queued, running, completed or failed
+    attempts: int = Field(default = 0)
+    worker_id: Union[str, None] = Field(default = None)
+    error: Union[str, None] = Field(default = None)
+    progress: IngestionProgress = Field(default_factory = IngestionProgress)
+    created_at: datetime = Field(...)
+    started_at: Union[datetime, None] = Field(default = None)
+    finished_at: Union[datetime, None] = Field(default = None)
+
+    class Config:
+        allow_population_by_field_name = True
+        schema_extra = {
+            'example': {
+                "id": "0b8e8b5f7a6d4a0f9d0f7b1f6f0c3c11",
+                "user_id": "nvtu",
+                "file_path": "D:/DATA/_staging/tmpa1b2c3.zip",
+                "file_name": "lifelog.zip",
+                "sha256": "9f86d081884c7d659a2feaa0c55ad015a3bf4f1b2b0b822cd15d6c15b0f00a08",
+                "size": 1048576,
+                "status": "running",
+                "attempts": 1,
+                "worker_id": "host-1234",
+                "error": None,
+                "progress": {
+                    "files_extracted": 2000,
+                    "images_new": 1800,
+                    "images_changed": 200,
+                    "images_skipped": 500,
+                    "images_rendered": 2000,
+                    "moments_inserted": 1200,
+                    "moments_skipped": 0,
+                    "moments_unparseable": 1,
+                    "unparseable_moments": ["2020-01-01/lifelog/B00001234_21I6X0_2020010_105230.JPG"],
+                    "moments_with_signals": 1200,
+                    "feature_days_computed": 2,
+                    "feature_days_unchanged": 10,
+                    "errors": 0
+                },
+                "created_at": "2022-09-01T10:00:00",
+                "started_at": "2022-09-01T10:00:02",
+                "finished_at": None
+            }
+        }
+
+
+class UploadSession(BaseModel):
+    """
+    The schema definition for a resumable upload session
+    """
+
+    id: str = Field(alias = '_id')
+    user_id: str = Field(...)
+    file_name: str = Field(...)
+    file_path: str = Field(...)
+    size: int = Field(...)
+    sha256: Union[str, None] = Field(default = None) # Checked on finalization if given
+    status: str = Field(default = 'open') # open, finalizing, finalized or abandoned
+    received: List[List[int]] = Field(default_factory = list) # [start, end) byte ranges
+    created_at: datetime = Field(...)
+    updated_at: datetime = Field(...)
+
+    class Config:
+        allow_population_by_field_name = True
+        schema_extra = {
+            'example': {
+                "id": "5c1d8e7e0f2b4c3a9e6d5f4a3b2c1d0e",
+                "user_id": "nvtu",
+                "file_name": "lifelog.zip",
+                "file_path": "D:/DATA/_staging/5c1d8e7e0f2b4c3a9e6d5f4a3b2c1d0e.part",
+                "size": 134217728,
+                "sha256": None,
+                "status": "open",
+                "received": [[0, 67108864]],
+                "created_at": "2022-09-01T10:00:00",
+                "updated_at": "2022-09-01T10:05:00"
+            }
+        }
+
@@ -2,13 +2,14 @@ from multiprocessing import allow_connection_pickling
 from tkinter import filedialog
 from pydantic import BaseModel, Field
 from datetime import date, time
-from typing import Union, List
+from typing import Dict, Union, List
 from schemas.db_schemas import (
     PhysiologicalData, 
     MomentDetailId,
     MomentDetail,
     MomentMetadata,
 )
+from constants.annotation_configuration import MOMENT_DETAIL_MAX_BATCH_IDS
 
 
 class RequestModifyListDates(BaseModel):
@@ -68,6 +69,26 @@ class RequestMomentDetailById(BaseModel):
         }
 
 
+class RequestMomentDetailBatch(BaseModel):
+    ids: List[RequestMomentDetailById] = Field(..., max_items = MOMENT_DETAIL_MAX_BATCH_IDS)
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "ids": [
+                    {
+                        "moment_date": "2020-01-01",
+                        "moment_time": "10:52:30"
+                    },
+                    {
+                        "moment_date": "2020-01-01",
+                        "moment_time": "10:53:00"
+                    }
+                ]
+            }
+        }
+
+
 class RequestInsertMomentDetail(MomentMetadata):
     id: RequestMomentDetailById = Field(...)
 
@@ -138,6 +159,30 @@ class RequestUpdateMomentDetail(BaseModel):
         }
 
 
+class RequestBulkUpdateMomentDetail(BaseModel):
+    values: Dict[str, str] = Field(...) # Annotation field -> value, e.g. location, stress_level, activity
+    # Either the ids of the moment details, or a range of dates with optional times of the day
+    ids: Union[List[RequestMomentDetailById], None] = Field(default = None, max_items = MOMENT_DETAIL_MAX_BATCH_IDS)
+    start_date: Union[date, None] = Field(default = None)
+    end_date: Union[date, None] = Field(default = None)
+    start_time: Union[time, None] = Field(default = None)
+    end_time: Union[time, None] = Field(default = None)
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "values": {
+                    "activity": "commuting",
+                    "stress_level": "high"
+                },
+                "start_date": "2020-01-01",
+                "end_date": "2020-01-01",
+                "start_time": "08:10:00",
+                "end_time": "08:55:00"
+            }
+        }
+
+
 class RequestUserCreate(BaseModel):
     username: str = Field(...)
     name: str = Field(...)
@@ -153,6 +198,28 @@ class RequestUserCreate(BaseModel):
         }
 
 
+class RequestBulkUserCreate(BaseModel):
+    users: List[RequestUserCreate] = Field(...)
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "users": [
+                    {
+                        "username": "nvtu",
+                        "name": "Ninh Van Tu",
+                        "password": "123456"
+                    },
+                    {
+                        "username": "participant01",
+                        "name": "Participant 01",
+                        "password": "654321"
+                    }
+                ]
+            }
+        }
+
+
 class RequestGetAnnotationList(BaseModel):
     list_type: str = Field(...)
 
@@ -190,4 +257,31 @@ class RequestInsertDefaultAnnotationData(BaseModel):
                 "stress_level_list": ["Relax", "Low", "Medium", "High"],
                 "activity_list": ['Sitting', 'Walking', 'Running', 'Standing', 'Cycling', 'Driving', 'Riding', 'Hiking', 'Swimming', 'Biking']
             }
-        }
\ No newline at end of file
+        }
+
+
+class RequestRefreshToken(BaseModel):
+    refresh_token: str = Field(...)
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "refresh_token": "eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9..."
+            }
+        }
+
+
+class RequestCreateUploadSession(BaseModel):
+    file_name: str = Field(...)
+    size: int = Field(..., gt = 0)
+    sha256: Union[str, None] = Field(default = None)
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "file_name": "lifelog.zip",
+                "size": 134217728,
+                "sha256": "9f86d081884c7d659a2feaa0c55ad015a3bf4f1b2b0b822cd15d6c15b0f00a08"
+            }
+        }
+
@@ -1,6 +1,8 @@
 from pydantic import BaseModel
 from datetime import date
-from typing import List
+from typing import List, Union
+from schemas.security_schemas import User
+from schemas.db_schemas import MomentDetail
 
 
 class ResponseListDates(BaseModel):
@@ -46,4 +48,103 @@ class ResponseListStringValue(BaseModel):
                     'Home'
                 ]
             }
-        }
\ No newline at end of file
+        }
+
+
+class ResponseUserConflict(BaseModel):
+    row: int
+    username: str
+    detail: str
+
+
+class ResponseBulkUserCreate(BaseModel):
+    created: List[str]
+    conflicts: List[ResponseUserConflict]
+    incomplete: List[str] = [] # Created users whose lifelog documents could not be created
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "created": [
+                    "participant01"
+                ],
+                "conflicts": [
+                    {
+                        "row": 0,
+                        "username": "nvtu",
+                        "detail": "User already registered"
+                    }
+                ],
+                "incomplete": []
+            }
+        }
+
+
+class ResponseUserPage(BaseModel):
+    users: List[User]
+    next_cursor: Union[str, None] = None
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "users": [
+                    {
+                        "username": "nvtu",
+                        "name": "Van-Tu Ninh"
+                    }
+                ],
+                "next_cursor": "WyJudnR1Il0="
+            }
+        }
+
+
+class ResponseSignal(BaseModel):
+    signal: str
+    method: str
+    timestamps: List[float] # UTC unix seconds
+    values: List[float]
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "signal": "eda",
+                "method": "minmax",
+                "timestamps": [
+                    1577875950.0,
+                    1577875950.25
+                ],
+                "values": [
+                    0.312,
+                    0.318
+                ]
+            }
+        }
+
+
+class ResponseMomentDetailBatch(BaseModel):
+    moment_details: List[Union[MomentDetail, None]] # In the order of the requested ids, null if not found
+    missing: int
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "moment_details": [
+                    MomentDetail.Config.schema_extra['example'],
+                    None
+                ],
+                "missing": 1
+            }
+        }
+
+
+class ResponseBulkUpdate(BaseModel):
+    matched: int
+    modified: int
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "matched": 90,
+                "modified": 88
+            }
+        }
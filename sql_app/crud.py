@@ -1,4 +1,7 @@
+from typing import Dict, List, Union
+from sqlalchemy import select
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from internal.security.hash_generator import HashGenerator
 from schemas.request_schemas import RequestUserCreate
 from constants.security_settings import PASSWORD_HASH_ALGORITHM
@@ -23,13 +26,67 @@ def get_users(db: Session, skip: int = 0, limit: int = 100):
     return db.query(ORMUser).offset(skip).limit(limit).all()
 
 
+def filter_users_by_page(query, after_username: Union[str, None] = None, prefix: Union[str, None] = None):
+    if after_username is not None:
+        query = query.filter(ORMUser.username > after_username)
+    if prefix:
+        # A range instead of LIKE so that the username index is used
+        query = query.filter(ORMUser.username >= prefix, ORMUser.username < prefix + '\U0010ffff')
+    return query.order_by(ORMUser.username)
+
+
+def get_users_page(db: Session, limit: int = 100, after_username: Union[str, None] = None, prefix: Union[str, None] = None):
+    """
+    Get the users sorted by username which come after after_username (keyset pagination).
+    NOTE: One more user than limit is fetched so that the caller knows whether there is a next page.
+    """
+    query = filter_users_by_page(db.query(ORMUser), after_username, prefix)
+    return query.limit(limit + 1).all()
+
+
+def iterate_users(db: Session, prefix: Union[str, None] = None, batch_size: int = 1000):
+    """
+    Yield every user sorted by username, fetching them batch by batch with keyset pagination.
+    """
+    after_username = None
+    while True:
+        users = filter_users_by_page(db.query(ORMUser), after_username, prefix).limit(batch_size).all()
+        yield from users
+        if len(users) < batch_size:
+            return
+        after_username = users[-1].username
+        db.expunge_all() # Do not keep every user of the table in the identity map
+
+
 def get_user_expiration_time(db: Session, username: str):
     return db.query(ORMExpirationTime).filter(ORMExpirationTime.username == username).first()
 
 
-def create_user(db: Session, user: RequestUserCreate):
-    hash_machine = HashGenerator(PASSWORD_HASH_ALGORITHM)
-    hashed_password = hash_machine.hash_string(user.password)
+def select_user_session_info(username: str):
+    return select(ORMUser.username, ORMExpirationTime.iat, ORMExpirationTime.exp) \
+        .join(ORMExpirationTime, ORMExpirationTime.username == ORMUser.username) \
+        .where(ORMUser.username == username)
+
+
+def get_user_session_info(db: Session, username: str):
+    """
+    Get the user together with the issue and expiration time of its current token in one query.
+    NOTE: Returns None if the user does not exist or has never been issued a token.
+    """
+    return db.execute(select_user_session_info(username)).first()
+
+
+async def async_get_user_session_info(db: AsyncSession, username: str):
+    """
+    Same as get_user_session_info but through the async engine.
+    """
+    result = await db.execute(select_user_session_info(username))
+    return result.first()
+
+
+def create_user(db: Session, user: RequestUserCreate, hashed_password: Union[str, None] = None):
+    if hashed_password is None:
+        hashed_password = HashGenerator(PASSWORD_HASH_ALGORITHM).hash_string(user.password)
 
     # Add user's secret data to database
     db_user = ORMUserInDB(username = user.username, hashed_password = hashed_password)
@@ -46,6 +103,37 @@ def create_user(db: Session, user: RequestUserCreate):
     return db_user
 
 
+def get_existing_usernames(db: Session, usernames: List[str], chunk_size: int = 500) -> List[str]:
+    """
+    Get the usernames which are already registered among the given ones.
+    NOTE: The lookup is chunked to stay below the SQLite limit of bound parameters.
+    """
+    existing_usernames = []
+    for i in range(0, len(usernames), chunk_size):
+        chunk = usernames[i:i + chunk_size]
+        rows = db.query(ORMUserInDB.username).filter(ORMUserInDB.username.in_(chunk)).all()
+        existing_usernames += [row.username for row in rows]
+    return existing_usernames
+
+
+def create_users_bulk(db: Session, users: List[Dict[str, str]]) -> None:
+    """
+    Insert many users into both user tables in a single transaction.
+    NOTE: Each user is a dict with username, name and hashed_password. Nothing is inserted if any insert fails.
+    """
+    try:
+        db.bulk_insert_mappings(ORMUserInDB, [
+            { 'username': user['username'], 'hashed_password': user['hashed_password'] } for user in users
+        ])
+        db.bulk_insert_mappings(ORMUser, [
+            { 'username': user['username'], 'name': user['name'] } for user in users
+        ])
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+
 def create_user_in_expiration_time(db: Session, username: str , exp: int, iat: int):
     db_user = ORMExpirationTime(username = username, exp = exp, iat = iat)
     db.add(db_user)
@@ -63,3 +151,10 @@ def update_user_expiration_time_info(db: Session, username: str, exp: int, iat:
     db.refresh(db_user)
 
     return db_user
+
+
+def upsert_user_expiration_time(db: Session, username: str, exp: int, iat: int):
+    db_user = db.merge(ORMExpirationTime(username = username, exp = exp, iat = iat))
+    db.commit()
+
+    return db_user
@@ -6,4 +6,5 @@ def get_sqldb_session():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
@@ -0,0 +1,5 @@
+import sentry_sdk
+
+
+# connectors initialises Sentry with the DSN of the server, the tests must not report to it
+sentry_sdk.init = lambda *args, **kwargs: None
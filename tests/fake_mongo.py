@@ -0,0 +1,94 @@
+import operator
+from types import SimpleNamespace
+from typing import List
+from internal.db.moment_detail_write_buffer import apply_fields
+
+
+OPERATORS = {'$gt': operator.gt, '$gte': operator.ge, '$lt': operator.lt, '$lte': operator.le,
+             '$in': lambda value, operand: value in operand}
+
+
+def matches(document: dict, query: dict) -> bool:
+    # The subset of the query language used on moment details: equality, $or, $and, $in and the range operators
+    for field, condition in query.items():
+        if field == '$or':
+            if not any(matches(document, subquery) for subquery in condition):
+                return False
+        elif field == '$and':
+            if not all(matches(document, subquery) for subquery in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = document.get(field)
+            if value is None or not all(OPERATORS[name](value, operand) for name, operand in condition.items()):
+                return False
+        elif document.get(field) != condition:
+            return False
+    return True
+
+
+class FakeCollection:
+    """
+    In-memory collection of moment details keyed by their flattened key, which records the calls of every method.
+    NOTE: fail is the number of next calls to bulk_write and find_one_and_update which raise, as if Mongo was down.
+    """
+
+    def __init__(self, documents: List[dict]):
+        self.documents = {self.__key(document): dict(document) for document in documents}
+        self.calls = []
+        self.fail = 0
+
+
+    async def find_one(self, query: dict):
+        self.calls.append('find_one')
+        document = self.documents.get(self.__key(query))
+        return dict(document) if document is not None else None
+
+
+    async def find_one_and_update(self, query: dict, update: dict, return_document = None):
+        self.calls.append('find_one_and_update')
+        self.__maybe_fail()
+        document = self.documents.get(self.__key(query))
+        if document is None:
+            return None
+        apply_fields(document, update['$set'])
+        return dict(document)
+
+
+    async def bulk_write(self, requests: list, ordered: bool = True):
+        self.calls.append('bulk_write')
+        self.__maybe_fail()
+        matched, upserted = 0, 0
+        for request in requests:
+            key = self.__key(request._filter)
+            document = self.documents.get(key)
+            if document is not None:
+                matched += 1
+                apply_fields(document, request._doc.get('$set', {}))
+            elif request._upsert:
+                upserted += 1
+                self.documents[key] = document = dict(request._filter)
+                apply_fields(document, {**request._doc.get('$setOnInsert', {}), **request._doc.get('$set', {})})
+        return SimpleNamespace(matched_count = matched, upserted_count = upserted)
+
+
+    async def update_many(self, query: dict, update: dict):
+        self.calls.append('update_many')
+        matched = [document for document in self.documents.values() if matches(document, query)]
+        for document in matched:
+            apply_fields(document, update['$set'])
+        return SimpleNamespace(matched_count = len(matched), modified_count = len(matched))
+
+
+    async def update_one(self, query: dict, update: dict, upsert: bool = False):
+        self.calls.append('update_one')
+        return SimpleNamespace(matched_count = 1, modified_count = 1)
+
+
+    def __maybe_fail(self) -> None:
+        if self.fail:
+            self.fail -= 1
+            raise ConnectionError('Mongo is down')
+
+
+    def __key(self, document: dict) -> tuple:
+        return document['user_id'], document['moment_date'], document['local_time']
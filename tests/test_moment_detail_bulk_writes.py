@@ -0,0 +1,94 @@
+import asyncio
+import pytest
+from internal.db import annotation_list_crud, moment_detail_annotation_crud
+from internal.db.moment_detail_annotation_crud import get_moment_detail_key, set_moment_details, upsert_moment_details
+from routers.annotation.moments import update_moment_details
+from schemas.request_schemas import RequestBulkUpdateMomentDetail
+from tests.fake_mongo import FakeCollection
+
+
+USER_ID = 'user'
+DATES = ['2020-01-01', '2020-01-02']
+MOMENTS_PER_DATE = 180 # One every 20 seconds from 08:00 to 09:00
+LOCAL_TIMES = [f'{8 + i * 20 // 3600:02d}:{i * 20 // 60 % 60:02d}:{i * 20 % 60:02d}' for i in range(MOMENTS_PER_DATE)]
+
+
+def get_moment_detail(moment_date: str, local_time: str, **fields) -> dict:
+    # An encoded moment detail, with its embedded _id and its flattened key
+    moment_id = {'user_id': USER_ID, 'date': moment_date, 'local_time': local_time}
+    return {'_id': moment_id, **get_moment_detail_key(moment_id), **fields}
+
+
+@pytest.fixture
+def collections(monkeypatch):
+    moment_detail = FakeCollection([
+        get_moment_detail(moment_date, local_time, location = None) for moment_date in DATES for local_time in LOCAL_TIMES
+    ])
+    annotation_data_list = FakeCollection([])
+    monkeypatch.setattr(moment_detail_annotation_crud, 'db', {'moment_detail': moment_detail})
+    monkeypatch.setattr(annotation_list_crud, 'db', {'annotation_data_list': annotation_data_list})
+    return moment_detail, annotation_data_list
+
+
+def test_update_moment_details_by_range_is_one_update_many(collections):
+    moment_detail, annotation_data_list = collections
+    request = RequestBulkUpdateMomentDetail(values = {'location': 'dcu'}, start_date = DATES[0], end_date = DATES[1],
+                                            start_time = '08:10:00', end_time = '08:55:00')
+    result = asyncio.run(update_moment_details(request, user_id = USER_ID))
+
+    assert moment_detail.calls == ['update_many']
+    assert annotation_data_list.calls == ['update_one']
+    assert result['matched'] == 2 * (45 * 3 + 1)
+    assert sum(document['location'] == 'dcu' for document in moment_detail.documents.values()) == result['matched']
+
+
+def test_update_moment_details_by_ids_is_one_update_many(collections):
+    moment_detail, annotation_data_list = collections
+    ids = [{'moment_date': moment_date, 'local_time': local_time} for moment_date in DATES for local_time in LOCAL_TIMES[::2]]
+    request = RequestBulkUpdateMomentDetail(values = {'stress_level': 'low'}, ids = ids)
+    result = asyncio.run(update_moment_details(request, user_id = USER_ID))
+
+    assert moment_detail.calls == ['update_many']
+    assert annotation_data_list.calls == ['update_one']
+    assert result['matched'] == len(ids)
+    assert sum(document.get('stress_level') == 'low' for document in moment_detail.documents.values()) == len(ids)
+
+
+def test_upsert_moment_details_is_one_bulk_write_per_batch(collections):
+    moment_detail, _ = collections
+    new_date = '2020-01-03'
+    moment_details = [get_moment_detail(moment_date, local_time, location = None)
+                      for moment_date in [DATES[1], new_date] for local_time in LOCAL_TIMES]
+    counters = asyncio.run(upsert_moment_details(moment_details, batch_size = 100))
+
+    assert moment_detail.calls == ['bulk_write'] * 4
+    assert counters == {'inserted': MOMENTS_PER_DATE, 'existing': MOMENTS_PER_DATE, 'errors': 0}
+
+
+def test_set_moment_details_is_one_bulk_write_per_batch(collections):
+    moment_detail, _ = collections
+    moment_details = [{'_id': {'user_id': USER_ID, 'date': DATES[0], 'local_time': local_time}, 'heart_rate': i}
+                      for i, local_time in enumerate(LOCAL_TIMES)]
+    counters = asyncio.run(set_moment_details(moment_details, batch_size = 100))
+
+    assert moment_detail.calls == ['bulk_write'] * 2
+    assert counters == {'matched': MOMENTS_PER_DATE, 'errors': 0}
+
+
+def test_upsert_moment_details_sets_the_renditions_of_existing_moment_details(collections):
+    moment_detail, _ = collections
+    new_date = '2020-01-03'
+    renditions = {'thumbnail': 'thumbnail.jpg', 'medium': 'medium.jpg'}
+    moment_details = [get_moment_detail(DATES[0], LOCAL_TIMES[0], location = 'home', renditions = renditions),
+                      get_moment_detail(DATES[0], LOCAL_TIMES[1], location = 'home', renditions = {}),
+                      get_moment_detail(new_date, LOCAL_TIMES[0], location = None, renditions = renditions)]
+    moment_detail.documents[(USER_ID, DATES[0], LOCAL_TIMES[0])]['renditions'] = {'thumbnail': 'old.jpg', 'sprite': 'sprite.jpg'}
+    counters = asyncio.run(upsert_moment_details(moment_details))
+
+    assert moment_detail.calls == ['bulk_write']
+    assert counters == {'inserted': 1, 'existing': 2, 'errors': 0}
+    changed = moment_detail.documents[(USER_ID, DATES[0], LOCAL_TIMES[0])]
+    assert changed['renditions'] == {**renditions, 'sprite': 'sprite.jpg'}
+    assert changed['location'] is None # Annotations are never overwritten
+    assert 'renditions' not in moment_detail.documents[(USER_ID, DATES[0], LOCAL_TIMES[1])]
+    assert moment_detail.documents[(USER_ID, new_date, LOCAL_TIMES[0])]['renditions'] == renditions
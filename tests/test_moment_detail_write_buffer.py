@@ -0,0 +1,99 @@
+import asyncio
+import pytest
+from internal.db import moment_detail_write_buffer as write_buffer
+from internal.db.moment_detail_write_buffer import MomentDetailWriteBuffer
+from tests.fake_mongo import FakeCollection
+
+
+KEYS = [{"user_id": "user", "moment_date": "2020-01-01", "local_time": f"10:00:0{i}"} for i in range(3)]
+
+
+@pytest.fixture
+def collection(monkeypatch):
+    collection = FakeCollection([dict(key, stress = None) for key in KEYS])
+    monkeypatch.setattr(write_buffer, 'db', {'moment_detail': collection})
+    return collection
+
+
+async def buffered_update(buffer: MomentDetailWriteBuffer, collection: FakeCollection, key: dict, fields: dict):
+    # The buffered branch of update_moment_detail
+    if buffer.retrying:
+        async def write(fields: dict):
+            return await collection.find_one_and_update(key, {"$set": fields})
+        return await buffer.write_through(key, fields, write)
+    moment_detail = None
+    if buffer.get(key) is None:
+        moment_detail = await collection.find_one(key)
+    return await buffer.update(key, fields, moment_detail)
+
+
+def test_burst_of_updates_costs_one_read_and_one_write(collection):
+    async def run():
+        buffer = MomentDetailWriteBuffer(enabled = True, window_seconds = 0.01)
+        for value in range(100):
+            moment_detail = await buffered_update(buffer, collection, KEYS[0], {"stress": value})
+            assert moment_detail['stress'] == value
+        await asyncio.sleep(0.05)
+        return buffer
+
+    buffer = asyncio.run(run())
+    assert collection.calls == ['find_one', 'bulk_write']
+    assert collection.documents[tuple(KEYS[0].values())]['stress'] == 99
+    assert buffer.stats()['writes'] == 1
+
+
+def test_failed_flushes_back_off_and_updates_are_written_through(collection):
+    async def run():
+        buffer = MomentDetailWriteBuffer(enabled = True, window_seconds = 0.01, retry_seconds = 0.1)
+        collection.fail = 3
+        await buffered_update(buffer, collection, KEYS[0], {"stress": 1})
+        await asyncio.sleep(0.05) # The first flush fails
+        assert buffer.retrying
+        # Refused by Mongo while it is down, so not acknowledged, and the buffered write is kept
+        with pytest.raises(ConnectionError):
+            await buffered_update(buffer, collection, KEYS[1], {"stress": 2})
+        await asyncio.sleep(0.2) # The retry after 0.1 s fails again
+        assert collection.calls.count('bulk_write') == 2
+        await asyncio.sleep(0.3) # And the next one after 0.2 s succeeds
+        assert not buffer.retrying
+        await buffered_update(buffer, collection, KEYS[2], {"stress": 3})
+        await buffer.close()
+        return buffer
+
+    buffer = asyncio.run(run())
+    assert [collection.documents[tuple(key.values())]['stress'] for key in KEYS] == [1, None, 3]
+    assert buffer.stats()['dropped'] == 0
+
+
+def test_write_through_merges_the_failed_writes_of_the_moment(collection):
+    async def run():
+        buffer = MomentDetailWriteBuffer(enabled = True, window_seconds = 0.01, retry_seconds = 10)
+        collection.fail = 1
+        await buffered_update(buffer, collection, KEYS[0], {"stress": 1, "note": "a"})
+        await asyncio.sleep(0.05)
+        assert buffer.retrying
+        moment_detail = await buffered_update(buffer, collection, KEYS[0], {"stress": 2})
+        assert not buffer.retrying
+        await buffer.close()
+        return moment_detail
+
+    moment_detail = asyncio.run(run())
+    assert moment_detail['stress'] == 2 and moment_detail['note'] == 'a'
+    assert collection.calls.count('bulk_write') == 1
+
+
+def test_writes_are_reported_after_the_retry_timeout(collection, monkeypatch):
+    reported = []
+    monkeypatch.setattr(write_buffer.sentry_sdk, 'capture_message', lambda message, **kwargs: reported.append(message))
+    monkeypatch.setattr(write_buffer.sentry_sdk, 'capture_exception', lambda e: None)
+
+    async def run():
+        buffer = MomentDetailWriteBuffer(enabled = True, window_seconds = 0.01, retry_seconds = 0.01, retry_timeout_seconds = 0.05)
+        collection.fail = 100
+        await buffered_update(buffer, collection, KEYS[0], {"stress": 1})
+        await asyncio.sleep(0.5)
+        return buffer
+
+    buffer = asyncio.run(run())
+    assert not buffer.retrying and buffer.stats()['pending'] == 0
+    assert buffer.stats()['dropped'] == 1 and len(reported) == 1
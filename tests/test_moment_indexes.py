@@ -0,0 +1,104 @@
+import asyncio
+import pytest
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import PyMongoError
+from constants.external_servers import MONGODB_URL
+from internal.db import moment_annotation_crud, moment_detail_annotation_crud
+from internal.db.moment_annotation_crud import get_moments_key
+from internal.db.moment_detail_annotation_crud import (
+    find_moment_details,
+    get_moment_detail_key,
+    get_moment_detail_ids_query,
+    get_moment_detail_range_query,
+)
+
+
+TEST_DATABASE = 'stress_lifelog_test'
+MOMENT_DETAIL_INDEX = 'user_id_1_moment_date_1_local_time_1'
+MOMENTS_INDEX = 'user_id_1_moment_date_1'
+
+
+def get_plan_stages(plan: dict) -> list:
+    # Stages of a winning plan, from the root to the leaves
+    plan = plan.get('queryPlan', plan) # Plans of the slot-based engine are wrapped
+    stages = [(plan['stage'], plan.get('indexName'))]
+    for child in [plan.get('inputStage')] + plan.get('inputStages', []):
+        if child is not None:
+            stages.extend(get_plan_stages(child))
+    return stages
+
+
+def explain_with_test_database(explain):
+    """
+    Run explain(database) on a test database with the indexes of the server and a few documents, after pointing the
+    CRUD helpers at it. Skipped if no MongoDB server is reachable at MONGODB_URL.
+    """
+    async def run():
+        client = AsyncIOMotorClient(MONGODB_URL, serverSelectionTimeoutMS = 1000)
+        try:
+            await client.admin.command('ping')
+        except PyMongoError:
+            pytest.skip(f'No MongoDB server at {MONGODB_URL}')
+        database = client[TEST_DATABASE]
+        moment_annotation_crud.db = moment_detail_annotation_crud.db = database
+        try:
+            await database['moment_detail'].drop()
+            await database['moments'].drop()
+            await moment_detail_annotation_crud.create_moment_detail_indexes()
+            await moment_annotation_crud.create_moments_indexes()
+            await database['moment_detail'].insert_many([
+                {"user_id": user_id, "moment_date": f"2020-01-0{day}", "local_time": f"10:00:{second:02d}"}
+                for user_id in ['nvtu', 'other'] for day in range(1, 4) for second in range(60)
+            ])
+            await database['moments'].insert_many([
+                {"user_id": user_id, "moment_date": f"2020-01-0{day}", "moment_list": []}
+                for user_id in ['nvtu', 'other'] for day in range(1, 4)
+            ])
+            return await explain(database)
+        finally:
+            await client.drop_database(TEST_DATABASE)
+            client.close()
+
+    return asyncio.run(run())
+
+
+@pytest.fixture(autouse = True)
+def restore_crud_databases():
+    databases = moment_annotation_crud.db, moment_detail_annotation_crud.db
+    yield
+    moment_annotation_crud.db, moment_detail_annotation_crud.db = databases
+
+
+@pytest.mark.parametrize('query', [
+    get_moment_detail_key({"user_id": "nvtu", "date": "2020-01-02", "local_time": "10:00:30"}),
+    get_moment_detail_range_query("nvtu", "2020-01-01", "2020-01-02"),
+    get_moment_detail_range_query("nvtu", "2020-01-01", "2020-01-03", "10:00:10", "10:00:20"),
+    get_moment_detail_ids_query("nvtu", [("2020-01-01", "10:00:01"), ("2020-01-03", "10:00:02"), ("2020-01-03", "10:00:03")]),
+    get_moment_detail_ids_query("nvtu", [("2020-01-02", "10:00:01")]),
+])
+def test_moment_detail_queries_use_the_flattened_key_index(query):
+    async def explain(database):
+        return await database['moment_detail'].find(query).explain()
+
+    stages = get_plan_stages(explain_with_test_database(explain)['queryPlanner']['winningPlan'])
+    assert ('IXSCAN', MOMENT_DETAIL_INDEX) in stages
+    assert 'COLLSCAN' not in [stage for stage, _ in stages]
+
+
+def test_paged_moment_detail_range_is_sorted_by_the_index():
+    async def explain(database):
+        return await find_moment_details(
+            "nvtu", "2020-01-01", "2020-01-03", after = ("2020-01-02", "10:00:30"), fields = ["stress"], limit = 10
+        ).explain()
+
+    stages = get_plan_stages(explain_with_test_database(explain)['queryPlanner']['winningPlan'])
+    assert ('IXSCAN', MOMENT_DETAIL_INDEX) in stages
+    assert not {'COLLSCAN', 'SORT'} & {stage for stage, _ in stages}
+
+
+def test_moments_queries_use_the_flattened_key_index():
+    async def explain(database):
+        return await database['moments'].find(get_moments_key({"user_id": "nvtu", "moment_date": "2020-01-02"})).explain()
+
+    stages = get_plan_stages(explain_with_test_database(explain)['queryPlanner']['winningPlan'])
+    assert ('IXSCAN', MOMENTS_INDEX) in stages
@@ -0,0 +1,39 @@
+import asyncio
+from datetime import date
+import pytest
+from fastapi import HTTPException
+from internal.pagination import encode_cursor
+from routers.annotation import moments
+from routers.users import users
+
+
+@pytest.mark.parametrize('values', [
+    [{"$gt": ""}, "10:00:00"],
+    ["2020-01-01", {"$gt": ""}],
+    ["2020-1-1", "10:00:00"],
+    ["2020-01-01", "25:00:00"],
+    ["2020-01-01", 36000],
+    ["2020-01-01"],
+])
+def test_moment_details_cursor_must_be_a_date_and_a_time(monkeypatch, values):
+    monkeypatch.setattr(moments, 'find_moment_details', lambda *args: pytest.fail('Queried with an invalid cursor'))
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(moments.get_moment_details_by_range(date(2020, 1, 1), date(2020, 1, 2), cursor = encode_cursor(values),
+                                                        user_id = 'user'))
+    assert error.value.status_code == 400
+
+
+def test_moment_details_cursor_is_the_key_of_the_last_moment_detail(monkeypatch):
+    queries = []
+    monkeypatch.setattr(moments, 'find_moment_details', lambda *args: queries.append(args) or [])
+    _ = asyncio.run(moments.get_moment_details_by_range(date(2020, 1, 1), date(2020, 1, 2),
+                                                        cursor = encode_cursor(["2020-01-01", "10:00:00"]), user_id = 'user'))
+    assert queries[0][5] == ("2020-01-01", "10:00:00")
+
+
+@pytest.mark.parametrize('values', [[{"$gt": ""}], [1], [None], ["user0", "user1"]])
+def test_users_cursor_must_be_a_username(monkeypatch, values):
+    monkeypatch.setattr(users.crud, 'get_users_page', lambda *args, **kwargs: pytest.fail('Queried with an invalid cursor'))
+    with pytest.raises(HTTPException) as error:
+        users.read_users(cursor = encode_cursor(values), db = None)
+    assert error.value.status_code == 400
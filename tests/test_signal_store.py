@@ -0,0 +1,48 @@
+import os
+import numpy as np
+from internal.signals import store
+from internal.signals.e4 import Signal
+
+
+DATE = '2020-01-01'
+START, _ = store.get_local_day_bounds(DATE)
+
+
+def make_signal(seconds: list, value: float) -> Signal:
+    return Signal(START + np.array(seconds, dtype = float), np.full(len(seconds), value))
+
+
+def test_save_signal_day_does_not_memory_map_the_merged_day(tmp_path, monkeypatch):
+    store.save_signal_day(str(tmp_path), DATE, 'eda', make_signal([0, 1], 1.0))
+    load = np.load
+    modes = []
+    monkeypatch.setattr(store.np, 'load', lambda *args, **kwargs: modes.append(kwargs.get('mmap_mode')) or load(*args, **kwargs))
+    store.save_signal_day(str(tmp_path), DATE, 'eda', make_signal([1, 2], 2.0))
+    assert modes == [None]
+
+
+def test_resave_signal_day_while_a_reader_holds_it(tmp_path, monkeypatch):
+    user_data_path = str(tmp_path)
+    store.save_signal_day(user_data_path, DATE, 'eda', make_signal([0, 1, 2], 1.0))
+    reader = store.get_signal_window_slices(user_data_path, 'eda', START, START + 10)
+    assert isinstance(reader[0].values.base, np.memmap)
+
+    # Windows refuses to replace a file while it is memory-mapped, until the reader lets it go
+    replace = os.replace
+    attempts = []
+    def replace_while_mapped(src, dst):
+        attempts.append(dst)
+        if len(attempts) < 3:
+            raise PermissionError(13, 'The process cannot access the file because it is being used by another process', dst)
+        replace(src, dst)
+    monkeypatch.setattr(store.os, 'replace', replace_while_mapped)
+    monkeypatch.setattr(store, 'SIGNAL_REPLACE_RETRY_SECONDS', 0)
+
+    store.save_signal_day(user_data_path, DATE, 'eda', make_signal([2, 3], 2.0))
+
+    assert len(attempts) == 3
+    assert list(reader[0].values) == [1.0, 1.0, 1.0]
+    saved = store.load_signal_window(user_data_path, 'eda', START, START + 10)
+    assert list(saved.timestamps - START) == [0, 1, 2, 3]
+    assert list(saved.values) == [1.0, 1.0, 2.0, 2.0]
+    assert not os.path.exists(f'{store.get_signal_day_path(user_data_path, DATE, "eda")}.tmp')